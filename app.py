@@ -1,22 +1,29 @@
 from flask import Flask, render_template, request, jsonify, send_from_directory, redirect, url_for
 from picarx import Picarx
 from vilib import Vilib
+from vilib import web as vilib_web
+from jobs import JobQueue
+from archive import Archive
 import os 
 import getpass # 사용자 계정 추출용 추가
 from time import strftime, localtime, sleep
 import sqlite3
-import subprocess
 import threading
 import time
 
 app = Flask(__name__)
+# vilib 스트리밍 라우트(/vilib/mjpg, /vilib/ws 등)를 같은 서버에 탑재 (9000번 포트 서버 없음)
+app.register_blueprint(vilib_web.blueprint, url_prefix='/vilib')
 px = Picarx()
 
 # --- 전역 변수 및 설정 ---
-audio_proc = None
+event_path = None  # 녹화 중인 파일
+preroll_armed = False  # 프리롤 대기 켜짐 여부 (녹화 시작 전부터 직전 몇 초를 보관)
+rec_lock = threading.Lock()  # 녹화 켜기/끄기 요청이 동시에 인코더를 바꾸지 않도록
 current_pan = 0
 current_tilt = 0
 auto_mode = False  # 스마트 모드 활성화 여부
+sensor_lock = threading.Lock()  # 자율 주행 스레드와 텔레메트리가 센서를 동시에 읽지 않도록
 
 # [수정] 사용자 아이디를 자동으로 추출하여 경로 설정
 USER_ID = getpass.getuser()
@@ -37,10 +44,24 @@ px.set_cliff_reference([200, 200, 200])
 # 카메라 초기화 (1080p 설정)
 try:
     Vilib.camera_start(vflip=False, hflip=False, size=(1920, 1080))
-    Vilib.display(local=False, web=True)
+    Vilib.display(local=False, web=True, server='mounted')
 except Exception as e:
     print(f"카메라 연결 오류: {e}")
 
+# H.264 HLS 라이브 스트림 (MJPEG 대비 대역폭 약 1/10, 세그먼트는 tmpfs에만 저장)
+# /live 페이지를 열 때 시작하고, 플레이리스트 요청이 HLS_IDLE_TIME 초 동안 없으면 정지 (보는 사람이 없으면 인코딩 안 함)
+HLS_IDLE_TIME = 60
+hls_last_access = 0
+
+def hls_idle_loop():
+    while True:
+        sleep(10)
+        if Vilib.hls is not None and time.time() - hls_last_access > HLS_IDLE_TIME:
+            Vilib.hls_switch(False)
+            print("HLS 스트림 정지 (시청자 없음)")
+
+threading.Thread(target=hls_idle_loop, daemon=True).start()
+
 # DB 초기화
 def init_db():
     conn = sqlite3.connect('picarx.db')
@@ -59,6 +80,62 @@ def init_db():
 
 init_db()
 
+# 녹화 후처리 작업 큐 (picarx.db 의 jobs 테이블, 낮은 우선순위 작업자 스레드)
+jobs = JobQueue('picarx.db')
+jobs.start()
+
+# --- 녹화 인코더 ---
+# 루프 녹화, 프리롤 녹화, 수동 녹화가 H.264/AAC 인코더 하나를 함께 사용 (같은 프레임을 두 번 인코딩하지 않음)
+# 켜진 녹화가 있을 때만 인코더와 오디오 장치(ALSA)를 열고, 모두 꺼지면 닫음 (부팅 시에는 아무것도 켜지 않음)
+REC_ENCODER = dict(fps=30, size=(1920, 1080), bitrate='4M', audio="plughw:4,0", audio_gain=2.0)
+
+def encoder_on():
+    if Vilib.live_encoder is None:
+        Vilib.live_encoder_switch(True, **REC_ENCODER)
+
+def encoder_off_if_idle():
+    if Vilib.loop_recorder is None and Vilib.event_recorder is None:
+        Vilib.live_encoder_switch(False)
+
+# --- CCTV 상시(루프) 녹화 (기본 꺼짐, 대시보드 또는 /loop?status=on 으로 시작) ---
+# LOOP_SEGMENT_TIME 초마다 새 파일, 보관함이 LOOP_QUOTA_GB 를 넘으면 오래된 루프 영상부터 자동 삭제
+LOOP_SEGMENT_TIME = 300
+LOOP_QUOTA_GB = 100
+LOOP_MIN_FREE_GB = 2
+archive = Archive('picarx.db', SAVE_PATH, quota_gb=LOOP_QUOTA_GB, min_free_gb=LOOP_MIN_FREE_GB)
+archive.start()
+
+def loop_record(flag):
+    if flag:
+        encoder_on()
+        Vilib.loop_rec_switch(True, path=os.path.join(SAVE_PATH, 'loop-%Y-%m-%d-%H.%M.%S.mp4'),
+                              segment_time=LOOP_SEGMENT_TIME, on_segment=archive.add_segment)
+    else:
+        Vilib.loop_rec_switch(False)
+        encoder_off_if_idle()
+
+# --- 녹화 (/record) ---
+# 인코더의 패킷을 그대로 파일에 기록 (다시 인코딩하지 않음)
+# 프리롤 대기가 켜져 있으면 최근 PRE_EVENT_TIME 초(최대 PRE_EVENT_MAX_MB)를 메모리에 보관했다가 그 구간부터 기록
+PRE_EVENT_TIME = 5
+PRE_EVENT_MAX_MB = 32
+# 녹화 파일 형식: mp4 는 전원이 끊겨도 재생되도록 fragmented MP4 로 기록되므로
+# 녹화 후 faststart MP4 로 정리(remux, 재인코딩 없음)가 필요, mkv 는 그대로 보관함에 등록
+REC_FORMAT = 'mp4'
+
+def event_record(flag):
+    if flag:
+        encoder_on()
+        if Vilib.event_recorder is None:
+            Vilib.event_rec_switch(True, path=os.path.join(SAVE_PATH, '%Y-%m-%d-%H.%M.%S.' + REC_FORMAT),
+                                   pre_time=PRE_EVENT_TIME, max_mb=PRE_EVENT_MAX_MB)
+    else:
+        Vilib.event_rec_switch(False)
+        encoder_off_if_idle()
+
+def needs_faststart(path):
+    return path.endswith('.mp4')
+
 # --- 스마트 모드(자율 주행) 스레드 로직 ---
 def auto_pilot_loop():
     global auto_mode
@@ -71,14 +148,16 @@ def auto_pilot_loop():
     while True:
         if auto_mode:
             sleep(0.05)  
-            gm_val_list = px.get_grayscale_data()
-            gm_state = px.get_cliff_status(gm_val_list)
-            distance = round(px.ultrasonic.read(), 2)
+            with sensor_lock:
+                gm_val_list = px.get_grayscale_data()
+                gm_state = px.get_cliff_status(gm_val_list)
+                distance = round(px.ultrasonic.read(), 2)
             
             if distance == -1:
                 print("Sensor Error: Reading -1. Ignoring...", flush=True)
                 sleep(0.1)
-                distance = px.ultrasonic.read()
+                with sensor_lock:
+                    distance = px.ultrasonic.read()
 
             print(f"Mode: AUTO | Cliff: {gm_state} | Dist: {distance}cm | Raw: {gm_val_list}", flush=True)
 
@@ -107,12 +186,62 @@ def auto_pilot_loop():
 
 threading.Thread(target=auto_pilot_loop, daemon=True).start()
 
+# --- 대시보드 텔레메트리 (/vilib/ws 웹소켓의 telemetry 채널) ---
+# 접속자 수와 관계없이 초당 최대 5회만 센서를 읽음
+def read_car_telemetry():
+    with sensor_lock:
+        gm_val_list = px.get_grayscale_data()
+        distance = round(px.ultrasonic.read(), 2)
+    return {
+        'distance': distance,
+        'grayscale': list(gm_val_list),
+        'cliff': bool(px.get_cliff_status(gm_val_list)),
+        'auto_mode': auto_mode,
+        'pan': current_pan,
+        'tilt': current_tilt,
+    }
+
+Vilib.channels.add_telemetry('car', read_car_telemetry)
+
 # --- Flask 라우트 ---
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+@app.route('/live')
+def live_page():
+    global hls_last_access
+    hls_last_access = time.time()
+    if Vilib.hls is None:
+        try:
+            Vilib.hls_switch(True, fps=15, bitrate='2M')
+        except Exception as e:
+            print(f"HLS 스트림 시작 오류: {e}")
+    return render_template('live.html')
+
+# HLS 플레이리스트/세그먼트 (RAM의 tmpfs에서 바로 전송)
+HLS_MIMETYPES = {
+    '.m3u8': 'application/vnd.apple.mpegurl',
+    '.m4s': 'video/iso.segment',
+    '.mp4': 'video/mp4',
+}
+
+@app.route('/live/<path:filename>')
+def live_stream(filename):
+    global hls_last_access
+    if Vilib.hls is None:
+        return "HLS Offline", 404
+    hls_last_access = time.time()
+    mimetype = HLS_MIMETYPES.get(os.path.splitext(filename)[1])
+    if mimetype is None:
+        return "Not Found", 404
+    response = send_from_directory(Vilib.hls.path, filename, mimetype=mimetype)
+    # 플레이리스트는 계속 갱신되므로 캐시 금지
+    if filename.endswith('.m3u8'):
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 @app.route('/move')
 def move():
     global auto_mode
@@ -151,68 +280,79 @@ def toggle_auto_mode():
 
 @app.route('/record')
 def record():
-    global audio_proc
+    global event_path
     status = request.args.get('status')
-    
-    if status == 'start':
-        v_name = strftime("%Y-%m-%d-%H.%M.%S", localtime())
-        Vilib.rec_video_set["path"] = SAVE_PATH
-        Vilib.rec_video_set["name"] = v_name
-        Vilib.rec_video_set["resolution"] = (1920, 1080)
-        
-        Vilib.rec_video_run()
-        Vilib.rec_video_start()
-        
-        audio_temp = os.path.join(SAVE_PATH, f"{v_name}.wav")
-        # 오디오 캡처 시작 (사운드카드 번호 재확인 필요할 수 있음)
-        audio_proc = subprocess.Popen([
-            'arecord', '-D', 'plughw:4,0', '-f', 'S16_LE', '-r', '44100', '-c', '1', '-t', 'wav', audio_temp
-        ])
-        return jsonify(status="recording")
-    
-    else:
-        Vilib.rec_video_stop()
-        if audio_proc:
-            audio_proc.terminate(); audio_proc.wait(); audio_proc = None
-        
-        v_name = Vilib.rec_video_set["name"]
-        v_path = os.path.join(SAVE_PATH, v_name + ".avi")
-        a_path = os.path.join(SAVE_PATH, v_name + ".wav")
-        final_mp4 = os.path.join(SAVE_PATH, v_name + ".mp4")
-        
-        # [보완] 파일이 완전히 닫힐 때까지 충분히 대기 (Invalid data 에러 방지)
-        sleep(2.5) 
-        
-        # [보완] 두 파일이 모두 존재할 때만 ffmpeg 실행
-        if os.path.exists(v_path) and os.path.exists(a_path):
+
+    with rec_lock:
+        if status == 'start':
+            v_name = strftime("%Y-%m-%d-%H.%M.%S", localtime())
+            try:
+                event_record(True)
+                # 프리롤 대기 중이면 버퍼에 있던 직전 몇 초부터 바로 기록
+                event_path = Vilib.event_rec_start(os.path.join(SAVE_PATH, f"{v_name}.{REC_FORMAT}"))
+            except Exception as e:
+                print(f"녹화 시작 에러: {e}")
+                if not preroll_armed:
+                    event_record(False)
+                return jsonify(status="error", message="Recording failed")
+            return jsonify(status="recording")
+
+        # 파일만 닫으므로 바로 반환, 인코더는 다른 녹화(루프/프리롤)가 쓰지 않으면 정지
+        event = Vilib.event_rec_stop()
+        event_path = None
+        if not preroll_armed:
+            event_record(False)
+    if event is None or not os.path.exists(event[0]):
+        return jsonify(status="error", message="Recording file missing")
+    if needs_faststart(event[0]):
+        job_id = jobs.submit('remux', {'input': event[0]}, event[0], event[1])
+        return jsonify(status="stopped", job=job_id)
+    video_id = jobs.add_video(event[0])
+    return jsonify(status="stopped", video=video_id)
+
+# 프리롤 대기 켜기/끄기 (켜져 있는 동안 인코더와 오디오 장치 사용)
+@app.route('/preroll')
+def toggle_preroll():
+    global preroll_armed
+    status = request.args.get('status')
+    with rec_lock:
+        if status in ('on', 'off'):
+            preroll_armed = (status == 'on')
+            try:
+                if preroll_armed:
+                    event_record(True)
+                elif event_path is None:
+                    event_record(False)
+            except Exception as e:
+                preroll_armed = False
+                print(f"프리롤 대기 에러: {e}")
+                return jsonify(status="error", message="Pre-roll failed")
+    return jsonify(preroll=preroll_armed)
+
+# 후처리 작업 목록 / 상태 (진행률 0~1)
+@app.route('/jobs')
+def job_list():
+    return jsonify(jobs=jobs.list())
+
+@app.route('/jobs/<int:job_id>')
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify(error="not found"), 404
+    return jsonify(job)
+
+# 상시(루프) 녹화 켜기/끄기
+@app.route('/loop')
+def toggle_loop():
+    status = request.args.get('status')
+    if status in ('on', 'off'):
+        with rec_lock:
             try:
-                subprocess.run([
-                    'ffmpeg', '-y', '-i', v_path, '-i', a_path,
-                    '-af', 'volume=2.0,aresample=async=1',
-                    '-c:v', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p',
-                    '-c:a', 'aac', '-shortest', final_mp4
-                ], check=True)
-                
-                # 원본 삭제
-                if os.path.exists(v_path): os.remove(v_path)
-                if os.path.exists(a_path): os.remove(a_path)
-                
-                # [수정] os.getsize -> os.path.getsize로 정정
-                if os.path.exists(final_mp4):
-                    fsize = round(os.path.getsize(final_mp4) / (1024 * 1024), 2)
-                    db_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
-                    
-                    conn = sqlite3.connect('picarx.db')
-                    conn.execute('INSERT INTO videos (filename, filepath, filesize_mb, created_at) VALUES (?,?,?,?)', 
-                                (os.path.basename(final_mp4), final_mp4, fsize, db_time))
-                    conn.commit(); conn.close()
-                    print(f"녹화 성공: {final_mp4} ({fsize}MB)")
-                
+                loop_record(status == 'on')
             except Exception as e:
-                print(f"인코딩 에러 발생: {e}")
-                return jsonify(status="error", message="Encoding failed")
-                
-        return jsonify(status="stopped")
+                print(f"루프 녹화 에러: {e}")
+                return jsonify(status="error", message="Loop recording failed")
+    return jsonify(loop=Vilib.loop_recorder is not None)
 
 @app.route('/videos')
 def video_list():
@@ -242,8 +382,16 @@ def delete_video(video_id):
     conn.commit(); conn.close()
     return redirect(url_for('video_list'))
 
+# 영상 보호 설정/해제 (보호된 영상은 보관 용량 정리에서 삭제되지 않음)
+@app.route('/protect/<int:video_id>')
+def protect_video(video_id):
+    archive.protect(video_id, request.args.get('status', 'on') == 'on')
+    return redirect(url_for('video_list'))
+
 if __name__ == '__main__':
     try:
         app.run(host='0.0.0.0', port=5000, debug=False, use_reloader=False)
     finally:
+        Vilib.live_encoder_switch(False)
+        Vilib.hls_switch(False)
         px.stop()
\ No newline at end of file
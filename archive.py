@@ -0,0 +1,123 @@
+import os
+import shutil
+import sqlite3
+import threading
+from time import strftime, localtime
+
+# CCTV 상시(루프) 녹화 보관 관리
+# - 루프 녹화 세그먼트는 끝날 때마다 videos 테이블에 등록 (kind='loop', protected=0)
+# - 보관 용량(quota_gb)을 넘거나 디스크 여유 공간이 min_free_gb 보다 적으면
+#   보호되지 않은 가장 오래된 세그먼트부터 파일과 DB 행을 함께 삭제
+# - 삭제 대상은 디렉터리를 훑지 않고 idx_videos_retention 인덱스로 조회
+# - 수동 녹화는 기본으로 보호(protected=1)되어 자동 삭제되지 않음
+
+
+class Archive:
+    def __init__(self, db_path='picarx.db', path='.', quota_gb=100, min_free_gb=2):
+        self.db_path = db_path
+        self.path = path
+        self.quota_mb = quota_gb * 1024
+        self.min_free_mb = min_free_gb * 1024
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.init_db()
+
+    def connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def init_db(self):
+        conn = self.connect()
+        # 기존 videos 테이블에 컬럼 추가 (이미 있으면 건너뜀)
+        columns = [row['name'] for row in conn.execute('PRAGMA table_info(videos)')]
+        if 'kind' not in columns:
+            conn.execute("ALTER TABLE videos ADD COLUMN kind TEXT NOT NULL DEFAULT 'manual'")
+        if 'protected' not in columns:
+            conn.execute('ALTER TABLE videos ADD COLUMN protected INTEGER NOT NULL DEFAULT 1')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_videos_retention ON videos (protected, id)')
+        conn.commit()
+        conn.close()
+
+    def start(self):
+        # 삭제는 별도 스레드에서 (녹화 스레드를 막지 않도록)
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self.worker, name='archive', daemon=True)
+            self.thread.start()
+        self.wakeup.set()
+
+    def add_segment(self, path, started, duration):
+        """SegmentedRecorder 의 on_segment 콜백: 끝난 세그먼트 등록 후 보관 용량 확인"""
+        if not os.path.exists(path):
+            return
+        fsize = round(os.path.getsize(path) / (1024 * 1024), 2)
+        conn = self.connect()
+        conn.execute('INSERT INTO videos (filename, filepath, filesize_mb, created_at, kind, protected) '
+                     "VALUES (?,?,?,?,'loop',0)",
+                     (os.path.basename(path), path, fsize,
+                      strftime("%Y-%m-%d %H:%M:%S", localtime(started))))
+        conn.commit()
+        conn.close()
+        print(f"루프 녹화 세그먼트 저장: {os.path.basename(path)} ({duration:.0f}초, {fsize} MB)")
+        self.wakeup.set()
+
+    def protect(self, video_id, flag=True):
+        conn = self.connect()
+        conn.execute('UPDATE videos SET protected = ? WHERE id = ?', (1 if flag else 0, video_id))
+        conn.commit()
+        conn.close()
+
+    def usage(self):
+        """(보관 중인 영상 용량 MB, 디스크 여유 공간 MB)"""
+        conn = self.connect()
+        used = conn.execute('SELECT COALESCE(SUM(filesize_mb), 0) FROM videos').fetchone()[0]
+        conn.close()
+        free = shutil.disk_usage(self.path).free / (1024 * 1024)
+        return used, free
+
+    def enforce(self):
+        """용량 초과분만큼 보호되지 않은 오래된 세그먼트 삭제, 삭제한 개수 반환"""
+        used, free = self.usage()
+        excess = max(used - self.quota_mb, self.min_free_mb - free)
+        if excess <= 0:
+            return 0
+        conn = self.connect()
+        removed = 0
+        last_id = 0
+        while excess > 0:
+            # 한 번에 최대 20개씩, 오래된 순서(id)로 (지우지 못한 행은 건너뜀)
+            rows = conn.execute('SELECT id, filepath, filesize_mb FROM videos '
+                                'WHERE protected = 0 AND id > ? ORDER BY id LIMIT 20',
+                                (last_id,)).fetchall()
+            if not rows:
+                print("보관 용량 초과: 삭제할 수 있는 루프 녹화가 없음 (보호된 영상만 남음)")
+                break
+            for row in rows:
+                if excess <= 0:
+                    break
+                last_id = row['id']
+                try:
+                    os.remove(row['filepath'])
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    # 파일이 남아 있으므로 DB 행도 남기고 용량도 확보된 것으로 치지 않음
+                    print(f"세그먼트 삭제 에러: {e}")
+                    continue
+                conn.execute('DELETE FROM videos WHERE id = ?', (row['id'],))
+                excess -= row['filesize_mb'] or 0
+                removed += 1
+            conn.commit()
+        conn.close()
+        return removed
+
+    def worker(self):
+        while True:
+            self.wakeup.wait()
+            self.wakeup.clear()
+            try:
+                removed = self.enforce()
+                if removed:
+                    print(f"보관 용량 정리: 오래된 루프 녹화 {removed}개 삭제")
+            except Exception as e:
+                print(f"보관 용량 정리 에러: {e}")
@@ -0,0 +1,189 @@
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import threading
+from time import strftime, localtime, monotonic
+
+# 녹화 후처리(먹싱/트랜스코딩) 작업 큐
+# - 작업은 picarx.db 의 jobs 테이블에 저장되므로 서버가 재시작되어도 이어서 처리됨
+# - 작업자 스레드 하나가 순서대로 처리하고, ffmpeg 는 가장 낮은 CPU/IO 우선순위로 실행
+# - 작업이 끝나면 videos 테이블에 결과 영상을 등록
+
+# 작업 종류별 ffmpeg 인자
+#   mux:   AVI(영상) + WAV(음성) -> H.264/AAC MP4 (기존 녹화 방식)
+#   remux: 녹화된 MP4 를 재인코딩 없이 faststart MP4 로 정리 (브라우저 탐색이 빨라짐)
+def ffmpeg_args(kind, params, output):
+    if kind == 'mux':
+        return ['-i', params['video'], '-i', params['audio'],
+                '-af', 'volume=2.0,aresample=async=1',
+                '-c:v', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p',
+                '-c:a', 'aac', '-shortest', output]
+    if kind == 'remux':
+        return ['-i', params['input'], '-c', 'copy', '-movflags', '+faststart', output]
+    raise ValueError(f"unknown job kind: {kind}")
+
+
+def low_priority():
+    # nice / ionice 가 있으면 ffmpeg 를 가장 낮은 우선순위로 실행
+    prefix = []
+    if shutil.which('nice'):
+        prefix += ['nice', '-n', '19']
+    if shutil.which('ionice'):
+        prefix += ['ionice', '-c', '3']
+    return prefix
+
+
+class JobQueue:
+    def __init__(self, db_path='picarx.db', ffmpeg='ffmpeg'):
+        self.db_path = db_path
+        self.ffmpeg = ffmpeg
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.init_db()
+
+    def connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def init_db(self):
+        conn = self.connect()
+        # WAL: 작업자가 쓰는 동안에도 웹 요청이 막히지 않고 읽을 수 있음
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                progress REAL NOT NULL DEFAULT 0,
+                params TEXT NOT NULL,
+                output TEXT NOT NULL,
+                message TEXT,
+                video_id INTEGER,
+                created_at TEXT NOT NULL,
+                started_at TEXT,
+                finished_at TEXT
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id)')
+        # 처리 도중 서버가 종료된 작업은 다시 대기열로
+        conn.execute("UPDATE jobs SET status = 'queued', progress = 0 WHERE status = 'running'")
+        conn.commit()
+        conn.close()
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self.worker, name='jobs', daemon=True)
+            self.thread.start()
+
+    def submit(self, kind, params, output, duration=None):
+        """작업 등록. duration(초)을 알면 진행률 계산에 사용. 작업 id 반환"""
+        params = dict(params, duration=duration)
+        conn = self.connect()
+        cur = conn.execute(
+            'INSERT INTO jobs (kind, params, output, created_at) VALUES (?,?,?,?)',
+            (kind, json.dumps(params), output, strftime("%Y-%m-%d %H:%M:%S", localtime())))
+        conn.commit()
+        job_id = cur.lastrowid
+        conn.close()
+        self.wakeup.set()
+        return job_id
+
+    def get(self, job_id):
+        conn = self.connect()
+        row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        conn.close()
+        return self.to_dict(row) if row else None
+
+    def list(self, limit=50):
+        conn = self.connect()
+        rows = conn.execute('SELECT * FROM jobs ORDER BY id DESC LIMIT ?', (limit,)).fetchall()
+        conn.close()
+        return [self.to_dict(row) for row in rows]
+
+    @staticmethod
+    def to_dict(row):
+        job = dict(row)
+        job['params'] = json.loads(job['params'])
+        job['progress'] = round(job['progress'], 3)
+        return job
+
+    def update(self, job_id, **fields):
+        conn = self.connect()
+        names = ', '.join(f'{k} = ?' for k in fields)
+        conn.execute(f'UPDATE jobs SET {names} WHERE id = ?', (*fields.values(), job_id))
+        conn.commit()
+        conn.close()
+
+    def next_job(self):
+        conn = self.connect()
+        row = conn.execute("SELECT * FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1").fetchone()
+        conn.close()
+        return self.to_dict(row) if row else None
+
+    def worker(self):
+        # 이 스레드 자체도 낮은 우선순위로 (리눅스는 스레드별 nice 적용)
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        except (AttributeError, OSError):
+            pass
+        while True:
+            job = self.next_job()
+            if job is None:
+                self.wakeup.wait(5)
+                self.wakeup.clear()
+                continue
+            self.run(job)
+
+    def run(self, job):
+        now = strftime("%Y-%m-%d %H:%M:%S", localtime())
+        self.update(job['id'], status='running', progress=0, started_at=now)
+        params, output = job['params'], job['output']
+        # 같은 디렉터리의 임시 파일에 쓰고 성공 시 교체 (remux 는 입력과 출력이 같을 수 있음)
+        root, ext = os.path.splitext(output)
+        temp = f"{root}.part{ext}"
+        try:
+            self.ffmpeg_run(job['id'], job['kind'], params, temp)
+            os.replace(temp, output)
+            if job['kind'] == 'mux':
+                for path in (params['video'], params['audio']):
+                    if os.path.exists(path): os.remove(path)
+            video_id = self.add_video(output)
+            self.update(job['id'], status='done', progress=1, video_id=video_id,
+                        finished_at=strftime("%Y-%m-%d %H:%M:%S", localtime()))
+            print(f"후처리 완료: {output}")
+        except Exception as e:
+            if os.path.exists(temp): os.remove(temp)
+            self.update(job['id'], status='failed', message=str(e),
+                        finished_at=strftime("%Y-%m-%d %H:%M:%S", localtime()))
+            print(f"후처리 에러 (job {job['id']}): {e}")
+
+    def ffmpeg_run(self, job_id, kind, params, output):
+        # -progress: 처리한 시간(out_time_us)을 표준출력으로 받아 진행률 계산
+        cmd = low_priority() + [self.ffmpeg, '-y', '-loglevel', 'error', '-nostats',
+                                '-progress', 'pipe:1'] + ffmpeg_args(kind, params, output)
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        duration = params.get('duration')
+        last_update = 0
+        for line in proc.stdout:
+            key, _, value = line.strip().partition('=')
+            if key == 'out_time_us' and duration and value.isdigit():
+                # DB 갱신은 1초에 한 번만
+                if monotonic() - last_update >= 1:
+                    last_update = monotonic()
+                    self.update(job_id, progress=min(0.99, int(value) / 1e6 / duration))
+        error = proc.stderr.read()
+        if proc.wait() != 0:
+            raise RuntimeError(error.strip() or f"ffmpeg exit code {proc.returncode}")
+
+    def add_video(self, path):
+        fsize = round(os.path.getsize(path) / (1024 * 1024), 2)
+        db_time = strftime("%Y-%m-%d %H:%M:%S", localtime())
+        conn = self.connect()
+        cur = conn.execute('INSERT INTO videos (filename, filepath, filesize_mb, created_at) VALUES (?,?,?,?)',
+                           (os.path.basename(path), path, fsize, db_time))
+        conn.commit()
+        conn.close()
+        return cur.lastrowid
@@ -0,0 +1,125 @@
+import os
+import sqlite3
+
+import pytest
+
+from archive import Archive
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / 'picarx.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE videos (id INTEGER PRIMARY KEY AUTOINCREMENT, filename TEXT NOT NULL, '
+                 'filepath TEXT NOT NULL, filesize_mb REAL, created_at TEXT NOT NULL)')
+    conn.commit()
+    conn.close()
+    return path
+
+
+def add(archive, path, size_mb, kind='loop', protected=0):
+    with open(path, 'wb') as f:
+        f.write(b'0')
+    conn = archive.connect()
+    cur = conn.execute('INSERT INTO videos (filename, filepath, filesize_mb, created_at, kind, protected) '
+                       'VALUES (?,?,?,?,?,?)',
+                       (os.path.basename(path), path, size_mb, '2026-01-01 00:00:00', kind, protected))
+    conn.commit()
+    conn.close()
+    return cur.lastrowid
+
+
+def ids(archive):
+    conn = archive.connect()
+    rows = conn.execute('SELECT id FROM videos ORDER BY id').fetchall()
+    conn.close()
+    return [row['id'] for row in rows]
+
+
+def test_migration_keeps_manual_videos_protected(db):
+    conn = sqlite3.connect(db)
+    conn.execute("INSERT INTO videos (filename, filepath, filesize_mb, created_at) VALUES ('a.mp4','a.mp4',1,'x')")
+    conn.commit()
+    conn.close()
+    archive = Archive(db, '.')
+    conn = archive.connect()
+    row = conn.execute('SELECT kind, protected FROM videos').fetchone()
+    conn.close()
+    assert (row['kind'], row['protected']) == ('manual', 1)
+    # idempotent
+    Archive(db, '.')
+
+
+def test_under_quota_nothing_is_removed(db, tmp_path):
+    archive = Archive(db, str(tmp_path), quota_gb=1, min_free_gb=0)
+    add(archive, str(tmp_path / 'a.mp4'), 100)
+    assert archive.enforce() == 0
+    assert len(ids(archive)) == 1
+
+
+def test_oldest_unprotected_segments_are_removed_first(db, tmp_path):
+    archive = Archive(db, str(tmp_path), quota_gb=1, min_free_gb=0)
+    paths = [str(tmp_path / f'loop-{i}.mp4') for i in range(4)]
+    rows = [add(archive, path, 400) for path in paths]
+    # 1600 MB for a 1024 MB quota: the two oldest go
+    assert archive.enforce() == 2
+    assert ids(archive) == rows[2:]
+    assert [os.path.exists(path) for path in paths] == [False, False, True, True]
+
+
+def test_protected_videos_are_never_removed(db, tmp_path):
+    archive = Archive(db, str(tmp_path), quota_gb=1, min_free_gb=0)
+    manual = add(archive, str(tmp_path / 'manual.mp4'), 600, kind='manual', protected=1)
+    kept = add(archive, str(tmp_path / 'loop-0.mp4'), 600)
+    archive.protect(kept)
+    loop = add(archive, str(tmp_path / 'loop-1.mp4'), 600)
+    assert archive.enforce() == 1
+    assert ids(archive) == [manual, kept]
+    assert os.path.exists(str(tmp_path / 'manual.mp4'))
+    assert os.path.exists(str(tmp_path / 'loop-0.mp4'))
+    assert not os.path.exists(str(tmp_path / 'loop-1.mp4'))
+    # still over quota, only protected videos left
+    assert archive.enforce() == 0
+    assert ids(archive) == [manual, kept]
+    assert loop not in ids(archive)
+
+
+def test_missing_file_row_is_removed(db, tmp_path):
+    archive = Archive(db, str(tmp_path), quota_gb=1, min_free_gb=0)
+    path = str(tmp_path / 'loop-0.mp4')
+    add(archive, path, 2000)
+    os.remove(path)
+    assert archive.enforce() == 1
+    assert ids(archive) == []
+
+
+def test_undeletable_file_keeps_its_row(db, tmp_path):
+    archive = Archive(db, str(tmp_path), quota_gb=1, min_free_gb=0)
+    # a directory can not be removed with os.remove()
+    stuck = str(tmp_path / 'stuck')
+    os.mkdir(stuck)
+    conn = archive.connect()
+    conn.execute("INSERT INTO videos (filename, filepath, filesize_mb, created_at, kind, protected) "
+                 "VALUES ('stuck', ?, 600, 'x', 'loop', 0)", (stuck,))
+    conn.commit()
+    conn.close()
+    stuck_id = ids(archive)[0]
+    other = add(archive, str(tmp_path / 'loop-1.mp4'), 600)
+    # the stuck row does not count as freed, the next one goes
+    assert archive.enforce() == 1
+    assert ids(archive) == [stuck_id]
+    assert os.path.isdir(stuck)
+    assert other not in ids(archive)
+
+
+def test_add_segment(db, tmp_path):
+    archive = Archive(db, str(tmp_path), quota_gb=1, min_free_gb=0)
+    path = str(tmp_path / 'loop-0.mp4')
+    with open(path, 'wb') as f:
+        f.write(b'0' * 1024 * 1024)
+    archive.add_segment(path, 0.0, 300.0)
+    archive.add_segment(str(tmp_path / 'missing.mp4'), 0.0, 300.0)
+    conn = archive.connect()
+    rows = conn.execute('SELECT filepath, filesize_mb, kind, protected FROM videos').fetchall()
+    conn.close()
+    assert [tuple(row) for row in rows] == [(path, 1.0, 'loop', 0)]
@@ -0,0 +1,103 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+from jobs import JobQueue, ffmpeg_args
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / 'picarx.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE videos (id INTEGER PRIMARY KEY AUTOINCREMENT, filename TEXT NOT NULL, '
+                 'filepath TEXT NOT NULL, filesize_mb REAL, created_at TEXT NOT NULL)')
+    conn.commit()
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def fake_ffmpeg(tmp_path):
+    # writes its last argument (the output) and reports progress like ffmpeg -progress
+    path = tmp_path / 'ffmpeg'
+    path.write_text(f'#!{sys.executable}\n'
+                    'import sys\n'
+                    "open(sys.argv[-1], 'wb').write(b'0' * 1024)\n"
+                    "print('out_time_us=1000000')\n"
+                    "print('progress=end')\n")
+    path.chmod(0o755)
+    return str(path)
+
+
+def test_ffmpeg_args():
+    assert ffmpeg_args('remux', {'input': 'a.mp4'}, 'b.mp4') == \
+        ['-i', 'a.mp4', '-c', 'copy', '-movflags', '+faststart', 'b.mp4']
+    assert ffmpeg_args('mux', {'video': 'a.avi', 'audio': 'a.wav'}, 'a.mp4')[-1] == 'a.mp4'
+    with pytest.raises(ValueError):
+        ffmpeg_args('transcode', {}, 'a.mp4')
+
+
+def test_submit_is_persisted(db):
+    queue = JobQueue(db)
+    job_id = queue.submit('remux', {'input': '/videos/a.mp4'}, '/videos/a.mp4', 12.5)
+    job = JobQueue(db).get(job_id)
+    assert job['kind'] == 'remux'
+    assert job['status'] == 'queued'
+    assert job['params'] == {'input': '/videos/a.mp4', 'duration': 12.5}
+    assert job['output'] == '/videos/a.mp4'
+
+
+def test_jobs_run_in_order(db):
+    queue = JobQueue(db)
+    first = queue.submit('remux', {'input': 'a.mp4'}, 'a.mp4')
+    second = queue.submit('remux', {'input': 'b.mp4'}, 'b.mp4')
+    assert queue.next_job()['id'] == first
+    queue.update(first, status='done')
+    assert queue.next_job()['id'] == second
+    assert [job['id'] for job in queue.list()] == [second, first]
+
+
+def test_restart_requeues_running_jobs(db):
+    queue = JobQueue(db)
+    running = queue.submit('remux', {'input': 'a.mp4'}, 'a.mp4')
+    done = queue.submit('remux', {'input': 'b.mp4'}, 'b.mp4')
+    queue.update(running, status='running', progress=0.5)
+    queue.update(done, status='done', progress=1)
+    # server restart
+    queue = JobQueue(db)
+    job = queue.get(running)
+    assert job['status'] == 'queued'
+    assert job['progress'] == 0
+    assert queue.get(done)['status'] == 'done'
+    assert queue.next_job()['id'] == running
+
+
+def test_run_registers_the_video(db, tmp_path, fake_ffmpeg):
+    output = str(tmp_path / 'a.mp4')
+    with open(output, 'wb') as f:
+        f.write(b'fragmented')
+    queue = JobQueue(db, ffmpeg=fake_ffmpeg)
+    job_id = queue.submit('remux', {'input': output}, output, 1.0)
+    queue.run(queue.next_job())
+    job = queue.get(job_id)
+    assert job['status'] == 'done'
+    assert job['progress'] == 1
+    assert os.path.getsize(output) == 1024
+    assert not os.path.exists(str(tmp_path / 'a.part.mp4'))
+    conn = sqlite3.connect(db)
+    row = conn.execute('SELECT id, filepath FROM videos').fetchone()
+    conn.close()
+    assert row == (job['video_id'], output)
+
+
+def test_failed_job(db, tmp_path):
+    output = str(tmp_path / 'a.mp4')
+    queue = JobQueue(db, ffmpeg='false')
+    job_id = queue.submit('remux', {'input': output}, output)
+    queue.run(queue.next_job())
+    job = queue.get(job_id)
+    assert job['status'] == 'failed'
+    assert job['message']
+    assert queue.next_job() is None
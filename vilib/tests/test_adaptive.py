@@ -0,0 +1,106 @@
+from vilib.adaptive import AdaptiveStream
+from vilib.mjpeg import Variant
+
+
+def test_ladder_order():
+    stream = AdaptiveStream(1920, max_fps=None, min_width=320, max_quality=90,
+                            min_quality=30, min_fps=2)
+    levels = stream.levels
+    # best first: capture width, best quality, every frame
+    assert levels[0] == (Variant('jpg', True, None, 90), None)
+    # last: smallest of everything
+    assert levels[-1] == (Variant('jpg', True, 320, 30), 2)
+    # quality goes down first, at full width
+    assert [v.quality for v, fps in levels[:7]] == [90, 80, 70, 60, 50, 40, 30]
+    assert all(v.width is None for v, fps in levels[:7])
+    # then the width, at the lowest quality
+    widths = [v.width for v, fps in levels[7:] if fps is None]
+    assert widths == sorted(widths, reverse=True)
+    assert all(w % 16 == 0 for w in widths)
+    # then the frame rate, at the smallest width
+    rates = [fps for v, fps in levels if fps is not None]
+    assert rates == [30.0, 15.0, 7.5, 3.75, 2]
+    assert all(v.width == 320 for v, fps in levels if fps is not None)
+
+
+def test_ladder_without_duplicates():
+    stream = AdaptiveStream(640, max_width=320, min_width=320, max_quality=30,
+                            min_quality=30, max_fps=2, min_fps=2)
+    assert stream.levels == [(Variant('jpg', True, 320, 30), 2)]
+
+
+def test_ladder_capped_request():
+    stream = AdaptiveStream(1920, max_width=640, min_width=320, max_quality=60,
+                            min_quality=40, max_fps=10, min_fps=5)
+    assert stream.levels == [
+        (Variant('jpg', True, 640, 60), 10),
+        (Variant('jpg', True, 640, 50), 10),
+        (Variant('jpg', True, 640, 40), 10),
+        (Variant('jpg', True, 480, 40), 10),
+        (Variant('jpg', True, 352, 40), 10),
+        (Variant('jpg', True, 320, 40), 10),
+        (Variant('jpg', True, 320, 40), 5),
+    ]
+
+
+def slow_link(stream, sends=20):
+    changed = 0
+    for _ in range(sends):
+        # let the hold time pass before each send
+        stream.changed_time -= AdaptiveStream.DOWN_HOLD
+        changed += stream.sent(10000, 1.0)
+    return changed
+
+
+def test_steps_down_on_a_slow_link():
+    stream = AdaptiveStream(1920, target_latency=0.3)
+    assert stream.level == 0
+    # the latency is smoothed, one slow send is enough when it is this slow
+    stream.changed_time -= AdaptiveStream.DOWN_HOLD
+    assert stream.sent(10000, 2.0)
+    assert stream.level == 1
+    assert stream.variant.quality == 80
+
+
+def test_steps_down_one_level_per_hold():
+    stream = AdaptiveStream(1920, target_latency=0.3)
+    stream.changed_time -= AdaptiveStream.DOWN_HOLD
+    assert stream.sent(10000, 2.0)
+    # too soon after the last step
+    assert not stream.sent(10000, 2.0)
+    assert stream.level == 1
+
+
+def test_stops_at_the_last_level():
+    stream = AdaptiveStream(1920, target_latency=0.3)
+    slow_link(stream, sends=len(stream.levels) + 5)
+    assert stream.level == len(stream.levels) - 1
+    assert stream.fps == 2
+
+
+def test_steps_up_when_the_link_recovers():
+    stream = AdaptiveStream(1920, target_latency=0.3)
+    slow_link(stream, sends=3)
+    level = stream.level
+    assert level > 0
+    # latency back to near zero
+    for _ in range(20):
+        stream.sent(10000, 0.0)
+    assert stream.level == level
+    # after UP_HOLD seconds of spare capacity, one level up
+    stream.spare_since -= AdaptiveStream.UP_HOLD
+    stream.changed_time -= AdaptiveStream.UP_HOLD
+    assert stream.sent(10000, 0.0)
+    assert stream.level == level - 1
+
+
+def test_from_args():
+    variant = Variant('jpg', True, 640, 60)
+    assert AdaptiveStream.from_args({}, variant, 10) is None
+    assert AdaptiveStream.from_args({'adapt': '0'}, variant, 10) is None
+    stream = AdaptiveStream.from_args({'adapt': '1', 'minw': '320', 'minq': '40',
+                                       'minfps': '5', 'latency': 'x'}, variant, 10,
+                                      frame_width=1920)
+    assert stream.levels[0] == (variant, 10)
+    assert stream.levels[-1] == (Variant('jpg', True, 320, 40), 5)
+    assert stream.target_latency == 0.3
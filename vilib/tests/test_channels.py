@@ -0,0 +1,85 @@
+import json
+
+from vilib.channels import ChannelMux, ChannelSession
+from vilib.mjpeg import Variant
+
+
+class StubBroadcaster(object):
+    def __init__(self):
+        self.subscribers = {}
+
+    def subscribe(self, key):
+        self.subscribers[key] = self.subscribers.get(key, 0) + 1
+
+    def unsubscribe(self, key):
+        self.subscribers[key] -= 1
+        if not self.subscribers[key]:
+            del self.subscribers[key]
+
+
+def control(mux, session, request):
+    mux.control(session, json.dumps(request), frame_width=1920)
+
+
+def setup():
+    broadcaster = StubBroadcaster()
+    return broadcaster, ChannelMux(broadcaster, None, {}), ChannelSession()
+
+
+def test_subscribe_frames():
+    broadcaster, mux, session = setup()
+    control(mux, session, {'subscribe': ['frames', 'telemetry', 'other'], 'w': 320, 'q': 50, 'fps': 10})
+    assert session.channels == {'frames', 'telemetry'}
+    assert session.variant == Variant('jpg', True, 320, 50)
+    assert session.fps == 10
+    assert broadcaster.subscribers == {session.variant: 1}
+
+
+def test_rate_message_keeps_the_frame_variant():
+    broadcaster, mux, session = setup()
+    control(mux, session, {'subscribe': ['frames'], 'w': 320, 'q': 50, 'fps': 10, 'adapt': 1})
+    variant, adaptive = session.variant, session.adaptive
+    control(mux, session, {'detections_fps': 2})
+    assert session.detections_fps == 2
+    assert session.variant == variant
+    assert session.adaptive is adaptive
+    assert session.fps == 10
+    assert broadcaster.subscribers == {variant: 1}
+
+
+def test_subscribe_keeps_the_frame_parameters():
+    broadcaster, mux, session = setup()
+    control(mux, session, {'subscribe': ['frames'], 'w': 320, 'q': 50})
+    variant = session.variant
+    control(mux, session, {'subscribe': ['telemetry']})
+    assert session.variant is None
+    assert broadcaster.subscribers == {}
+    control(mux, session, {'subscribe': ['frames', 'telemetry']})
+    assert session.variant == variant
+    assert broadcaster.subscribers == {variant: 1}
+
+
+def test_new_frame_parameters_replace_the_old_ones():
+    broadcaster, mux, session = setup()
+    control(mux, session, {'subscribe': ['frames'], 'w': 320, 'q': 50, 'fps': 10})
+    control(mux, session, {'w': 640})
+    assert session.variant == Variant('jpg', True, 640, None)
+    assert session.fps is None
+    assert broadcaster.subscribers == {session.variant: 1}
+
+
+def test_invalid_subscribe_is_ignored():
+    broadcaster, mux, session = setup()
+    control(mux, session, {'subscribe': ['frames']})
+    for value in ('frames', 5, None, ['frames', 5], {'frames': 1}):
+        control(mux, session, {'subscribe': value})
+        assert session.channels == {'frames'}
+    assert broadcaster.subscribers == {Variant(): 1}
+
+
+def test_invalid_messages_are_ignored():
+    broadcaster, mux, session = setup()
+    mux.control(session, 'not json')
+    mux.control(session, '[1, 2]')
+    assert session.channels == set()
+    assert broadcaster.subscribers == {}
@@ -0,0 +1,47 @@
+import multiprocessing
+import os
+
+import pytest
+
+from vilib.detector_process import ProcessDetectorPool, ProcessSpec
+from vilib.detector_registry import DetectorRegistry
+from vilib.frame_buffer import FrameRingBuffer
+from vilib.shared_frame import SharedFrameStore
+
+
+def noop(img, annotations):
+    pass
+
+
+@pytest.fixture
+def store():
+    store = SharedFrameStore(f'vilib_test_{os.getpid()}', slots=2, slot_bytes=64 * 48 * 3)
+    yield store
+    store.close()
+
+
+def test_failed_start_stops_the_started_workers(store):
+    registry = DetectorRegistry({})
+    registry.register('first', noop)
+    registry.register('second', noop)
+    specs = {
+        'first': ProcessSpec(noop),
+        'second': ProcessSpec(noop, shared=[('vilib_no_such_module', 'results')]),
+    }
+    pool = ProcessDetectorPool(FrameRingBuffer(), store, registry, specs)
+    with pytest.raises(ImportError):
+        pool.start()
+    assert not pool.running
+    assert pool.workers == {}
+    assert pool.thread is None
+    assert multiprocessing.active_children() == []
+    assert not registry.get('first').process
+    assert not registry.get('second').process
+
+
+def test_unknown_detector(store):
+    pool = ProcessDetectorPool(FrameRingBuffer(), store, DetectorRegistry({}),
+                               {'missing': ProcessSpec(noop)})
+    with pytest.raises(ValueError):
+        pool.start()
+    assert pool.workers == {}
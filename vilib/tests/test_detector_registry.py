@@ -0,0 +1,105 @@
+import numpy as np
+
+from vilib.detector_registry import DetectorRegistry
+
+
+def noop(img):
+    return img
+
+
+def names(detectors):
+    return [d.name for d in detectors]
+
+
+def test_priority_order():
+    registry = DetectorRegistry({})
+    registry.register('low', noop, priority=0)
+    registry.register('high', noop, priority=5)
+    registry.register('mid', noop, priority=2)
+    assert names(registry.due(1, now=0.0)) == ['high', 'mid', 'low']
+
+
+def test_disabled_detector_is_never_due():
+    registry = DetectorRegistry({})
+    registry.register('face', noop, enabled=False)
+    assert registry.due(1, now=0.0) == []
+    registry.enable('face')
+    assert names(registry.due(1, now=0.0)) == ['face']
+
+
+def test_skip_budget():
+    registry = DetectorRegistry({})
+    detector = registry.register('face', noop, skip=3)
+    runs = []
+    for seq in range(1, 11):
+        if registry.due(seq, now=float(seq)):
+            registry.mark(detector, seq, now=float(seq))
+            runs.append(seq)
+    assert runs == [1, 4, 7, 10]
+
+
+def test_rate_budget():
+    registry = DetectorRegistry({})
+    detector = registry.register('face', noop, rate=2)
+    runs = []
+    # frames at 10 fps, at most 2 runs per second
+    for seq in range(1, 21):
+        now = 100.0 + seq * 0.1
+        if registry.due(seq, now=now):
+            registry.mark(detector, seq, now=now)
+            runs.append(seq)
+    assert runs == [1, 6, 11, 16]
+
+
+def test_rate_and_skip_budgets_both_apply():
+    registry = DetectorRegistry({})
+    detector = registry.register('face', noop, rate=1, skip=5)
+    registry.mark(detector, 1, now=10.0)
+    # enough frames, too early
+    assert registry.due(6, now=10.5) == []
+    # late enough, too few frames
+    assert registry.due(3, now=12.0) == []
+    assert names(registry.due(6, now=11.0)) == ['face']
+
+
+def test_budgets_are_per_detector():
+    registry = DetectorRegistry({})
+    slow = registry.register('slow', noop, rate=1)
+    registry.register('fast', noop)
+    registry.mark(slow, 1, now=10.0)
+    assert names(registry.due(2, now=10.1)) == ['fast']
+
+
+def test_process_detectors_are_picked_separately():
+    registry = DetectorRegistry({})
+    registry.register('local', noop)
+    remote = registry.register('remote', noop)
+    remote.process = True
+    assert names(registry.due(1, now=0.0)) == ['local']
+    assert names(registry.due(1, now=0.0, process=True)) == ['remote']
+
+
+def test_run_due_charges_the_budget():
+    registry = DetectorRegistry({})
+    calls = []
+    registry.register('face', lambda img: calls.append(img.shape), skip=2)
+    img = np.zeros((4, 4, 3), np.uint8)
+    for seq in range(1, 6):
+        registry.run_due(img, seq)
+    assert len(calls) == 3
+
+
+def test_run_copies_the_shared_frame():
+    registry = DetectorRegistry({})
+
+    def draw(img):
+        img[:] = 255
+        return img
+
+    detector = registry.register('draw', draw)
+    img = np.zeros((4, 4, 3), np.uint8)
+    lores = np.zeros((2, 2, 3), np.uint8)
+    registry.run(detector, img, copy=True)
+    registry.run(detector, img, copy=True, lores=lores)
+    assert not img.any()
+    assert not lores.any()
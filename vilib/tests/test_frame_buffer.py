@@ -0,0 +1,91 @@
+import threading
+
+import numpy as np
+import pytest
+
+from vilib.frame_buffer import FrameRingBuffer
+
+
+def image(value):
+    return np.full((2, 2, 3), value, np.uint8)
+
+
+def test_needs_two_slots():
+    with pytest.raises(ValueError):
+        FrameRingBuffer(1)
+
+
+def test_empty():
+    buf = FrameRingBuffer(4)
+    assert buf.seq == 0
+    assert buf.latest() is None
+    assert buf.get(0) is None
+    assert buf.get(1) is None
+    assert not buf.is_valid(1)
+
+
+def test_sequence_numbers():
+    buf = FrameRingBuffer(4)
+    imgs = [image(i) for i in range(3)]
+    seqs = [buf.put(img, timestamp=float(i)) for i, img in enumerate(imgs)]
+    assert seqs == [1, 2, 3]
+    assert buf.seq == 3
+    for seq, img in zip(seqs, imgs):
+        frame = buf.get(seq)
+        assert frame.seq == seq
+        assert frame.timestamp == seq - 1.0
+        # stored by reference
+        assert frame.img is img
+    assert buf.latest().seq == 3
+
+
+def test_wrap_around():
+    buf = FrameRingBuffer(4)
+    for i in range(10):
+        buf.put(image(i))
+    assert buf.seq == 10
+    # only the last 4 frames are held
+    for seq in range(1, 7):
+        assert buf.get(seq) is None
+        assert not buf.is_valid(seq)
+    for seq in range(7, 11):
+        assert buf.get(seq).seq == seq
+        assert buf.get(seq).img[0, 0, 0] == seq - 1
+    # not published yet
+    assert buf.get(11) is None
+
+
+def test_get_next_in_order():
+    buf = FrameRingBuffer(4)
+    for i in range(3):
+        buf.put(image(i))
+    assert buf.get_next(0).seq == 1
+    assert buf.get_next(1).seq == 2
+    assert buf.get_next(3, timeout=0.01) is None
+
+
+def test_get_next_after_falling_behind():
+    buf = FrameRingBuffer(4)
+    for i in range(10):
+        buf.put(image(i))
+    # frame 2 was recycled, the oldest frame still held comes next
+    assert buf.get_next(1).seq == 7
+
+
+def test_wait_latest_skips_frames():
+    buf = FrameRingBuffer(4)
+    for i in range(3):
+        buf.put(image(i))
+    assert buf.wait_latest(0).seq == 3
+    assert buf.wait_latest(3, timeout=0.01) is None
+
+
+def test_get_next_wakes_up_on_put():
+    buf = FrameRingBuffer(4)
+    timer = threading.Timer(0.05, buf.put, (image(0),))
+    timer.start()
+    try:
+        frame = buf.get_next(0, timeout=2)
+    finally:
+        timer.join()
+    assert frame.seq == 1
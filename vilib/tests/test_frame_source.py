@@ -0,0 +1,40 @@
+import cv2
+import numpy as np
+
+from vilib.frame_source import ImageDirSource, SyntheticSource
+
+
+def image_dir(tmp_path, good=2, bad=0):
+    for i in range(good):
+        cv2.imwrite(str(tmp_path / f'{i:02d}.png'), np.full((8, 8, 3), i, np.uint8))
+    for i in range(bad):
+        (tmp_path / f'bad-{i}.jpg').write_bytes(b'not an image')
+    return str(tmp_path)
+
+
+def test_image_dir_loops(tmp_path):
+    source = ImageDirSource(image_dir(tmp_path, good=2, bad=1), realtime=False)
+    source.start()
+    values = [source.read()[0][0, 0, 0] for _ in range(5)]
+    assert values == [0, 1, 0, 1, 0]
+
+
+def test_image_dir_ends_without_loop(tmp_path):
+    source = ImageDirSource(image_dir(tmp_path, good=2), realtime=False, loop=False)
+    source.start()
+    assert source.read()[0] is not None
+    assert source.read()[0] is not None
+    assert source.read() == (None, None)
+
+
+def test_image_dir_without_readable_images_ends(tmp_path):
+    source = ImageDirSource(image_dir(tmp_path, good=0, bad=3), realtime=False)
+    source.start()
+    assert source.read() == (None, None)
+
+
+def test_synthetic_source_default_size():
+    source = SyntheticSource(size=None, realtime=False)
+    source.start()
+    img, _ = source.read()
+    assert (img.shape[1], img.shape[0]) == SyntheticSource.DEFAULT_SIZE
@@ -0,0 +1,112 @@
+import numpy as np
+
+from vilib.frame_buffer import FrameRingBuffer
+from vilib.mjpeg import MjpegBroadcaster, Variant
+
+
+class CountingEncoder(object):
+    def __init__(self):
+        self.calls = 0
+
+    def encode(self, img, quality=None):
+        self.calls += 1
+        return b'jpeg-%d' % self.calls
+
+
+def broadcaster():
+    buf = FrameRingBuffer(4)
+    encoder = CountingEncoder()
+    mjpeg = MjpegBroadcaster(buf, lambda frame, annotate: frame.img, encoder=encoder)
+    return buf, encoder, mjpeg
+
+
+def frame():
+    return np.zeros((48, 64, 3), np.uint8)
+
+
+def test_variant_defaults():
+    assert MjpegBroadcaster.variant() == Variant('jpg', True, None, None)
+
+
+def test_variant_width_rounding():
+    assert MjpegBroadcaster.variant(width=645).width == 640
+    assert MjpegBroadcaster.variant(width=650).width == 640
+    assert MjpegBroadcaster.variant(width=3).width == 16
+    # not larger than the frame
+    assert MjpegBroadcaster.variant(width=1920, frame_width=1920).width is None
+    assert MjpegBroadcaster.variant(width=4000, frame_width=1920).width is None
+
+
+def test_variant_quality_rounding():
+    assert MjpegBroadcaster.variant(quality=62).quality == 60
+    assert MjpegBroadcaster.variant(quality=63).quality == 65
+    assert MjpegBroadcaster.variant(quality=0).quality == 5
+    assert MjpegBroadcaster.variant(quality=150).quality == 100
+    # only for JPEG
+    assert MjpegBroadcaster.variant('png', quality=60).quality is None
+
+
+def test_close_requests_share_a_variant():
+    a = MjpegBroadcaster.variant(width=641, quality=58)
+    b = MjpegBroadcaster.variant(width=655, quality=62)
+    assert a == b
+
+
+def test_variant_args():
+    variant, fps = MjpegBroadcaster.variant_args(
+        {'w': '640', 'q': '61', 'fps': '10', 'annotate': '0'}, frame_width=1920)
+    assert variant == Variant('jpg', False, 640, 60)
+    assert fps == 10.0
+    variant, fps = MjpegBroadcaster.variant_args({'w': 'x', 'fps': '-1'})
+    assert variant == Variant('jpg', True, None, None)
+    assert fps is None
+
+
+def test_etag_matches():
+    etag = 'abc-1-jpg-1-0-0'
+    assert MjpegBroadcaster.etag_matches('"abc-1-jpg-1-0-0"', etag)
+    assert MjpegBroadcaster.etag_matches('W/"abc-1-jpg-1-0-0"', etag)
+    assert MjpegBroadcaster.etag_matches('"other", "abc-1-jpg-1-0-0"', etag)
+    assert MjpegBroadcaster.etag_matches('*', etag)
+    assert not MjpegBroadcaster.etag_matches('"abc-2-jpg-1-0-0"', etag)
+    assert not MjpegBroadcaster.etag_matches(None, etag)
+    assert not MjpegBroadcaster.etag_matches('', etag)
+
+
+def test_etag_differs_by_frame_and_variant():
+    _, _, mjpeg = broadcaster()
+    key = Variant()
+    assert mjpeg.etag(key, 1) != mjpeg.etag(key, 2)
+    assert mjpeg.etag(key, 1) != mjpeg.etag(Variant(width=640), 1)
+    assert mjpeg.etag(key, 1) != mjpeg.etag(Variant(annotate=False), 1)
+
+
+def test_snapshot_before_the_first_frame():
+    _, _, mjpeg = broadcaster()
+    assert mjpeg.snapshot(Variant()) == (None, None)
+
+
+def test_snapshot_not_modified():
+    buf, encoder, mjpeg = broadcaster()
+    buf.put(frame())
+    etag, data = mjpeg.snapshot(Variant())
+    assert data == b'jpeg-1'
+    # the client copy is current: nothing is encoded
+    assert mjpeg.snapshot(Variant(), f'"{etag}"') == (etag, None)
+    assert encoder.calls == 1
+    # a new frame is sent again
+    buf.put(frame())
+    etag2, data = mjpeg.snapshot(Variant(), f'"{etag}"')
+    assert etag2 != etag
+    assert data == b'jpeg-2'
+
+
+def test_one_encode_per_frame_and_variant():
+    buf, encoder, mjpeg = broadcaster()
+    buf.put(frame())
+    mjpeg.get(Variant())
+    mjpeg.get(Variant())
+    mjpeg.snapshot(Variant())
+    assert encoder.calls == 1
+    mjpeg.get(Variant(width=32))
+    assert encoder.calls == 2
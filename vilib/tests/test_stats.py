@@ -0,0 +1,47 @@
+import threading
+
+from vilib.stats import PipelineStats
+
+
+def test_snapshot():
+    stats = PipelineStats(window=3)
+    for ms in (1, 2, 3, 4):
+        stats.record('capture', ms / 1000.0)
+    snapshot = stats.snapshot()['capture']
+    assert snapshot['count'] == 4
+    assert snapshot['window'] == 3
+    assert snapshot['p50_ms'] == 3.0
+    assert snapshot['max_ms'] == 4.0
+
+
+def test_reset():
+    stats = PipelineStats()
+    stats.record('capture', 0.001)
+    stats.reset()
+    assert stats.snapshot() == {}
+    stats.record('capture', 0.001)
+    assert stats.snapshot()['capture']['count'] == 1
+
+
+def test_reset_while_recording():
+    stats = PipelineStats(window=10)
+    errors = []
+    done = threading.Event()
+
+    def record():
+        try:
+            while not done.is_set():
+                stats.record('capture', 0.001)
+                stats.snapshot()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=record) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for _ in range(2000):
+        stats.reset()
+    done.set()
+    for thread in threads:
+        thread.join()
+    assert errors == []
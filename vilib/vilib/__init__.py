@@ -1,5 +1,5 @@
 #!/usr/bin/env python3
 from .vilib import Vilib
+from .frame_source import FrameSource, Picamera2Source, VideoFileSource, ImageDirSource, SyntheticSource
+from .shared_frame import SharedFrameStore
 from .version import __version__
-
-
@@ -0,0 +1,205 @@
+import time
+
+from .mjpeg import MjpegBroadcaster
+
+try:
+    import fcntl
+    import termios
+    SIOCOUTQ = termios.TIOCOUTQ # same request number on Linux
+except (ImportError, AttributeError):
+    fcntl = None
+
+
+def socket_queued(sock):
+    '''
+    Bytes written to a TCP socket that the client has not acknowledged yet,
+    the depth of its send queue (Linux), 0 when unknown
+    '''
+    if fcntl is None or sock is None:
+        return 0
+    try:
+        buf = fcntl.ioctl(sock.fileno(), SIOCOUTQ, b'\0\0\0\0')
+    except (OSError, ValueError):
+        return 0
+    return int.from_bytes(buf, 'little', signed=True)
+
+
+class AdaptiveStream(object):
+    '''
+    Per client rate control of a live stream
+
+    A stream over a degraded link used to keep pushing full quality frames
+    until the socket buffers filled up and the picture was seconds late.
+    This measures how long each frame takes to go into the socket (a send
+    blocks while the buffers are full, that is the back-pressure of the
+    link), the bytes still queued ahead of the client (socket_queued()) and
+    the rate the client actually receives. Their sum, the delay a new frame
+    sees, is kept under `target_latency` by moving the client along a
+    ladder of levels:
+
+    first the JPEG quality goes down to min_quality, then the width down to
+    min_width, then the frame rate down to min_fps. When the link has room
+    again, it climbs back up one level at a time.
+
+    Levels are normalised variants (MjpegBroadcaster.variant), so clients
+    on the same level share one encode.
+    '''
+
+    QUALITY_STEP = 10
+    WIDTH_STEP = 0.75
+    FPS_STEP = 0.5
+    DOWN_HOLD = 1.0 # seconds between two steps down, to see the effect of the last one
+    UP_HOLD = 3.0 # seconds of spare capacity before a step up
+
+    def __init__(self, frame_width, fmt='jpg', annotate=True, max_width=None, min_width=320,
+                 max_quality=90, min_quality=30, max_fps=None, min_fps=2, target_latency=0.3):
+        '''
+        :param frame_width: Capture width
+        :type frame_width: int
+        :param max_width: Best output width, None for the capture width
+        :type max_width: int
+        :param min_width: Smallest output width
+        :type min_width: int
+        :param max_quality: Best JPEG quality
+        :type max_quality: int
+        :param min_quality: Lowest JPEG quality
+        :type min_quality: int
+        :param max_fps: Best frame rate, None for every frame
+        :type max_fps: float
+        :param min_fps: Lowest frame rate
+        :type min_fps: float
+        :param target_latency: Time a frame may take to reach the socket, seconds
+        :type target_latency: float
+        '''
+        self.target_latency = target_latency
+        self.levels = self.ladder(frame_width, fmt, annotate, max_width, min_width,
+                                  max_quality, min_quality, max_fps, min_fps)
+        self.level = 0
+        self.latency = 0.0
+        self.throughput = 0.0
+        self.total = 0
+        self.rate_time = None
+        self.rate_delivered = 0
+        self.changed_time = time.monotonic()
+        self.spare_since = None
+
+    @classmethod
+    def ladder(cls, frame_width, fmt, annotate, max_width, min_width, max_quality, min_quality,
+               max_fps, min_fps):
+        '''The levels (Variant, fps), best first'''
+        def variant(width, quality):
+            return MjpegBroadcaster.variant(fmt, annotate, width, quality, frame_width=frame_width)
+
+        top_width = max_width or frame_width or min_width
+        min_width = min(min_width, top_width)
+        min_quality = min(min_quality, max_quality)
+        levels = []
+        quality = max_quality
+        while quality > min_quality:
+            levels.append((variant(top_width, quality), max_fps))
+            quality -= cls.QUALITY_STEP
+        width = top_width
+        while width > min_width:
+            levels.append((variant(width, min_quality), max_fps))
+            width = int(width * cls.WIDTH_STEP)
+        fps = max_fps
+        if fps is None or fps > min_fps:
+            # without a cap, the first step takes the source frame rate as 30
+            fps = fps or 30.0
+            while fps > min_fps:
+                levels.append((variant(min_width, min_quality), fps))
+                fps *= cls.FPS_STEP
+        levels.append((variant(min_width, min_quality), min_fps))
+
+        ladder = []
+        for level in levels:
+            if not ladder or ladder[-1] != level:
+                ladder.append(level)
+        return ladder
+
+    @classmethod
+    def from_args(cls, args, variant, fps, frame_width=None):
+        '''
+        The rate control a stream request asks for, eg:
+        ?adapt=1&minw=320&minq=30&minfps=2&latency=0.3
+        The w, q and fps arguments of the request are the best level.
+
+        :param args: Query arguments, a mapping of str
+        :type args: dict
+        :param variant: The requested variant
+        :type variant: Variant
+        :param fps: The requested frame rate cap
+        :type fps: float
+        :returns: The rate control, or None when adapt is not set
+        :rtype: AdaptiveStream
+        '''
+        if str(args.get('adapt', '0')).lower() in ('0', 'false', 'no', ''):
+            return None
+        bounds = {}
+        for arg, name, kind in (('minw', 'min_width', int), ('minq', 'min_quality', int),
+                                ('minfps', 'min_fps', float), ('latency', 'target_latency', float)):
+            try:
+                value = kind(args[arg])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if value > 0:
+                bounds[name] = value
+        return cls(frame_width, variant.fmt, variant.annotate, max_width=variant.width,
+                   max_quality=variant.quality or 90, max_fps=fps, **bounds)
+
+    @property
+    def variant(self):
+        return self.levels[self.level][0]
+
+    @property
+    def fps(self):
+        return self.levels[self.level][1]
+
+    def sent(self, size, duration, queued=0):
+        '''
+        Record a frame sent to the client and adapt the level
+
+        :param size: Bytes sent
+        :type size: int
+        :param duration: Time the send took (blocked on the socket), seconds
+        :type duration: float
+        :param queued: Bytes still queued for the client after the send,
+                       when the server can tell, see socket_queued()
+        :type queued: int
+        :returns: Whether the level changed
+        :rtype: bool
+        '''
+        now = time.monotonic()
+        # received rate of the client: bytes that left the send queue
+        self.total += size
+        delivered = self.total - queued
+        if self.rate_time is None:
+            self.rate_time, self.rate_delivered = now, delivered
+        elif now - self.rate_time >= 0.25:
+            rate = max(0, delivered - self.rate_delivered) / (now - self.rate_time)
+            self.throughput = rate if self.throughput == 0 else 0.7 * self.throughput + 0.3 * rate
+            self.rate_time, self.rate_delivered = now, delivered
+        # time to get into the queue, then to get through it
+        latency = duration
+        if queued and self.throughput > 0:
+            latency += queued / self.throughput
+        self.latency = 0.7 * self.latency + 0.3 * latency
+
+        if self.latency > self.target_latency:
+            self.spare_since = None
+            if self.level < len(self.levels) - 1 and now - self.changed_time >= self.DOWN_HOLD:
+                self.level += 1
+                self.changed_time = now
+                return True
+        elif self.latency < self.target_latency / 4:
+            if self.spare_since is None:
+                self.spare_since = now
+            if (self.level > 0 and now - self.spare_since >= self.UP_HOLD
+                    and now - self.changed_time >= self.UP_HOLD):
+                self.level -= 1
+                self.changed_time = now
+                self.spare_since = now
+                return True
+        else:
+            self.spare_since = None
+        return False
@@ -0,0 +1,96 @@
+import cv2
+import numpy as np
+
+
+class Annotations(object):
+    '''
+    Detection marks recorded as metadata instead of drawn
+
+    Mirrors the cv2 drawing functions the detectors use (rectangle, putText,
+    circle), so a detector can be handed either the cv2 module or an
+    Annotations as its `draw` target. The `img` argument is ignored when
+    recording. The marks are composited later with draw(), and only for the
+    outputs that want them, so raw outputs cost no draw calls.
+
+    Coordinates are recorded in the space of the image the detector ran on
+    and scaled by (scale_x, scale_y) when drawn on the full frame.
+    '''
+
+    def __init__(self, scale_x=1.0, scale_y=1.0):
+        self.scale_x = scale_x
+        self.scale_y = scale_y
+        self.items = []
+
+    def __len__(self):
+        return len(self.items)
+
+    def point(self, pt):
+        return (int(pt[0] * self.scale_x), int(pt[1] * self.scale_y))
+
+    def rectangle(self, img, pt1, pt2, color, thickness=1, lineType=cv2.LINE_8):
+        self.items.append(('rectangle', (self.point(pt1), self.point(pt2), color, thickness, lineType)))
+        return img
+
+    def putText(self, img, text, org, fontFace, fontScale, color, thickness=1, lineType=cv2.LINE_8):
+        self.items.append(('putText', (text, self.point(org), fontFace, fontScale, color, thickness, lineType)))
+        return img
+
+    def circle(self, img, center, radius, color, thickness=1, lineType=cv2.LINE_8):
+        radius = int(radius * self.scale_x)
+        self.items.append(('circle', (self.point(center), radius, color, thickness, lineType)))
+        return img
+
+    def pil_text(self, xy, text, fill, font):
+        '''Text drawn with PIL, for fonts cv2 can not render. fill is RGB'''
+        self.items.append(('pil_text', (self.point(xy), text, fill, font)))
+
+    def add(self, func):
+        '''Record a custom mark, func(img) draws it on the full frame'''
+        self.items.append(('func', func))
+
+    def draw(self, img):
+        '''
+        Draw the recorded marks on img, in place
+
+        :param img: The full frame (BGR)
+        :type img: numpy.ndarray
+        :returns: img, with the marks
+        :rtype: numpy.ndarray
+        '''
+        pil_items = []
+        for kind, args in self.items:
+            if kind == 'rectangle':
+                cv2.rectangle(img, *args)
+            elif kind == 'putText':
+                cv2.putText(img, *args)
+            elif kind == 'circle':
+                cv2.circle(img, *args)
+            elif kind == 'func':
+                args(img)
+            elif kind == 'pil_text':
+                pil_items.append(args)
+
+        if len(pil_items) > 0:
+            from PIL import Image, ImageDraw
+            pil_img = Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+            pil_draw = ImageDraw.Draw(pil_img)
+            for xy, text, fill, font in pil_items:
+                pil_draw.text(xy, text, fill, font=font)
+            img[:] = cv2.cvtColor(np.asarray(pil_img), cv2.COLOR_RGB2BGR)
+        return img
+
+
+def composite(img, annotations):
+    '''
+    Draw a list of Annotations on a copy of img
+
+    :returns: img itself when there is nothing to draw, otherwise a marked copy
+    :rtype: numpy.ndarray
+    '''
+    annotations = [a for a in annotations if a is not None and len(a) > 0]
+    if len(annotations) == 0:
+        return img
+    img = img.copy()
+    for a in annotations:
+        a.draw(img)
+    return img
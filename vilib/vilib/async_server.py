@@ -0,0 +1,193 @@
+import asyncio
+import time
+
+from aiohttp import web
+
+from .vilib import Vilib
+from .adaptive import AdaptiveStream, socket_queued
+
+'''
+asyncio streaming server, an alternative to the threaded Flask server of
+web.py for many concurrent viewers: every stream is a coroutine of one event
+loop instead of an OS thread. Frames come from the shared encoded frame cache
+(Vilib.mjpeg), the encoding stays in its thread.
+
+Select it with Vilib.display(web=True, server='aiohttp'). Needs aiohttp:
+
+    pip3 install aiohttp
+
+An aiohttp application can serve the routes itself instead, as a sub-app:
+
+    app.add_subapp('/vilib', async_server.create_app())
+    Vilib.display(local=False, web=True, server='mounted')
+'''
+
+BOUNDARY = b'--frame\r\nContent-Type: image/jpeg\r\n\r\n'
+
+TIP = '''
+    Please enable web display first:
+        {}
+'''
+
+
+def tip_response(call):
+    html = f"<html><style>p{{white-space: pre-wrap;}}</style><body><p>{TIP.format(call)}</p></body></html>"
+    return web.Response(text=html, content_type='text/html')
+
+
+class FrameNotifier(object):
+    '''Wakes up the streams of the event loop when a variant is encoded'''
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.events = {}
+
+    def event(self, key):
+        event = self.events.get(key)
+        if event is None:
+            event = self.events[key] = asyncio.Event()
+        return event
+
+    def notify(self, key, encoded):
+        # called from the encoding thread
+        self.loop.call_soon_threadsafe(self.wake, key)
+
+    def wake(self, key):
+        event = self.events.pop(key, None)
+        if event is not None:
+            event.set()
+
+    async def wait(self, key, after_seq, timeout=1):
+        '''The newest encoded frame of `key` once newer than after_seq, or None on timeout'''
+        encoded = Vilib.mjpeg.cache.get(key)
+        if encoded is not None and encoded.seq > after_seq:
+            return encoded
+        try:
+            await asyncio.wait_for(self.event(key).wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        encoded = Vilib.mjpeg.cache.get(key)
+        if encoded is not None and encoded.seq > after_seq:
+            return encoded
+        return None
+
+
+NOTIFIER = web.AppKey('notifier', FrameNotifier)
+
+
+async def snapshot_response(request, variant, content_type):
+    '''
+    Snapshot of the latest frame, cached per frame and variant. Clients
+    polling with If-None-Match get a 304 until a new frame is captured.
+    '''
+    # encodes in a worker thread when the frame was not encoded yet
+    loop = asyncio.get_running_loop()
+    etag, data = await loop.run_in_executor(None, Vilib.mjpeg.snapshot, variant,
+                                            request.headers.get('If-None-Match'))
+    headers = {
+        'Access-Control-Allow-Origin': '*',
+        'Cache-Control': 'no-cache',
+    }
+    if etag is None:
+        return web.Response(status=503, text='no frame yet', headers=headers)
+    headers['ETag'] = f'"{etag}"'
+    if data is None:
+        return web.Response(status=304, headers=headers)
+    return web.Response(body=data, content_type=content_type, headers=headers)
+
+
+async def video_feed(request):
+    if not Vilib.web_display_flag:
+        return tip_response('Vilib.display(web=True)')
+    variant, fps = Vilib.mjpeg.variant_args(request.query, 'jpg', Vilib.camera_width)
+    adaptive = AdaptiveStream.from_args(request.query, variant, fps, Vilib.camera_width)
+    if adaptive is not None:
+        variant, fps = adaptive.variant, adaptive.fps
+    notifier = request.app[NOTIFIER]
+
+    response = web.StreamResponse(headers={
+        'Content-Type': 'multipart/x-mixed-replace; boundary=frame',
+        'Access-Control-Allow-Origin': '*',
+    })
+    await response.prepare(request)
+    Vilib.mjpeg.subscribe(variant)
+    last_seq = 0
+    try:
+        while True:
+            # never send a frame twice, slow clients skip to the newest
+            encoded = await notifier.wait(variant, last_seq)
+            if encoded is None:
+                continue
+            last_seq = encoded.seq
+            send_time = time.monotonic()
+            # waits for the socket buffer to drain, the back-pressure of slow clients
+            await response.write(BOUNDARY + encoded.data + b'\r\n')
+            if adaptive is not None:
+                # the buffer of the event loop, then the kernel send queue
+                transport = request.transport
+                queued = 0
+                if transport is not None:
+                    queued = (transport.get_write_buffer_size()
+                              + socket_queued(transport.get_extra_info('socket')))
+                if adaptive.sent(len(encoded.data), time.monotonic() - send_time, queued):
+                    Vilib.mjpeg.unsubscribe(variant)
+                    variant, fps = adaptive.variant, adaptive.fps
+                    Vilib.mjpeg.subscribe(variant)
+            if fps is not None:
+                await asyncio.sleep(max(0, send_time + 1.0 / fps - time.monotonic()))
+    except ConnectionResetError:
+        pass
+    finally:
+        # also on cancellation (client gone, shutdown), which propagates
+        Vilib.mjpeg.unsubscribe(variant)
+    return response
+
+
+async def video_feed_jpg(request):
+    variant, _ = Vilib.mjpeg.variant_args(request.query, 'jpg', Vilib.camera_width)
+    return await snapshot_response(request, variant, 'image/jpeg')
+
+
+async def video_feed_png(request):
+    variant, _ = Vilib.mjpeg.variant_args(request.query, 'png', Vilib.camera_width)
+    return await snapshot_response(request, variant, 'image/png')
+
+
+async def qrcode_feed_png(request):
+    if not Vilib.web_qrcode_flag:
+        return tip_response('Vilib.display_qrcode(web=True)')
+    while Vilib.qrcode_img_encode is None:
+        await asyncio.sleep(0.2)
+    return web.Response(body=Vilib.qrcode_img_encode, content_type='image/png',
+                        headers={'Access-Control-Allow-Origin': '*'})
+
+
+async def on_startup(app):
+    notifier = FrameNotifier(asyncio.get_running_loop())
+    app[NOTIFIER] = notifier
+    Vilib.mjpeg.add_listener(notifier.notify)
+
+
+async def on_cleanup(app):
+    Vilib.mjpeg.remove_listener(app[NOTIFIER].notify)
+
+
+def create_app():
+    app = web.Application()
+    app.router.add_get('/mjpg', video_feed)
+    app.router.add_get('/mjpg.jpg', video_feed_jpg)
+    app.router.add_get('/mjpg.png', video_feed_png)
+    app.router.add_get('/qrcode.png', qrcode_feed_png)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+def web_camera_start(host='0.0.0.0', port=9000):
+    try:
+        Vilib.flask_start = True
+        # runs in the web display thread, signals belong to the main thread
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        web.run_app(create_app(), host=host, port=port, handle_signals=False, print=None)
+    except Exception as e:
+        print(e)
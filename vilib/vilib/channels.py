@@ -0,0 +1,280 @@
+import json
+import struct
+import threading
+import time
+
+from .mjpeg import MjpegBroadcaster
+from .adaptive import AdaptiveStream, socket_queued
+
+'''
+Binary message framing of the multiplexed WebSocket, one message per
+WebSocket binary frame, the first byte is the message type:
+
+TYPE_HELLO      0x00 + UTF-8 JSON: {"channels": [...], "telemetry": [...]},
+                sent once on connect
+TYPE_FRAME      0x01 + uint32 seq + float64 timestamp (little endian, capture
+                time in time.monotonic() seconds) + JPEG bytes
+TYPE_DETECTIONS 0x02 + UTF-8 JSON: {"seq", "results", "params"}, the latched
+                detector results and Vilib.detect_obj_parameter
+TYPE_TELEMETRY  0x03 + UTF-8 JSON: {"time", "sources": {name: reading}}
+
+The client controls its subscription with text messages of JSON, eg:
+
+    {"subscribe": ["frames", "telemetry"], "w": 640, "q": 60, "fps": 10}
+
+"frames" takes the same parameters as /mjpg (w, q, fps, annotate, and
+adapt with its bounds, see AdaptiveStream), a message with any of them
+replaces the frame parameters, one without keeps the current ones,
+"detections" and "telemetry" are sent at most `detections_fps` and
+`telemetry_fps` times per second. Channels not listed are not sent.
+'''
+TYPE_HELLO = 0x00
+TYPE_FRAME = 0x01
+TYPE_DETECTIONS = 0x02
+TYPE_TELEMETRY = 0x03
+
+FRAME_HEADER = struct.Struct('<BId')
+
+CHANNELS = ('frames', 'detections', 'telemetry')
+
+# the parameters of the "frames" channel in a control message
+FRAME_KEYS = ('w', 'q', 'fps', 'annotate', 'adapt', 'minw', 'minq', 'minfps', 'latency')
+
+
+def json_default(obj):
+    # numpy arrays and scalars of the detection results
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    return str(obj)
+
+
+def json_message(kind, value):
+    return bytes((kind,)) + json.dumps(value, default=json_default,
+                                       separators=(',', ':')).encode('utf-8')
+
+
+class ChannelSession(object):
+    '''Subscription state of one WebSocket client'''
+
+    def __init__(self):
+        self.channels = set()
+        self.request = {} # the frame parameters last asked for
+        self.variant = None
+        self.fps = None
+        self.adaptive = None
+        self.detections_fps = 10
+        self.telemetry_fps = 5
+        self.last_frame = 0
+        self.frame_time = 0.0
+        self.last_detections = None
+        self.detections_time = 0.0
+        self.last_telemetry = 0
+        self.telemetry_time = 0.0
+
+
+class ChannelMux(object):
+    '''
+    Frames, detection results and sensor telemetry over one WebSocket
+
+    A viewer of the dashboard used to need a MJPEG stream, polling for the
+    detection results and one more request per sensor reading. Here every
+    kind of data is a typed binary message of the same connection (see
+    TYPE_* above) and the client subscribes to the channels it shows.
+
+    JPEG frames come from the shared encoded frame cache (MjpegBroadcaster),
+    so WebSocket viewers and /mjpg viewers share the encodes. Telemetry
+    sources are plain functions registered with add_telemetry(), they are
+    sampled at most `telemetry_fps` times per second whatever the number of
+    clients, so sensors are never read once per viewer.
+    '''
+
+    def __init__(self, broadcaster, registry, params, telemetry_fps=5):
+        '''
+        :param broadcaster: The encoded frames
+        :type broadcaster: MjpegBroadcaster
+        :param registry: The detectors, their latched results are sent
+        :type registry: DetectorRegistry
+        :param params: The detection results dict (Vilib.detect_obj_parameter)
+        :type params: dict
+        :param telemetry_fps: Maximum sampling rate of the telemetry sources
+        :type telemetry_fps: float
+        '''
+        self.broadcaster = broadcaster
+        self.registry = registry
+        self.params = params
+        self.telemetry_fps = telemetry_fps
+        self.sources = {}
+        self.sample = (0, None)
+        self.lock = threading.Lock()
+
+    def add_telemetry(self, name, func):
+        '''
+        Register a telemetry source, func() returns a JSON serialisable
+        reading, eg: {'distance': 35.2, 'cliff': False}
+
+        :param name: Name of the source in the telemetry messages
+        :type name: str
+        :param func: Reads the source
+        :type func: callable
+        '''
+        with self.lock:
+            self.sources[name] = func
+
+    def remove_telemetry(self, name):
+        with self.lock:
+            self.sources.pop(name, None)
+
+    def telemetry(self):
+        '''
+        :returns: (sample number, reading of every source), sampled again
+                  when the last sample is older than 1 / telemetry_fps
+        :rtype: tuple
+        '''
+        with self.lock:
+            number, data = self.sample
+            if data is not None and time.time() - data['time'] < 1.0 / self.telemetry_fps:
+                return self.sample
+            sources = {}
+            for name, func in list(self.sources.items()):
+                try:
+                    sources[name] = func()
+                except Exception as e:
+                    sources[name] = {'error': str(e)}
+            self.sample = (number + 1, {'time': time.time(), 'sources': sources})
+            return self.sample
+
+    def detections(self):
+        '''
+        :returns: (version, record) of the detection results, the version
+                  changes whenever a detector latches a new result
+        :rtype: tuple
+        '''
+        results = {}
+        for name, result in list(self.registry.latched.items()):
+            results[name] = {
+                'seq': result['seq'],
+                'timestamp': result['timestamp'],
+                'elapsed_ms': round(result['elapsed'] * 1000, 3),
+            }
+        version = tuple(sorted((name, r['seq']) for name, r in results.items()))
+        seq = max([r['seq'] for r in results.values()], default=0)
+        return version, {'seq': seq, 'results': results, 'params': dict(self.params)}
+
+    def hello(self):
+        with self.lock:
+            telemetry = list(self.sources)
+        return json_message(TYPE_HELLO, {'channels': list(CHANNELS), 'telemetry': telemetry})
+
+    def control(self, session, message, frame_width=None):
+        '''Apply a subscription message of the client'''
+        try:
+            request = json.loads(message)
+        except (TypeError, ValueError):
+            return
+        if not isinstance(request, dict):
+            return
+        channels = request.get('subscribe')
+        subscribe = isinstance(channels, list) and all(isinstance(c, str) for c in channels)
+        if subscribe:
+            session.channels = set(channels) & set(CHANNELS)
+        for name in ('detections_fps', 'telemetry_fps'):
+            try:
+                setattr(session, name, max(0.1, float(request[name])))
+            except (KeyError, TypeError, ValueError):
+                pass
+        if any(key in request for key in FRAME_KEYS):
+            session.request = {key: request[key] for key in FRAME_KEYS if key in request}
+            variant, fps = MjpegBroadcaster.variant_args(session.request, 'jpg', frame_width)
+            session.adaptive = AdaptiveStream.from_args(session.request, variant, fps, frame_width)
+        elif subscribe:
+            # same frame parameters, the adaptive level is kept
+            variant, fps = MjpegBroadcaster.variant_args(session.request, 'jpg', frame_width)
+        else:
+            return
+        if session.adaptive is not None:
+            variant, fps = session.adaptive.variant, session.adaptive.fps
+        if 'frames' not in session.channels:
+            variant = None
+        if variant != session.variant:
+            if session.variant is not None:
+                self.broadcaster.unsubscribe(session.variant)
+            if variant is not None:
+                self.broadcaster.subscribe(variant)
+            session.variant = variant
+            session.last_frame = 0
+        session.fps = fps
+
+    def serve(self, ws, frame_width=None, tick=0.05):
+        '''
+        Serve one client until the connection closes (ws raises)
+
+        :param ws: The connection, with send(data) and receive(timeout)
+                   returning a message or None, eg: simple_websocket.Server
+        :param frame_width: Capture width, to normalise the frame variant
+        :type frame_width: int
+        :param tick: How long to wait for a frame or a message at once
+        :type tick: float
+        '''
+        session = ChannelSession()
+        ws.send(self.hello())
+        try:
+            while True:
+                # only wait for client messages when not waiting for frames
+                message = ws.receive(timeout=0 if session.variant is not None else tick)
+                while message is not None:
+                    self.control(session, message, frame_width)
+                    message = ws.receive(timeout=0)
+                if session.variant is not None:
+                    self.send_frame(ws, session, tick)
+                if 'detections' in session.channels:
+                    self.send_detections(ws, session)
+                if 'telemetry' in session.channels:
+                    self.send_telemetry(ws, session)
+        finally:
+            if session.variant is not None:
+                self.broadcaster.unsubscribe(session.variant)
+
+    def send_frame(self, ws, session, timeout):
+        if session.fps is not None:
+            # frame rate cap of the client, frames in between are skipped
+            delay = session.frame_time + 1.0 / session.fps - time.monotonic()
+            if delay > 0:
+                time.sleep(min(delay, timeout))
+                return
+        # a slow client gets the newest frame, skipping what it missed
+        encoded = self.broadcaster.wait(session.variant, session.last_frame, timeout)
+        if encoded is None:
+            return
+        session.last_frame = encoded.seq
+        session.frame_time = time.monotonic()
+        # blocks until the socket accepts it, the back-pressure of slow clients
+        ws.send(FRAME_HEADER.pack(TYPE_FRAME, encoded.seq & 0xffffffff, encoded.timestamp)
+                + encoded.data)
+        adaptive = session.adaptive
+        if adaptive is not None and adaptive.sent(len(encoded.data), time.monotonic() - session.frame_time,
+                                                  socket_queued(getattr(ws, 'sock', None))):
+            self.broadcaster.unsubscribe(session.variant)
+            session.variant, session.fps = adaptive.variant, adaptive.fps
+            self.broadcaster.subscribe(session.variant)
+
+    def send_detections(self, ws, session):
+        now = time.monotonic()
+        if now - session.detections_time < 1.0 / session.detections_fps:
+            return
+        version, record = self.detections()
+        if version == session.last_detections:
+            return
+        session.last_detections = version
+        session.detections_time = now
+        ws.send(json_message(TYPE_DETECTIONS, record))
+
+    def send_telemetry(self, ws, session):
+        now = time.monotonic()
+        if now - session.telemetry_time < 1.0 / session.telemetry_fps:
+            return
+        number, data = self.telemetry()
+        if number == session.last_telemetry:
+            return
+        session.last_telemetry = number
+        session.telemetry_time = now
+        ws.send(json_message(TYPE_TELEMETRY, data))
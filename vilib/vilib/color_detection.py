@@ -26,7 +26,7 @@ color_obj_parameter['h'] = 0  # the largest color block pixel height
 color_obj_parameter['n'] = 0  # Number of color blocks detected
 
 
-def color_detect_work(img, width, height, color_name, rectangle_color=(0, 0, 255)):
+def color_detect_work(img, width, height, color_name, rectangle_color=(0, 0, 255), zoom=4, draw=cv2):
     '''
     Color detection with opencv
 
@@ -40,16 +40,22 @@ def color_detect_work(img, width, height, color_name, rectangle_color=(0, 0, 255
     :type color_name: str
     :param rectangle_color: The color (BGR, tuple) of rectangle. Eg: (0, 0, 255).
     :type color_name: tuple
+    :param zoom: Reduction ratio applied before detection, 1 for an already small image
+    :type zoom: int
+    :param draw: Where marks go: cv2 draws on img, an Annotations records them
+    :type draw: module or Annotations
     :returns: The image returned after detection.
     :rtype: Binary list
     '''
     color_obj_parameter['color'] = color_name   
     
     # Reduce image for faster recognition 
-    zoom = 4 # reduction ratio
-    width_zoom = int(width / zoom)
-    height_zoom = int(height / zoom)
-    resize_img = cv2.resize(img, (width_zoom, height_zoom), interpolation=cv2.INTER_LINEAR)
+    if zoom > 1:
+        width_zoom = int(width / zoom)
+        height_zoom = int(height / zoom)
+        resize_img = cv2.resize(img, (width_zoom, height_zoom), interpolation=cv2.INTER_LINEAR)
+    else:
+        resize_img = img
     
     # Convert the image in BGR to HSV
     hsv = cv2.cvtColor(resize_img, cv2.COLOR_BGR2HSV) 
@@ -100,14 +106,14 @@ def color_detect_work(img, width, height, color_name, rectangle_color=(0, 0, 255
                 w = w * zoom
                 h = h * zoom
                 # Draw rectangle around  the color block
-                cv2.rectangle(img, # image
+                draw.rectangle(img, # image
                             (x, y), # start position
                             (x+w, y+h), # end position
                             rectangle_color, # color
                             2, # thickness
                         )
                 # Draw color name
-                cv2.putText(img, # image
+                draw.putText(img, # image
                             color_name, # text 
                             (x, y-5), # start position
                             cv2.FONT_HERSHEY_SIMPLEX, # font
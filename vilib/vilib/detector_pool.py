@@ -0,0 +1,88 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class DetectorPool(object):
+    '''
+    Run detectors in worker threads, decoupled from the capture loop
+
+    A scheduler thread waits for new frames in the frame ring buffer and hands
+    the latest one to every detector that is idle and due according to its
+    budget in the registry, higher priority first. A busy detector simply
+    skips the frames that arrive meanwhile, so a slow detector never holds
+    back capture or the other detectors. Detectors never write to the live
+    frames, they get a copy or a resized frame.
+
+    The result of each run is latched in `registry.latched` together with
+    the sequence number and timestamp of the frame it came from.
+    '''
+
+    def __init__(self, frame_buffer, registry, workers=2):
+        '''
+        :param frame_buffer: The frame source
+        :type frame_buffer: FrameRingBuffer
+        :param registry: The detectors to run
+        :type registry: DetectorRegistry
+        :param workers: Number of worker threads
+        :type workers: int
+        '''
+        self.frame_buffer = frame_buffer
+        self.registry = registry
+        self.workers = workers
+        self.busy = set()
+        self.lock = threading.Lock()
+        self.running = False
+        self.thread = None
+        self.executor = None
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.executor = ThreadPoolExecutor(max_workers=self.workers,
+                                           thread_name_prefix='vilib_detect')
+        self.thread = threading.Thread(name='vilib_detect_scheduler', target=self.schedule)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(1)
+            self.thread = None
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+    def schedule(self):
+        last_seq = 0
+        while self.running:
+            frame = self.frame_buffer.wait_latest(last_seq, timeout=0.5)
+            if frame is None:
+                continue
+            last_seq = frame.seq
+            now = time.monotonic()
+            for detector in self.registry.due(frame.seq, now):
+                with self.lock:
+                    if detector.name in self.busy:
+                        continue
+                    self.busy.add(detector.name)
+                self.registry.mark(detector, frame.seq, now)
+                try:
+                    self.executor.submit(self.run, detector, frame)
+                except RuntimeError:
+                    # executor shut down while stopping
+                    with self.lock:
+                        self.busy.discard(detector.name)
+                    return
+
+    def run(self, detector, frame):
+        try:
+            self.registry.run(detector, frame.img, frame.seq, frame.timestamp,
+                              copy=True, lores=frame.lores)
+        except Exception as e:
+            print(f"detector {detector.name} failed:\n  {e}")
+        finally:
+            with self.lock:
+                self.busy.discard(detector.name)
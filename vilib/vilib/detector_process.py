@@ -0,0 +1,282 @@
+import importlib
+import multiprocessing
+import sys
+import threading
+import time
+import types
+from collections import namedtuple
+
+import cv2
+
+from .annotation import Annotations
+from .shared_frame import SharedFrameStore
+
+'''
+How to run a detector in a worker process:
+
+func:   func(img, annotations), a module level function (or staticmethod),
+        records its marks in annotations
+setup:  called once in the worker before the first frame (loads the model),
+        or None
+
+func and setup are pickled into a spawned worker that does not run the
+main script, so they must live in an importable module, not in __main__.
+shared: the result containers func writes, as (module, attribute path)
+        pairs, eg: ('vilib.image_classification', 'image_classification_obj_parameter').
+        Their content is sent back after each run and copied into the same
+        containers of the main process.
+'''
+ProcessSpec = namedtuple('ProcessSpec', ['func', 'setup', 'shared'], defaults=(None, ()))
+
+
+def resolve(path):
+    module, attrs = path
+    obj = importlib.import_module(module)
+    for attr in attrs.split('.'):
+        obj = getattr(obj, attr)
+    return obj
+
+
+def snapshot(container, last=None):
+    '''
+    The content of a result container. For a dict, only the entries that
+    changed since `last` (the previous snapshot), so that entries the worker
+    inherited from the main process but does not own are never sent back.
+    '''
+    if isinstance(container, dict):
+        if last is None:
+            return dict(container)
+        return {k: v for k, v in container.items() if k not in last or last[k] is not v}
+    return list(container)
+
+
+def update(container, value):
+    if isinstance(container, dict):
+        container.update(value)
+    else:
+        container[:] = value
+
+
+def start_worker(process):
+    '''
+    Start a spawned worker without running the main script in it: vilib
+    scripts usually have no `if __name__ == '__main__'` guard, and a worker
+    only needs the importable modules of its ProcessSpec
+    '''
+    main = sys.modules['__main__']
+    sys.modules['__main__'] = types.ModuleType('__main__')
+    try:
+        process.start()
+    finally:
+        sys.modules['__main__'] = main
+
+
+def worker_main(name, spec, store_name, conn):
+    '''
+    Worker process loop: receive (seq, size) requests, run the detector on
+    frame `seq` of the shared frame store at input resolution `size` and
+    send back a compact result record
+    '''
+    # started by the writer, so it shares its resource tracker
+    store = SharedFrameStore(store_name, create=False, untrack=False)
+    try:
+        if spec.setup is not None:
+            spec.setup()
+        containers = [resolve(path) for path in spec.shared]
+        last = [snapshot(c) for c in containers]
+    except Exception as e:
+        conn.send(('error', 0, f'setup failed: {e}'))
+        return
+
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if request is None:
+            break
+        seq, size = request
+
+        # the frame is published to shared memory right after the request
+        deadline = time.monotonic() + 0.5
+        while store.seq < seq and not store.retired and time.monotonic() < deadline:
+            time.sleep(0.001)
+        if store.retired:
+            # the writer made a new block for larger frames
+            try:
+                new_store = SharedFrameStore(store_name, create=False, untrack=False)
+            except (FileNotFoundError, ValueError):
+                conn.send(('skip', seq, None))
+                continue
+            store.close()
+            store = new_store
+            while store.seq < seq and time.monotonic() < deadline:
+                time.sleep(0.001)
+        # a private copy: the slot is reused while a slow detector still runs
+        frame = store.get(seq, copy=True)
+        if frame is None:
+            conn.send(('skip', seq, None))
+            continue
+
+        try:
+            img = frame.img
+            if size is not None and tuple(size) != (img.shape[1], img.shape[0]):
+                src = cv2.resize(img, tuple(size), interpolation=cv2.INTER_AREA)
+            else:
+                src = img
+            scale_x = img.shape[1] / src.shape[1]
+            scale_y = img.shape[0] / src.shape[0]
+            annotations = Annotations(scale_x, scale_y)
+            st = time.monotonic()
+            spec.func(src, annotations)
+            elapsed = time.monotonic() - st
+            values = [snapshot(c, l) for c, l in zip(containers, last)]
+            last = [snapshot(c) for c in containers]
+            conn.send(('result', seq, (elapsed, annotations, values, scale_x, scale_y)))
+        except Exception as e:
+            conn.send(('error', seq, str(e)))
+    store.close()
+
+
+class ProcessDetectorPool(object):
+    '''
+    Run heavy detectors in dedicated worker processes
+
+    Python level work of the detectors (mediapipe, tflite pre/post processing)
+    no longer serialises on the GIL of the capture process, so several heavy
+    detectors can run on separate cores next to the capture loop. Workers
+    map the frames from a SharedFrameStore (no pickling of images) and send
+    back compact records: the marks, as an Annotations, and the content of
+    the detector result containers.
+
+    As with DetectorPool, a scheduler thread hands the latest frame to every
+    idle detector that is due according to its budget, busy detectors skip
+    frames. Results are latched in the registry with the seq and timestamp
+    of their frame.
+    '''
+
+    def __init__(self, frame_buffer, shared_frames, registry, specs, analysis_size=None):
+        '''
+        :param frame_buffer: The in-process frame buffer, for new frame notifications
+        :type frame_buffer: FrameRingBuffer
+        :param shared_frames: The store the workers read the frames from
+        :type shared_frames: SharedFrameStore
+        :param registry: The registered detectors
+        :type registry: DetectorRegistry
+        :param specs: How to run each detector, by detector name
+        :type specs: dict
+        :param analysis_size: Default input resolution of the detectors,
+                              None for the full frame
+        :type analysis_size: tuple
+        '''
+        self.frame_buffer = frame_buffer
+        self.shared_frames = shared_frames
+        self.registry = registry
+        self.specs = specs
+        self.analysis_size = analysis_size
+        self.workers = {}
+        self.pending = {}
+        self.containers = {}
+        self.lock = threading.Lock()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        if self.running:
+            return
+        # spawn, not fork: forking the capture process (capture, web server
+        # and encoder threads) can deadlock a child on a lock held at fork time
+        ctx = multiprocessing.get_context('spawn')
+        try:
+            for name, spec in self.specs.items():
+                self.start_worker(ctx, name, spec)
+        except BaseException:
+            # no half started pool: stop the workers already running
+            self.stop()
+            raise
+        self.running = True
+        self.thread = threading.Thread(name='vilib_detect_process_scheduler', target=self.schedule)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def start_worker(self, ctx, name, spec):
+        self.registry.get(name) # raises on unknown detectors
+        self.containers[name] = [resolve(path) for path in spec.shared]
+        conn, child_conn = ctx.Pipe()
+        process = ctx.Process(target=worker_main, name=f'vilib_detect_{name}',
+                              args=(name, spec, self.shared_frames.name, child_conn))
+        process.daemon = True
+        try:
+            start_worker(process)
+        except BaseException:
+            conn.close()
+            raise
+        finally:
+            child_conn.close()
+        reader = threading.Thread(name=f'vilib_detect_{name}_results',
+                                  target=self.receive, args=(name, conn))
+        reader.daemon = True
+        self.workers[name] = (process, conn, reader)
+        self.registry.configure(name, process=True)
+        reader.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(1)
+            self.thread = None
+        for name, (process, conn, reader) in self.workers.items():
+            self.registry.configure(name, process=False)
+            try:
+                conn.send(None)
+            except (OSError, ValueError):
+                pass
+            process.join(1)
+            if process.is_alive():
+                process.terminate()
+            conn.close()
+        self.workers = {}
+        self.pending = {}
+
+    def schedule(self):
+        last_seq = 0
+        while self.running:
+            frame = self.frame_buffer.wait_latest(last_seq, timeout=0.5)
+            if frame is None:
+                continue
+            last_seq = frame.seq
+            now = time.monotonic()
+            for detector in self.registry.due(frame.seq, now, process=True):
+                if detector.name not in self.workers:
+                    continue
+                with self.lock:
+                    if detector.name in self.pending:
+                        continue
+                    self.pending[detector.name] = (frame.seq, frame.timestamp)
+                self.registry.mark(detector, frame.seq, now)
+                size = detector.size if detector.size is not None else self.analysis_size
+                try:
+                    self.workers[detector.name][1].send((frame.seq, size))
+                except (OSError, ValueError):
+                    # worker gone
+                    with self.lock:
+                        self.pending.pop(detector.name, None)
+
+    def receive(self, name, conn):
+        while True:
+            try:
+                kind, seq, record = conn.recv()
+            except (EOFError, OSError):
+                break
+            with self.lock:
+                _, timestamp = self.pending.pop(name, (seq, 0.0))
+            if kind == 'error':
+                print(f"detector {name} failed:\n  {record}")
+            elif kind == 'result':
+                elapsed, annotations, values, scale_x, scale_y = record
+                for container, value in zip(self.containers[name], values):
+                    update(container, value)
+                detector = self.registry.detectors.get(name)
+                if detector is not None:
+                    self.registry.finish(detector, seq, timestamp, elapsed,
+                                         annotations, scale_x, scale_y)
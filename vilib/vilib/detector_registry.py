@@ -0,0 +1,256 @@
+import threading
+import time
+
+import cv2
+
+from .annotation import Annotations
+
+
+class Detector(object):
+    '''A registered detector and its scheduling budget'''
+
+    def __init__(self, name, func, rate=None, skip=1, size=None, priority=0,
+                 params=None, prefix='', keys=None, enabled=True, annotate=False):
+        self.name = name
+        self.func = func
+        self.annotate = annotate
+        self.rate = rate
+        self.skip = skip
+        self.size = size
+        self.priority = priority
+        self.params = params
+        self.prefix = prefix
+        self.keys = keys
+        self.enabled = enabled
+        self.process = False # run by a ProcessDetectorPool worker
+
+        self.last_seq = 0
+        self.last_time = 0.0
+
+
+class DetectorRegistry(object):
+    '''
+    Registry of the detectors run on the camera frames
+
+    Every detector declares a budget: a target rate in Hz and/or a frame skip
+    (run on every n-th frame), an input resolution and a priority. due()
+    picks the detectors whose budget allows them to run on a frame, higher
+    priority first. A detector that is not due keeps its last result.
+
+    Without an input resolution a detector gets the low resolution analysis
+    image when the frame has one, otherwise the full frame.
+
+    If a detector has `params` (its result dict, eg: face_obj_parameter), the
+    entries listed in `keys` are copied into `results` as prefix + key after
+    each run, with coordinates scaled back to the full frame size.
+
+    An `annotate` detector is called as func(img, draw) and records its marks
+    in `draw` (an Annotations) instead of drawing on img. The marks are
+    latched with the result, see annotations().
+
+    A drawing detector (annotate=False) only marks the frame when it runs on
+    the full frame: with an input resolution or an analysis image it draws
+    on the reduced image, which is dropped after the run, so its drawings
+    are lost. Use annotate=True for detectors with a reduced input.
+    '''
+
+    COORD_KEYS = ('x', 'y', 'w', 'h')
+
+    def __init__(self, results):
+        '''
+        :param results: The dict results are published into, eg: Vilib.detect_obj_parameter
+        :type results: dict
+        '''
+        self.results = results
+        self.detectors = {}
+        self.latched = {}
+        self.lock = threading.Lock()
+        self.stats = None # PipelineStats, records 'detect.<name>'
+
+    def register(self, name, func, rate=None, skip=1, size=None, priority=0,
+                 params=None, prefix='', keys=None, enabled=True, annotate=False):
+        '''
+        Register a detector, replacing any detector of the same name
+
+        :param name: Detector name
+        :type name: str
+        :param func: func(img) runs the detection on img and may draw on it.
+                     It returns the image (or None)
+        :type func: callable
+        :param rate: Target runs per second, None for as often as possible
+        :type rate: float
+        :param skip: Run on every `skip`-th frame
+        :type skip: int
+        :param size: Input resolution (width, height), None for the analysis
+                     image or the full frame. The drawings of a detector
+                     without annotate on a reduced input are lost
+        :type size: tuple
+        :param priority: Higher priority detectors run first
+        :type priority: int
+        :param params: The result dict of the detector
+        :type params: dict
+        :param prefix: Prefix of the published result keys, eg: 'human_'
+        :type prefix: str
+        :param keys: The keys of `params` to publish
+        :type keys: list
+        :param enabled: Whether the detector runs
+        :type enabled: bool
+        :param annotate: Whether func(img, draw) records its marks in draw
+                         instead of drawing on img
+        :type annotate: bool
+        :returns: The registered detector
+        :rtype: Detector
+        '''
+        detector = Detector(name, func, rate=rate, skip=skip, size=size,
+                            priority=priority, params=params, prefix=prefix,
+                            keys=keys, enabled=enabled, annotate=annotate)
+        with self.lock:
+            self.detectors[name] = detector
+        return detector
+
+    def unregister(self, name):
+        with self.lock:
+            self.detectors.pop(name, None)
+        self.latched.pop(name, None)
+
+    def get(self, name):
+        if name not in self.detectors:
+            raise ValueError(f'unknown detector: {name}')
+        return self.detectors[name]
+
+    def enable(self, name, flag=True):
+        self.get(name).enabled = flag
+
+    def configure(self, name, **kwargs):
+        '''
+        Change attributes of a registered detector, eg: configure('face', rate=2)
+        '''
+        detector = self.get(name)
+        for key, value in kwargs.items():
+            if not hasattr(detector, key):
+                raise ValueError(f'unknown detector attribute: {key}')
+            setattr(detector, key, value)
+
+    def due(self, seq, now=None, process=False):
+        '''
+        :param seq: Sequence number of the frame
+        :type seq: int
+        :param now: Current time.monotonic(), default now
+        :type now: float
+        :param process: Pick the detectors run in worker processes instead
+                        of the in-process ones
+        :type process: bool
+        :returns: The enabled detectors whose budget allows them to run on
+                  frame `seq`, by descending priority
+        :rtype: list
+        '''
+        if now is None:
+            now = time.monotonic()
+        with self.lock:
+            detectors = list(self.detectors.values())
+        due = []
+        for detector in detectors:
+            if not detector.enabled or detector.process != process:
+                continue
+            if detector.skip > 1 and detector.last_seq > 0 \
+                and seq - detector.last_seq < detector.skip:
+                continue
+            if detector.rate and now - detector.last_time < 1.0 / detector.rate:
+                continue
+            due.append(detector)
+        due.sort(key=lambda d: -d.priority)
+        return due
+
+    def mark(self, detector, seq, now=None):
+        '''Charge a run on frame `seq` to the budget of `detector`'''
+        detector.last_seq = seq
+        detector.last_time = time.monotonic() if now is None else now
+
+    def run(self, detector, img, seq=0, timestamp=0.0, copy=False, lores=None):
+        '''
+        Run `detector` on `img` at its input resolution and publish its result
+
+        :param copy: Give a drawing detector a copy when it takes the full
+                     frame or the analysis image, so that they are never
+                     written to
+        :type copy: bool
+        :param lores: The low resolution analysis image of the frame
+        :type lores: numpy.ndarray
+        :returns: The (possibly marked) full frame
+        :rtype: numpy.ndarray
+        '''
+        height, width = img.shape[:2]
+        # annotating detectors never write to their input
+        copy = copy and not detector.annotate
+        if detector.size is None:
+            src = img if lores is None else lores
+        else:
+            size = tuple(detector.size)
+            # resize from the analysis image when it is large enough
+            base = img
+            if lores is not None and lores.shape[1] >= size[0] and lores.shape[0] >= size[1]:
+                base = lores
+            if size != (base.shape[1], base.shape[0]):
+                src = cv2.resize(base, size, interpolation=cv2.INTER_LINEAR)
+            else:
+                src = base
+        if copy and (src is img or src is lores):
+            src = src.copy()
+
+        scale_x = width / src.shape[1]
+        scale_y = height / src.shape[0]
+        annotations = None
+        st = time.monotonic()
+        if detector.annotate:
+            annotations = Annotations(scale_x, scale_y)
+            detector.func(src, annotations)
+        else:
+            out = detector.func(src)
+        elapsed = time.monotonic() - st
+
+        self.finish(detector, seq, timestamp, elapsed, annotations, scale_x, scale_y)
+        if not detector.annotate and src is img and out is not None:
+            return out
+        return img
+
+    def finish(self, detector, seq, timestamp, elapsed, annotations=None, scale_x=1.0, scale_y=1.0):
+        '''Publish and latch the result of a run of `detector` on frame `seq`'''
+        if self.stats is not None:
+            self.stats.record('detect.' + detector.name, elapsed)
+        self.publish(detector, scale_x, scale_y)
+        self.latched[detector.name] = {
+            'seq': seq,
+            'timestamp': timestamp,
+            'elapsed': elapsed,
+            'annotations': annotations,
+        }
+
+    def annotations(self):
+        '''
+        :returns: The latest marks of the enabled detectors, by name
+        :rtype: dict
+        '''
+        marks = {}
+        for name, result in list(self.latched.items()):
+            detector = self.detectors.get(name)
+            if detector is not None and detector.enabled \
+                and result.get('annotations') is not None:
+                marks[name] = result['annotations']
+        return marks
+
+    def run_due(self, img, seq=0, timestamp=0.0, lores=None):
+        '''Run all detectors due on frame `seq` in the calling thread'''
+        now = time.monotonic()
+        for detector in self.due(seq, now):
+            self.mark(detector, seq, now)
+            img = self.run(detector, img, seq, timestamp, lores=lores)
+        return img
+
+    def publish(self, detector, scale_x=1.0, scale_y=1.0):
+        if detector.params is None or detector.keys is None:
+            return
+        for key in detector.keys:
+            value = detector.params[key]
+            if key in self.COORD_KEYS and (scale_x != 1.0 or scale_y != 1.0):
+                value = int(value * (scale_x if key in ('x', 'w') else scale_y))
+            self.results[detector.prefix + key] = value
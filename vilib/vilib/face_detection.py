@@ -28,7 +28,7 @@ def set_face_detection_model(model_path):
     face_cascade = cv2.CascadeClassifier(face_model_path)
 
 
-def face_detect(img, width, height, rectangle_color=(255, 0, 0)):
+def face_detect(img, width, height, rectangle_color=(255, 0, 0), zoom=2, draw=cv2):
     '''
     Face detection with opencv
 
@@ -40,15 +40,21 @@ def face_detect(img, width, height, rectangle_color=(255, 0, 0)):
     :type height: int
     :param rectangle_color: The color (BGR, tuple) of rectangle. Eg: (255, 0, 0).
     :type color_name: tuple
+    :param zoom: Reduction ratio applied before detection, 1 for an already small image
+    :type zoom: int
+    :param draw: Where marks go: cv2 draws on img, an Annotations records them
+    :type draw: module or Annotations
     :returns: The image returned after detection.
     :rtype: Binary list
     '''
     global face_cascade
     # Reduce image for faster recognition 
-    zoom = 2
-    width_zoom = int(width / zoom)
-    height_zoom = int(height / zoom)
-    resize_img = cv2.resize(img, (width_zoom, height_zoom), interpolation=cv2.INTER_LINEAR)
+    if zoom > 1:
+        width_zoom = int(width / zoom)
+        height_zoom = int(height / zoom)
+        resize_img = cv2.resize(img, (width_zoom, height_zoom), interpolation=cv2.INTER_LINEAR)
+    else:
+        resize_img = img
     
     # Converting the image to grayscale
     gray_img = cv2.cvtColor(resize_img, cv2.COLOR_BGR2GRAY) 
@@ -71,7 +77,7 @@ def face_detect(img, width, height, rectangle_color=(255, 0, 0)):
             w = w * zoom
             h = h * zoom
             # Draw rectangle around the face
-            cv2.rectangle(img, (x, y), (x+w, y+h), rectangle_color, 2)
+            draw.rectangle(img, (x, y), (x+w, y+h), rectangle_color, 2)
             
             # Save the attribute of the largest color block
             object_area = w * h
@@ -0,0 +1,125 @@
+import threading
+import time
+from collections import namedtuple
+
+'''
+A captured frame: monotonic sequence number, capture timestamp, image, the
+optional low resolution analysis image of the same frame and the optional
+metadata dict (detection marks by detector name)
+'''
+Frame = namedtuple('Frame', ['seq', 'timestamp', 'img', 'lores', 'meta'], defaults=(None, None))
+
+
+class FrameRingBuffer(object):
+    '''
+    N-slot ring buffer of captured frames
+
+    Each published frame gets a sequence number (starting at 1) and a capture
+    timestamp (time.monotonic()). Readers get a reference to the frame array,
+    never a copy. Frames are stored by reference, the sources hand out a new
+    array per frame, so a reader may keep using an array after its slot has
+    been recycled; is_valid() tells whether the frame is still held.
+    '''
+
+    def __init__(self, size=4):
+        '''
+        :param size: Number of slots
+        :type size: int
+        '''
+        if size < 2:
+            raise ValueError('ring buffer needs at least 2 slots')
+        self.size = size
+        self.slots = [Frame(0, 0.0, None) for _ in range(size)]
+        self.seq = 0
+        self.cond = threading.Condition()
+
+    def put(self, img, timestamp=None, lores=None, meta=None):
+        '''
+        Publish a frame, stored by reference (no copy)
+
+        :param img: The frame
+        :type img: numpy.ndarray
+        :param timestamp: Capture time in time.monotonic() seconds, default now
+        :type timestamp: float
+        :param lores: The low resolution analysis image of the frame
+        :type lores: numpy.ndarray
+        :param meta: Metadata of the frame
+        :type meta: dict
+        :returns: The sequence number of the published frame
+        :rtype: int
+        '''
+        if timestamp is None:
+            timestamp = time.monotonic()
+        with self.cond:
+            seq = self.seq + 1
+            self.slots[seq % self.size] = Frame(seq, timestamp, img, lores, meta)
+            self.seq = seq
+            self.cond.notify_all()
+        return seq
+
+    def latest(self):
+        '''
+        :returns: The newest frame, or None if nothing was published yet
+        :rtype: Frame
+        '''
+        frame = self.slots[self.seq % self.size]
+        if frame.seq == 0:
+            return None
+        return frame
+
+    def get(self, seq):
+        '''
+        :returns: The frame with sequence number `seq`, or None if it was
+                  already recycled or not yet published
+        :rtype: Frame
+        '''
+        frame = self.slots[seq % self.size]
+        if seq <= 0 or frame.seq != seq:
+            return None
+        return frame
+
+    def is_valid(self, seq):
+        '''Whether frame `seq` is still held in the buffer'''
+        return self.get(seq) is not None
+
+    def wait(self, after_seq, timeout=None):
+        '''
+        Block until a frame newer than `after_seq` is published
+
+        :returns: True if there is a newer frame, False on timeout
+        :rtype: bool
+        '''
+        with self.cond:
+            return self.cond.wait_for(lambda: self.seq > after_seq, timeout)
+
+    def get_next(self, after_seq, timeout=None):
+        '''
+        Get the frame right after `after_seq`, waiting for it if needed. If
+        the reader fell behind and that frame was recycled, the oldest frame
+        still held is returned, so skipped frames show up as a gap in seq.
+
+        :returns: The next frame, or None on timeout
+        :rtype: Frame
+        '''
+        if not self.wait(after_seq, timeout):
+            return None
+        frame = self.get(after_seq + 1)
+        if frame is None:
+            seq = self.seq
+            for s in range(max(after_seq + 1, seq - self.size + 1), seq + 1):
+                frame = self.get(s)
+                if frame is not None:
+                    break
+        return frame
+
+    def wait_latest(self, after_seq, timeout=None):
+        '''
+        Get the newest frame once it is newer than `after_seq`, skipping any
+        frames in between
+
+        :returns: The newest frame, or None on timeout
+        :rtype: Frame
+        '''
+        if not self.wait(after_seq, timeout):
+            return None
+        return self.latest()
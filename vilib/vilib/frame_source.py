@@ -0,0 +1,295 @@
+import os
+import time
+
+import cv2
+import numpy as np
+
+
+class FrameSource(object):
+    '''
+    Base class of the frame sources behind Vilib.camera()
+
+    A source is opened with start(), yields BGR frames with read() and is
+    released with close(). read() returns (img, lores), where lores is the
+    low resolution analysis image when the source produces one itself (else
+    None, and Vilib resizes img), or (None, None) when the source is
+    exhausted.
+
+    File and synthetic sources run at the source frame rate when `realtime`
+    is True, or as fast as possible otherwise (for benchmarks).
+    '''
+
+    def __init__(self, size=(640, 480), analysis_size=None, hflip=False, vflip=False):
+        '''
+        :param size: Frame size (width, height), None keeps the source size
+        :type size: tuple
+        :param analysis_size: Size of the analysis image, None for no analysis image
+        :type analysis_size: tuple
+        :param hflip: Flip horizontally
+        :type hflip: bool
+        :param vflip: Flip vertically
+        :type vflip: bool
+        '''
+        self.size = size
+        self.analysis_size = analysis_size
+        self.hflip = hflip
+        self.vflip = vflip
+
+    def start(self):
+        pass
+
+    def read(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def transform(self, img):
+        '''Apply size and flips to a decoded frame'''
+        if self.size is not None and (img.shape[1], img.shape[0]) != tuple(self.size):
+            img = cv2.resize(img, tuple(self.size), interpolation=cv2.INTER_AREA)
+        if self.hflip and self.vflip:
+            img = cv2.flip(img, -1)
+        elif self.hflip:
+            img = cv2.flip(img, 1)
+        elif self.vflip:
+            img = cv2.flip(img, 0)
+        return img
+
+
+class Pacer(object):
+    '''Sleeps between frames to hold a frame rate, no-op when fps is None'''
+
+    def __init__(self, fps=None):
+        self.fps = fps
+        self.next_time = None
+
+    def wait(self):
+        if not self.fps:
+            return
+        now = time.monotonic()
+        if self.next_time is None or now - self.next_time > 1.0:
+            # first frame, or fell far behind: restart the schedule
+            self.next_time = now
+        elif self.next_time > now:
+            time.sleep(self.next_time - now)
+        self.next_time += 1.0 / self.fps
+
+
+class Picamera2Source(FrameSource):
+    '''Raspberry Pi camera through picamera2, with an optional lores analysis stream'''
+
+    def __init__(self, picam2=None, size=(640, 480), analysis_size=None,
+                 hflip=False, vflip=False, frame_rate=60):
+        '''
+        :param picam2: Picamera2 instance, None to create one
+        :type picam2: Picamera2
+        :param frame_rate: Requested sensor frame rate
+        :type frame_rate: int
+        '''
+        super().__init__(size, analysis_size, hflip, vflip)
+        self.picam2 = picam2
+        self.frame_rate = frame_rate
+        self.analysis_lores = False
+
+    def start(self):
+        import libcamera
+        if self.picam2 is None:
+            from picamera2 import Picamera2
+            self.picam2 = Picamera2()
+        picam2 = self.picam2
+
+        preview_config = picam2.preview_configuration
+        # preview_config.size = (800, 600)
+        preview_config.size = self.size
+        preview_config.format = 'RGB888'  # 'XRGB8888', 'XBGR8888', 'RGB888', 'BGR888', 'YUV420'
+        preview_config.transform = libcamera.Transform(
+                                        hflip=self.hflip,
+                                        vflip=self.vflip
+                                    )
+        preview_config.colour_space = libcamera.ColorSpace.Sycc()
+        preview_config.buffer_count = 4
+        preview_config.queue = True
+        # preview_config.raw = {'size': (2304, 1296)}
+        preview_config.controls = {'FrameRate': self.frame_rate} # change picam2.capture_array() takes time
+
+        # low resolution analysis stream for the detectors, the isp scales it
+        # for free. lores must be YUV420 on Pi 4
+        self.analysis_lores = False
+        if self.analysis_size is not None:
+            preview_config.enable_lores()
+            preview_config.lores.size = self.analysis_size
+            preview_config.lores.format = 'YUV420'
+
+        try:
+            picam2.start()
+            self.analysis_lores = self.analysis_size is not None
+        except Exception as e:
+            if self.analysis_size is None:
+                raise
+            # lores stream not supported, Vilib resizes the main stream instead
+            print(f"lores stream unavailable, resizing main stream:\n  {e}")
+            preview_config.enable_lores(False)
+            picam2.configure(preview_config)
+            picam2.start()
+
+    def read(self):
+        if self.analysis_lores:
+            (img, lores), _ = self.picam2.capture_arrays(['main', 'lores'])
+            return img, cv2.cvtColor(lores, cv2.COLOR_YUV420p2BGR)
+        return self.picam2.capture_array(), None
+
+    def close(self):
+        if self.picam2 is not None:
+            self.picam2.close()
+
+
+class VideoFileSource(FrameSource):
+    '''Frames decoded from a video file, eg: recorded CCTV footage'''
+
+    def __init__(self, path, size=None, analysis_size=None, hflip=False, vflip=False,
+                 realtime=True, loop=True):
+        '''
+        :param path: Video file path
+        :type path: str
+        :param realtime: Play at the file frame rate, False for as fast as possible
+        :type realtime: bool
+        :param loop: Restart at the end of the file, False to end the stream
+        :type loop: bool
+        '''
+        super().__init__(size, analysis_size, hflip, vflip)
+        self.path = path
+        self.realtime = realtime
+        self.loop = loop
+        self.cap = None
+        self.pacer = Pacer()
+
+    def start(self):
+        if not os.path.exists(self.path):
+            raise ValueError(f'incorrect video path: {self.path}')
+        self.cap = cv2.VideoCapture(self.path)
+        if not self.cap.isOpened():
+            raise ValueError(f'can not open video: {self.path}')
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.pacer = Pacer((fps or 30) if self.realtime else None)
+
+    def read(self):
+        self.pacer.wait()
+        success, img = self.cap.read()
+        if not success and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            success, img = self.cap.read()
+        if not success:
+            return None, None
+        return self.transform(img), None
+
+    def close(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+
+class ImageDirSource(FrameSource):
+    '''Frames read from the images of a directory, in file name order'''
+
+    EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+    def __init__(self, path, fps=30, size=None, analysis_size=None, hflip=False, vflip=False,
+                 realtime=True, loop=True):
+        '''
+        :param path: Directory path
+        :type path: str
+        :param fps: Frame rate when realtime
+        :type fps: float
+        :param realtime: Run at `fps`, False for as fast as possible
+        :type realtime: bool
+        :param loop: Restart after the last image, False to end the stream
+        :type loop: bool
+        '''
+        super().__init__(size, analysis_size, hflip, vflip)
+        self.path = path
+        self.fps = fps
+        self.realtime = realtime
+        self.loop = loop
+        self.files = []
+        self.index = 0
+        self.pacer = Pacer()
+
+    def start(self):
+        if not os.path.isdir(self.path):
+            raise ValueError(f'incorrect image directory: {self.path}')
+        self.files = sorted(os.path.join(self.path, f) for f in os.listdir(self.path)
+                            if f.lower().endswith(self.EXTENSIONS))
+        if len(self.files) == 0:
+            raise ValueError(f'no images in: {self.path}')
+        self.index = 0
+        self.pacer = Pacer(self.fps if self.realtime else None)
+
+    def read(self):
+        self.pacer.wait()
+        # at most one full pass, a directory of unreadable images ends the stream
+        for _ in range(len(self.files)):
+            if self.index >= len(self.files):
+                if not self.loop:
+                    return None, None
+                self.index = 0
+            img = cv2.imread(self.files[self.index])
+            self.index += 1
+            if img is not None:
+                return self.transform(img), None
+        return None, None
+
+
+class SyntheticSource(FrameSource):
+    '''
+    Generated test frames: colour bars with a moving box and a frame counter,
+    so that detection, encoding and streaming have real work to do
+    '''
+
+    DEFAULT_SIZE = (640, 480) # generated size when size is None, there is no source size
+
+    def __init__(self, size=(640, 480), analysis_size=None, hflip=False, vflip=False,
+                 fps=30, realtime=True, frames=None):
+        '''
+        :param size: Frame size (width, height), None for DEFAULT_SIZE
+        :type size: tuple
+        :param fps: Frame rate when realtime
+        :type fps: float
+        :param realtime: Run at `fps`, False for as fast as possible
+        :type realtime: bool
+        :param frames: Number of frames before the stream ends, None for endless
+        :type frames: int
+        '''
+        super().__init__(size or self.DEFAULT_SIZE, analysis_size, hflip, vflip)
+        self.fps = fps
+        self.realtime = realtime
+        self.frames = frames
+        self.count = 0
+        self.bars = None
+        self.pacer = Pacer()
+
+    def start(self):
+        width, height = self.size
+        colors = [(255, 255, 255), (0, 255, 255), (255, 255, 0), (0, 255, 0),
+                  (255, 0, 255), (0, 0, 255), (255, 0, 0), (0, 0, 0)]
+        self.bars = np.zeros((height, width, 3), np.uint8)
+        bar_width = max(1, width // len(colors))
+        for i, color in enumerate(colors):
+            self.bars[:, i*bar_width:(i+1)*bar_width] = color
+        self.count = 0
+        self.pacer = Pacer(self.fps if self.realtime else None)
+
+    def read(self):
+        if self.frames is not None and self.count >= self.frames:
+            return None, None
+        self.pacer.wait()
+        width, height = self.size
+        img = self.bars.copy()
+        box = max(16, height // 6)
+        x = int((self.count * 4) % max(1, width - box))
+        y = int((height - box) / 2 + (height - box) / 3 * np.sin(self.count / 15.0))
+        cv2.rectangle(img, (x, y), (x+box, y+box), (0, 0, 255), -1)
+        cv2.putText(img, f"{self.count}", (10, height - 10), cv2.FONT_HERSHEY_SIMPLEX,
+                    1, (128, 128, 128), 2, cv2.LINE_AA)
+        self.count += 1
+        return self.transform(img), None
@@ -2,6 +2,7 @@
 import cv2
 import mediapipe as mp
 from ast import literal_eval
+from functools import partial
 
 mp_drawing = mp.solutions.drawing_utils
 # mp_drawing_styles = mp.solutions.drawing_styles
@@ -13,26 +14,41 @@ class DetectHands():
                                     min_detection_confidence=0.5,
                                     min_tracking_confidence=0.5)
     
-    def work(self,image):
+    def work(self,image,annotations=None):
+        '''
+        :param annotations: If given, the landmarks are recorded there and
+                            image is returned untouched
+        :type annotations: Annotations
+        '''
         joints = []
         if len(image) != 0:
-            # To improve performance, optionally mark the image as not writeable to
-            # pass by reference.
-            image.flags.writeable = False
-            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            results = self.hands.process(image)
+            if annotations is not None:
+                rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+                rgb.flags.writeable = False
+                results = self.hands.process(rgb)
+                if results.multi_hand_landmarks:
+                    for hand_landmarks in results.multi_hand_landmarks:
+                        # a partial, not a lambda, so that the marks can be pickled
+                        annotations.add(partial(mp_drawing.draw_landmarks,
+                            landmark_list=hand_landmarks, connections=mp_hands.HAND_CONNECTIONS))
+            else:
+                # To improve performance, optionally mark the image as not writeable to
+                # pass by reference.
+                image.flags.writeable = False
+                image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+                results = self.hands.process(image)
 
-            # Draw the hand annotations on the image.
-            image.flags.writeable = True
-            image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
-            if results.multi_hand_landmarks:
-                for hand_landmarks in results.multi_hand_landmarks:
-                    mp_drawing.draw_landmarks(
-                        image,
-                        hand_landmarks,
-                        mp_hands.HAND_CONNECTIONS,)
-                        # mp_drawing_styles.get_default_hand_landmarks_style(),
-                        # mp_drawing_styles.get_default_hand_connections_style())
+                # Draw the hand annotations on the image.
+                image.flags.writeable = True
+                image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+                if results.multi_hand_landmarks:
+                    for hand_landmarks in results.multi_hand_landmarks:
+                        mp_drawing.draw_landmarks(
+                            image,
+                            hand_landmarks,
+                            mp_hands.HAND_CONNECTIONS,)
+                            # mp_drawing_styles.get_default_hand_landmarks_style(),
+                            # mp_drawing_styles.get_default_hand_connections_style())
             joints = str(results.multi_hand_landmarks).replace('\n','').replace(' ','').replace('landmark',',').replace(',','',1)
             joints = joints.replace('{x:','[').replace('y:',',').replace('z:',',').replace('}',']')
             try:
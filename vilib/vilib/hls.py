@@ -0,0 +1,156 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+class HlsStreamer(object):
+    '''
+    Live H.264 HLS output of the camera frames
+
+    One libx264 encode (an ffmpeg process fed raw frames through a pipe)
+    produces fragmented MP4 segments and an index.m3u8 playlist. Every viewer
+    downloads the same segments, at about a tenth of the MJPEG bandwidth.
+    Only the last `window` segments are kept, in tmpfs (/dev/shm) when
+    available, so the SD card is never written.
+
+    Frames are fed at a constant `fps`: the latest frame is repeated when
+    capture is slower and frames are skipped when it is faster.
+    '''
+
+    def __init__(self, frame_buffer, size, fps=15, path=None, segment_time=1, window=6,
+                 bitrate='2M', render=None, stats=None, ffmpeg='ffmpeg'):
+        '''
+        :param frame_buffer: The frames to encode
+        :type frame_buffer: FrameRingBuffer
+        :param size: Output size (width, height), frames are resized if needed
+        :type size: tuple
+        :param fps: Output frame rate
+        :type fps: int
+        :param path: Directory of the playlist and segments, default
+                     /dev/shm/vilib_hls
+        :type path: str
+        :param segment_time: Segment duration in seconds, also the keyframe interval
+        :type segment_time: int
+        :param window: Number of segments in the playlist
+        :type window: int
+        :param bitrate: Target bitrate, eg: '2M'
+        :type bitrate: str
+        :param render: render(frame) returns the image to encode, default frame.img
+        :type render: callable
+        :param stats: Records 'hls.write'
+        :type stats: PipelineStats
+        :param ffmpeg: ffmpeg executable
+        :type ffmpeg: str
+        '''
+        self.frame_buffer = frame_buffer
+        self.size = tuple(size)
+        self.fps = fps
+        if path is None:
+            base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+            path = os.path.join(base, 'vilib_hls')
+        self.path = path
+        self.segment_time = segment_time
+        self.window = window
+        self.bitrate = bitrate
+        self.render = render
+        self.stats = stats
+        self.ffmpeg = ffmpeg
+        self.proc = None
+        self.thread = None
+        self.running = False
+
+    @property
+    def playlist(self):
+        return os.path.join(self.path, 'index.m3u8')
+
+    def command(self):
+        width, height = self.size
+        gop = str(int(self.fps * self.segment_time))
+        return [
+            self.ffmpeg, '-loglevel', 'error', '-y',
+            '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{width}x{height}',
+            '-r', str(self.fps), '-i', '-',
+            '-an',
+            '-c:v', 'libx264', '-preset', 'ultrafast', '-tune', 'zerolatency',
+            '-pix_fmt', 'yuv420p', '-b:v', self.bitrate,
+            '-g', gop, '-keyint_min', gop, '-sc_threshold', '0',
+            '-f', 'hls',
+            '-hls_time', str(self.segment_time),
+            '-hls_list_size', str(self.window),
+            '-hls_flags', 'delete_segments+independent_segments+omit_endlist',
+            '-hls_segment_type', 'fmp4',
+            '-hls_fmp4_init_filename', 'init.mp4',
+            '-hls_segment_filename', os.path.join(self.path, 'seg_%05d.m4s'),
+            self.playlist,
+        ]
+
+    def start(self):
+        if self.running:
+            return
+        # segments of a previous run would be served as live
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.makedirs(self.path, exist_ok=True)
+        self.proc = subprocess.Popen(self.command(), stdin=subprocess.PIPE)
+        self.running = True
+        self.thread = threading.Thread(name='vilib_hls', target=self.feed)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(2)
+            self.thread = None
+        if self.proc is not None:
+            try:
+                self.proc.stdin.close()
+            except OSError:
+                pass
+            try:
+                self.proc.wait(2)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+            self.proc = None
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def feed(self):
+        interval = 1.0 / self.fps
+        next_time = time.monotonic()
+        img = None
+        seq = 0
+        while self.running:
+            frame = self.frame_buffer.latest()
+            if frame is None:
+                time.sleep(interval)
+                next_time = time.monotonic()
+                continue
+            # resize and convert only for a new frame, repeats reuse img
+            if frame.seq != seq:
+                seq = frame.seq
+                img = frame.img if self.render is None else self.render(frame)
+                if (img.shape[1], img.shape[0]) != self.size:
+                    img = cv2.resize(img, self.size, interpolation=cv2.INTER_AREA)
+                img = np.ascontiguousarray(img)
+            st = time.perf_counter()
+            try:
+                self.proc.stdin.write(memoryview(img))
+            except (BrokenPipeError, ValueError, OSError) as e:
+                print(f"hls encoder stopped:\n  {e}")
+                self.running = False
+                break
+            if self.stats is not None:
+                self.stats.since('hls.write', st)
+
+            next_time += interval
+            delay = next_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -1.0:
+                # fell far behind, restart the schedule
+                next_time = time.monotonic()
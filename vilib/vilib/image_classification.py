@@ -167,7 +167,7 @@ def main():
     time.sleep(0.01)
 
 
-def classify_image(image, model=None, labels=None):
+def classify_image(image, model=None, labels=None, draw=cv2):
   # loading model and corresponding label
   if model is None:
     model = default_model
@@ -197,7 +197,7 @@ def classify_image(image, model=None, labels=None):
     image_classification_obj_parameter['acc'] = prob
 
     # putText
-    cv2.putText(image, 
+    draw.putText(image, 
                 f"{labels[label_id]} {prob:.3f}", # text
                 (10, 25), # origin
                 cv2.FONT_HERSHEY_SIMPLEX,  # font
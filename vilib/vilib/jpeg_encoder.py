@@ -0,0 +1,206 @@
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+'''
+JPEG encoder backends
+
+All JPEG output of vilib (streams, snapshots, QR code images) goes through
+one encoder object with encode(img, quality=None) -> bytes, img a BGR (or
+single channel) uint8 array:
+
+opencv      cv2.imencode, always available
+simplejpeg  libjpeg-turbo through simplejpeg, fast DCT, 4:2:0 chroma
+            subsampling:  pip3 install simplejpeg
+turbojpeg   libjpeg-turbo through PyTurboJPEG, fast DCT, 4:2:0 chroma
+            subsampling:  sudo apt install libturbojpeg0 && pip3 install PyTurboJPEG
+
+Which one is fastest depends on the board and the libraries installed,
+measure it with:
+
+    python3 -m vilib.jpeg_encoder
+'''
+
+DEFAULT_QUALITY = 95 # the OpenCV default, so every backend gives the same output size range
+
+BENCHMARK_SIZES = ((640, 480), (1280, 720), (1920, 1080))
+
+
+class OpenCVEncoder(object):
+    name = 'opencv'
+
+    def encode(self, img, quality=None):
+        params = [cv2.IMWRITE_JPEG_QUALITY, quality if quality is not None else DEFAULT_QUALITY]
+        return cv2.imencode('.jpg', img, params)[1].tobytes()
+
+
+class SimpleJpegEncoder(object):
+    name = 'simplejpeg'
+
+    def __init__(self):
+        import simplejpeg
+        self.simplejpeg = simplejpeg
+
+    def encode(self, img, quality=None):
+        if quality is None:
+            quality = DEFAULT_QUALITY
+        if img.ndim == 2:
+            return self.simplejpeg.encode_jpeg(np.ascontiguousarray(img[:, :, None]), quality,
+                                               colorspace='GRAY', colorsubsampling='Gray',
+                                               fastdct=True)
+        return self.simplejpeg.encode_jpeg(np.ascontiguousarray(img), quality,
+                                           colorspace='BGR', colorsubsampling='420',
+                                           fastdct=True)
+
+
+class TurboJpegEncoder(object):
+    name = 'turbojpeg'
+
+    def __init__(self, lib_path=None):
+        import turbojpeg
+        self.turbojpeg = turbojpeg
+        self.jpeg = turbojpeg.TurboJPEG(lib_path)
+
+    def encode(self, img, quality=None):
+        tj = self.turbojpeg
+        if quality is None:
+            quality = DEFAULT_QUALITY
+        if img.ndim == 2:
+            return self.jpeg.encode(np.ascontiguousarray(img[:, :, None]), quality,
+                                    pixel_format=tj.TJPF_GRAY, jpeg_subsample=tj.TJSAMP_GRAY,
+                                    flags=tj.TJFLAG_FASTDCT)
+        return self.jpeg.encode(np.ascontiguousarray(img), quality,
+                                pixel_format=tj.TJPF_BGR, jpeg_subsample=tj.TJSAMP_420,
+                                flags=tj.TJFLAG_FASTDCT)
+
+
+ENCODERS = {
+    'opencv': OpenCVEncoder,
+    'simplejpeg': SimpleJpegEncoder,
+    'turbojpeg': TurboJpegEncoder,
+}
+
+
+def create(name):
+    '''
+    :param name: Backend name, see ENCODERS
+    :type name: str
+    :returns: The encoder, raises ImportError or OSError when the backend
+              library is missing
+    '''
+    if name not in ENCODERS:
+        raise ValueError(f'unknown JPEG encoder "{name}", one of {", ".join(ENCODERS)}')
+    return ENCODERS[name]()
+
+
+def available():
+    '''
+    :returns: The encoders whose libraries are installed, by name
+    :rtype: dict
+    '''
+    encoders = {}
+    for name in ENCODERS:
+        try:
+            encoders[name] = create(name)
+        except Exception:
+            pass
+    return encoders
+
+
+def test_image(size):
+    '''A camera like test image: smooth gradients, edges and sensor noise'''
+    width, height = size
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    img = np.empty((height, width, 3), np.uint8)
+    img[:, :, 0] = (x * 0.6 + y * 0.4).astype(np.uint8)
+    img[:, :, 1] = (255 - x * 0.5 - y * 0.3).astype(np.uint8)
+    img[:, :, 2] = (np.abs(x - 128) + y * 0.5).clip(0, 255).astype(np.uint8)
+    for i in range(8):
+        cv2.rectangle(img, (width * i // 8, height // 4), (width * i // 8 + width // 16, height * 3 // 4),
+                      (40 * i % 256, 255 - 30 * i, 90), -1)
+    cv2.putText(img, 'vilib', (width // 8, height // 2), cv2.FONT_HERSHEY_SIMPLEX,
+                width / 200, (255, 255, 255), max(1, width // 200))
+    noise = np.random.default_rng(0).integers(-6, 7, img.shape, dtype=np.int16)
+    return (img.astype(np.int16) + noise).clip(0, 255).astype(np.uint8)
+
+
+def benchmark(encoders=None, sizes=BENCHMARK_SIZES, repeat=20, quality=None, img=None):
+    '''
+    Measure the encode time and output size of each encoder
+
+    :param encoders: The encoders by name, default every available one
+    :type encoders: dict
+    :param sizes: Image sizes (width, height)
+    :type sizes: tuple
+    :param repeat: Encodes per encoder and size, the median time is kept
+    :type repeat: int
+    :param quality: JPEG quality, None for DEFAULT_QUALITY
+    :type quality: int
+    :param img: Image to encode (resized to each size), default test_image()
+    :type img: numpy.ndarray
+    :returns: One dict per encoder and size: name, size, ms (median encode
+              time) and kb (output size)
+    :rtype: list
+    '''
+    if encoders is None:
+        encoders = available()
+    results = []
+    for size in sizes:
+        if img is None:
+            src = test_image(size)
+        else:
+            src = cv2.resize(img, tuple(size), interpolation=cv2.INTER_AREA)
+        for name, encoder in encoders.items():
+            data = encoder.encode(src, quality) # warm up
+            times = []
+            for _ in range(repeat):
+                st = time.perf_counter()
+                data = encoder.encode(src, quality)
+                times.append(time.perf_counter() - st)
+            times.sort()
+            results.append({
+                'name': name,
+                'size': tuple(size),
+                'ms': round(times[len(times) // 2] * 1000, 3),
+                'kb': round(len(data) / 1024, 1),
+            })
+    return results
+
+
+def fastest(size=(640, 480), repeat=10, quality=None, img=None):
+    '''
+    Benchmark the available encoders at `size` and pick the fastest one
+
+    :returns: The fastest encoder
+    '''
+    encoders = available()
+    results = benchmark(encoders, (size,), repeat, quality, img)
+    best = min(results, key=lambda r: r['ms'])
+    return encoders[best['name']]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the JPEG encoder backends of vilib')
+    parser.add_argument('--repeat', type=int, default=20, help='encodes per backend and size')
+    parser.add_argument('--quality', type=int, default=None, help=f'JPEG quality, default {DEFAULT_QUALITY}')
+    args = parser.parse_args()
+
+    encoders = available()
+    missing = [name for name in ENCODERS if name not in encoders]
+    if missing:
+        print(f'not installed: {", ".join(missing)}')
+    results = benchmark(encoders, repeat=args.repeat, quality=args.quality)
+    print(f'{"size":>10}  {"backend":<11} {"ms":>8} {"KB":>8}')
+    for size in BENCHMARK_SIZES:
+        rows = [r for r in results if r['size'] == size]
+        best = min(rows, key=lambda r: r['ms'])
+        for r in rows:
+            mark = '  <- fastest' if r is best else ''
+            print(f'{"%dx%d" % size:>10}  {r["name"]:<11} {r["ms"]:>8.2f} {r["kb"]:>8.1f}{mark}')
+
+
+if __name__ == '__main__':
+    main()
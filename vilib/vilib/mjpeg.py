@@ -0,0 +1,284 @@
+import threading
+import time
+from collections import namedtuple
+
+import cv2
+
+from .jpeg_encoder import OpenCVEncoder
+
+'''
+A frame encoded for an output: sequence number and capture timestamp of the
+source frame, and the encoded bytes
+'''
+EncodedFrame = namedtuple('EncodedFrame', ['seq', 'timestamp', 'data'])
+
+'''
+A variant of the stream: image format ('jpg' or 'png'), whether detection
+marks are drawn, output width (None for the capture width, the height keeps
+the aspect ratio) and JPEG quality (None for the OpenCV default)
+'''
+Variant = namedtuple('Variant', ['fmt', 'annotate', 'width', 'quality'],
+                     defaults=('jpg', True, None, None))
+
+
+class MjpegBroadcaster(object):
+    '''
+    Encode each new frame once and share the bytes with every viewer
+
+    Encoded frames are cached per Variant, eg: full size annotated JPEG, or
+    640 pixels wide at quality 60 for a phone. While a variant has
+    subscribers (open /mjpg streams) an encoder thread downscales and
+    encodes every new frame for it as soon as it is published. Snapshots
+    (/mjpg.jpg, /mjpg.png) get the cached bytes of the latest frame and only
+    encode when no one did yet. So the encoding cost follows the frame rate
+    and the number of variants, not the number of viewers.
+    '''
+
+    MAX_VARIANTS = 16
+
+    def __init__(self, frame_buffer, render, stats=None, encoder=None):
+        '''
+        :param frame_buffer: The frames to encode
+        :type frame_buffer: FrameRingBuffer
+        :param render: render(frame, annotate) returns the image to encode
+        :type render: callable
+        :param stats: Records 'encode.<format>'
+        :type stats: PipelineStats
+        :param encoder: JPEG encoder backend, default OpenCVEncoder, see
+                        vilib.jpeg_encoder
+        '''
+        self.frame_buffer = frame_buffer
+        self.render = render
+        self.stats = stats
+        self.encoder = encoder if encoder is not None else OpenCVEncoder()
+        self.instance = '%x' % int(time.time())
+        self.cache = {}
+        self.subscribers = {}
+        self.listeners = []
+        self.locks = {}
+        self.lock = threading.Lock()
+        self.cond = threading.Condition()
+        self.running = False
+        self.thread = None
+
+    @staticmethod
+    def variant(fmt='jpg', annotate=True, width=None, quality=None, frame_width=None):
+        '''
+        Normalise client parameters into a Variant, so that close requests
+        share one cache entry: width is rounded to 16 pixels and never larger
+        than the frame, quality is rounded to 5 and only applies to JPEG.
+
+        :param frame_width: Capture width
+        :type frame_width: int
+        :rtype: Variant
+        '''
+        if width is not None:
+            width = max(16, int(width) // 16 * 16)
+            if frame_width is not None and width >= frame_width:
+                width = None
+        if quality is not None:
+            quality = min(100, max(5, int(round(int(quality) / 5.0)) * 5))
+        if fmt != 'jpg':
+            quality = None
+        return Variant(fmt, annotate, width, quality)
+
+    @staticmethod
+    def variant_args(args, fmt='jpg', frame_width=None):
+        '''
+        Parse the query arguments of a stream request, eg:
+        ?w=640&q=60&fps=10&annotate=0
+
+        :param args: Query arguments, a mapping of str
+        :type args: dict
+        :returns: The requested Variant and frame rate cap (None for no cap)
+        :rtype: tuple
+        '''
+        def number(name, kind):
+            try:
+                return kind(args.get(name))
+            except (TypeError, ValueError):
+                return None
+        annotate = str(args.get('annotate', '1')).lower() not in ('0', 'false', 'no')
+        variant = MjpegBroadcaster.variant(fmt, annotate, number('w', int), number('q', int),
+                                           frame_width=frame_width)
+        fps = number('fps', float)
+        if fps is not None and fps <= 0:
+            fps = None
+        return variant, fps
+
+    def etag(self, key, seq):
+        '''
+        Entity tag of frame `seq` encoded as variant `key`. It includes the
+        start time of the broadcaster, seq restarts with the process.
+        '''
+        fmt, annotate, width, quality = key
+        return f'{self.instance}-{seq}-{fmt}-{int(annotate)}-{width or 0}-{quality or 0}'
+
+    @staticmethod
+    def etag_matches(if_none_match, etag):
+        '''Whether an If-None-Match header value lists `etag` (or is *)'''
+        if not if_none_match:
+            return False
+        for tag in if_none_match.split(','):
+            tag = tag.strip()
+            if tag.startswith('W/'):
+                tag = tag[2:]
+            if tag == '*' or tag.strip('"') == etag:
+                return True
+        return False
+
+    def snapshot(self, key, if_none_match=None):
+        '''
+        The latest frame encoded as variant `key`, for a snapshot request.
+        When the client already has it (If-None-Match), nothing is encoded.
+
+        :param if_none_match: The If-None-Match header of the request
+        :type if_none_match: str
+        :returns: (etag, data), data is None when the client copy is current,
+                  (None, None) before the first frame
+        :rtype: tuple
+        '''
+        frame = self.frame_buffer.latest()
+        if frame is None:
+            return None, None
+        etag = self.etag(key, frame.seq)
+        if self.etag_matches(if_none_match, etag):
+            return etag, None
+        encoded = self.encoded(frame, key)
+        return self.etag(key, encoded.seq), encoded.data
+
+    def add_listener(self, func):
+        '''func(key, encoded) is called from the encoding thread after each encode'''
+        with self.lock:
+            self.listeners.append(func)
+
+    def remove_listener(self, func):
+        with self.lock:
+            if func in self.listeners:
+                self.listeners.remove(func)
+
+    def encode(self, frame, key):
+        img = self.render(frame, key.annotate)
+        st = time.perf_counter()
+        if key.width is not None and key.width < img.shape[1]:
+            height = max(1, round(img.shape[0] * key.width / img.shape[1]))
+            img = cv2.resize(img, (key.width, height), interpolation=cv2.INTER_AREA)
+        if key.fmt == 'jpg':
+            data = self.encoder.encode(img, key.quality)
+        else:
+            data = cv2.imencode('.' + key.fmt, img)[1].tobytes()
+        if self.stats is not None:
+            self.stats.since('encode.' + key.fmt, st)
+        return EncodedFrame(frame.seq, frame.timestamp, data)
+
+    def key_lock(self, key):
+        with self.lock:
+            lock = self.locks.get(key)
+            if lock is None:
+                lock = self.locks[key] = threading.Lock()
+        return lock
+
+    def encoded(self, frame, key):
+        '''
+        :returns: `frame` encoded as variant `key`, from the cache when any
+                  consumer already encoded it (or a newer frame)
+        :rtype: EncodedFrame
+        '''
+        cached = self.cache.get(key)
+        if cached is not None and cached.seq >= frame.seq:
+            return cached
+        # one encode per frame and variant, concurrent requests wait for it
+        with self.key_lock(key):
+            cached = self.cache.get(key)
+            if cached is not None and cached.seq >= frame.seq:
+                return cached
+            encoded = self.encode(frame, key)
+            with self.cond:
+                self.cache[key] = encoded
+                self.cond.notify_all()
+        for listener in self.listeners:
+            listener(key, encoded)
+        if len(self.cache) > self.MAX_VARIANTS:
+            self.evict()
+        return encoded
+
+    def evict(self):
+        '''Drop the stalest variants nobody is subscribed to'''
+        with self.lock:
+            idle = [k for k in self.cache if k not in self.subscribers]
+            idle.sort(key=lambda k: self.cache[k].seq)
+            for k in idle[:len(self.cache) - self.MAX_VARIANTS]:
+                self.cache.pop(k, None)
+                self.locks.pop(k, None)
+
+    def get(self, key=Variant()):
+        '''
+        :param key: The variant
+        :type key: Variant
+        :returns: The latest frame encoded as variant `key`, or None before
+                  the first frame
+        :rtype: EncodedFrame
+        '''
+        frame = self.frame_buffer.latest()
+        if frame is None:
+            return None
+        return self.encoded(frame, key)
+
+    def wait(self, key=Variant(), after_seq=0, timeout=None):
+        '''
+        Block until a frame newer than `after_seq` is encoded as variant
+        `key` (subscribe to it first). Only the latest encoded frame is kept,
+        so a reader that fell behind gets the newest one and skips the rest.
+
+        :returns: The newest encoded frame, or None on timeout
+        :rtype: EncodedFrame
+        '''
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.cache.get(key, EncodedFrame(0, 0.0, None)).seq > after_seq,
+                                      timeout):
+                return None
+            return self.cache[key]
+
+    def subscribe(self, key=Variant()):
+        '''Have the encoder thread encode every new frame as variant `key`'''
+        with self.lock:
+            self.subscribers[key] = self.subscribers.get(key, 0) + 1
+        self.start()
+
+    def unsubscribe(self, key=Variant()):
+        with self.lock:
+            count = self.subscribers.get(key, 0) - 1
+            if count > 0:
+                self.subscribers[key] = count
+            else:
+                self.subscribers.pop(key, None)
+
+    def start(self):
+        with self.lock:
+            if self.running:
+                return
+            self.running = True
+        self.thread = threading.Thread(name='vilib_mjpeg', target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(1)
+            self.thread = None
+
+    def run(self):
+        last_seq = 0
+        while self.running:
+            frame = self.frame_buffer.wait_latest(last_seq, timeout=0.5)
+            if frame is None:
+                continue
+            last_seq = frame.seq
+            with self.lock:
+                keys = list(self.subscribers)
+            for key in keys:
+                try:
+                    self.encoded(frame, key)
+                except Exception as e:
+                    print(f"mjpeg encode failed:\n  {e}")
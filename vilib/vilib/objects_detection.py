@@ -80,7 +80,7 @@ def __detect_objects(interpreter, image, threshold):
 colors = [(0,255,255),(255,0,0),(0,255,64),(255,255,0),
         (255,128,64),(128,128,255),(255,128,255),(255,128,128)]
 
-def put_text(img,results,labels_map,width=CAMERA_WIDTH,height=CAMERA_HEIGHT):
+def put_text(img,results,labels_map,width=CAMERA_WIDTH,height=CAMERA_HEIGHT,draw=cv2):
     for i,obj in enumerate(results):
         # Convert the bounding box figures from relative coordinates
         # to absolute coordinates based on the original resolution
@@ -90,8 +90,8 @@ def put_text(img,results,labels_map,width=CAMERA_WIDTH,height=CAMERA_HEIGHT):
         ymin = int(ymin * height)
         ymax = int(ymax * height)
 
-        cv2.rectangle(img,(xmin, ymin), (xmax, ymax),colors[i%7],2)
-        cv2.putText(img,
+        draw.rectangle(img,(xmin, ymin), (xmax, ymax),colors[i%7],2)
+        draw.putText(img,
                     f"{labels_map[obj['class_id']]} {obj['score']:.2f}",
                     (xmin+6, ymin+18),
                     cv2.FONT_HERSHEY_PLAIN, #FONT_HERSHEY_DUPLEX
@@ -106,7 +106,7 @@ def put_text(img,results,labels_map,width=CAMERA_WIDTH,height=CAMERA_HEIGHT):
     return img
 
 # For static images:
-def detect_objects(image, model=None, labels=None, width=CAMERA_WIDTH, height=CAMERA_HEIGHT, threshold=0.4):
+def detect_objects(image, model=None, labels=None, width=CAMERA_WIDTH, height=CAMERA_HEIGHT, threshold=0.4, draw=cv2):
   # loading model and corresponding label
   if model is None:
     model = default_model
@@ -130,7 +130,7 @@ def detect_objects(image, model=None, labels=None, width=CAMERA_WIDTH, height=CA
     # classify
     results = __detect_objects(interpreter, img, threshold)
     # putText
-    image = put_text(image, results, labels, width, height)
+    image = put_text(image, results, labels, width, height, draw=draw)
     
   return  image
 
@@ -2,6 +2,7 @@
 import cv2
 import mediapipe as mp
 from ast import literal_eval
+from functools import partial
 
 mp_drawing = mp.solutions.drawing_utils
 # mp_drawing_styles = mp.solutions.drawing_styles
@@ -12,23 +13,36 @@ class DetectPose():
         self.pose = mp_pose.Pose(min_detection_confidence=0.5,
                                 min_tracking_confidence=0.5)
             
-    def work(self,image):
+    def work(self,image,annotations=None):
+        '''
+        :param annotations: If given, the landmarks are recorded there and
+                            image is returned untouched
+        :type annotations: Annotations
+        '''
         joints = []
         if len(image) != 0:
-            # To improve performance, optionally mark the image as not writeable to
-            # pass by reference.
-            image.flags.writeable = False
-            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            results = self.pose.process(image)
-            
-            # Draw the pose annotation on the image.
-            image.flags.writeable = True
-            image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
-            mp_drawing.draw_landmarks(
-                image,
-                results.pose_landmarks,
-                mp_pose.POSE_CONNECTIONS,)
-                # landmark_drawing_spec=mp_drawing_styles.get_default_pose_landmarks_style())
+            if annotations is not None:
+                rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+                rgb.flags.writeable = False
+                results = self.pose.process(rgb)
+                # a partial, not a lambda, so that the marks can be pickled
+                annotations.add(partial(mp_drawing.draw_landmarks,
+                    landmark_list=results.pose_landmarks, connections=mp_pose.POSE_CONNECTIONS))
+            else:
+                # To improve performance, optionally mark the image as not writeable to
+                # pass by reference.
+                image.flags.writeable = False
+                image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+                results = self.pose.process(image)
+                
+                # Draw the pose annotation on the image.
+                image.flags.writeable = True
+                image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+                mp_drawing.draw_landmarks(
+                    image,
+                    results.pose_landmarks,
+                    mp_pose.POSE_CONNECTIONS,)
+                    # landmark_drawing_spec=mp_drawing_styles.get_default_pose_landmarks_style())
         
             joints = str(results.pose_landmarks).replace('\n','').replace(' ','').replace('landmark',',').replace(',','',1)
             joints = '['+joints.replace('{x:','[').replace('y:',',').replace('z:',',').replace('visibilit','').replace('}',']')+']'
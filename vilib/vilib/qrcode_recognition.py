@@ -16,7 +16,21 @@ FONT_PATH = "/opt/vilib/Arial-Unicode-Regular.ttf"
 FONT_SIZE = 16
 font = None
 
-def qrcode_recognize(img, border_rgb=(255, 0, 0), font_color=(0, 0, 255)):
+def qrcode_recognize(img, border_rgb=(255, 0, 0), font_color=(0, 0, 255), draw=cv2):
+    '''
+    QR code recognition with pyzbar
+
+    :param img: The detected image data
+    :type img: list
+    :param border_rgb: The color (RGB, tuple) of border. Eg: (255, 0, 0).
+    :type border_rgb: tuple
+    :param font_color: The color (RGB, tuple) of text. Eg: (0, 0, 255).
+    :type font_color: tuple
+    :param draw: Where marks go: cv2 draws on img, an Annotations records them
+    :type draw: module or Annotations
+    :returns: The image returned after detection.
+    :rtype: Binary list
+    '''
     global font
 
     # Detect and decode QR codes
@@ -25,9 +39,15 @@ def qrcode_recognize(img, border_rgb=(255, 0, 0), font_color=(0, 0, 255)):
     qrcode_obj_parameter['list'].clear()
 
     if len(barcodes) > 0:
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        img = Image.fromarray(img)
-        draw = ImageDraw.Draw(img)
+        # draw on img with PIL (for unicode text), or record the marks
+        annotations = None
+        if draw is not cv2:
+            annotations = draw
+            border_bgr = border_rgb[::-1]
+        else:
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+            img = Image.fromarray(img)
+            draw = ImageDraw.Draw(img)
 
         if font is None:
             font = ImageFont.truetype(FONT_PATH, FONT_SIZE, encoding="utf-8")
@@ -37,7 +57,10 @@ def qrcode_recognize(img, border_rgb=(255, 0, 0), font_color=(0, 0, 255)):
             (x, y, w, h) = barcode.rect
 
             # cv2.rectangle(img, (x, y), (x + w, y + h), (0, 0, 255), 2)
-            draw.rectangle([x, y, x+w, y+h], outline=border_rgb, width=2)
+            if annotations is not None:
+                annotations.rectangle(img, (x, y), (x+w, y+h), border_bgr, 2)
+            else:
+                draw.rectangle([x, y, x+w, y+h], outline=border_rgb, width=2)
             
             # the barcode data is a byte object, converted into a string
             barcodeData = barcode.data.decode("utf-8")
@@ -69,7 +92,10 @@ def qrcode_recognize(img, border_rgb=(255, 0, 0), font_color=(0, 0, 255)):
                 #         1, # thickness
                 #         cv2.LINE_AA, # line_type: LINE_8 (default), LINE_4, LINE_AA
                 #     )
-                draw.text((x, y-FONT_SIZE-2), text, font_color, font=font)
+                if annotations is not None:
+                    annotations.pil_text((x, y-FONT_SIZE-2), text, font_color, font)
+                else:
+                    draw.text((x, y-FONT_SIZE-2), text, font_color, font=font)
             else:
                 qrcode_obj_parameter['data'] = "None"
                 qrcode_obj_parameter['x'] = 0
@@ -77,7 +103,8 @@ def qrcode_recognize(img, border_rgb=(255, 0, 0), font_color=(0, 0, 255)):
                 qrcode_obj_parameter['w'] = 0
                 qrcode_obj_parameter['h'] = 0
 
-        img = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
+        if annotations is None:
+            img = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
 
         return img
     else:
@@ -0,0 +1,775 @@
+import os
+import subprocess
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+
+class FrameRecorder(object):
+    '''
+    Record the captured frames to a video file at a constant frame rate
+
+    Frames are consumed in sequence order from the frame buffer, the thread
+    sleeps until the next one is published, so the cost follows the real
+    capture rate. Each frame is placed on the output timeline by its capture
+    timestamp: slot n of the file is at n / fps seconds. A frame is written
+    once into its slot; when the capture is slower than `fps` the previous
+    frame is repeated over the slots it missed, when it is faster the frames
+    landing on an already written slot are dropped. So the file plays back
+    in real time whatever the capture rate.
+
+    While paused, frames are skipped and the timeline stops, playback goes
+    straight from the last frame before the pause to the first one after.
+    '''
+
+    def __init__(self, frame_buffer, path, fourcc, fps=30.0, size=(640, 480), is_color=True,
+                 render=None, stats=None):
+        '''
+        :param frame_buffer: The frames to record
+        :type frame_buffer: FrameRingBuffer
+        :param path: Output file
+        :type path: str
+        :param fourcc: Codec, eg: cv2.VideoWriter_fourcc(*'XVID')
+        :type fourcc: int
+        :param fps: Frame rate of the file
+        :type fps: float
+        :param size: Frame size of the file (width, height), frames are resized if needed
+        :type size: tuple
+        :param is_color: False to record grayscale
+        :type is_color: bool
+        :param render: render(frame) returns the image to record, default frame.img
+        :type render: callable
+        :param stats: Records 'rec.write'
+        :type stats: PipelineStats
+        '''
+        self.frame_buffer = frame_buffer
+        self.path = path
+        self.fourcc = fourcc
+        self.fps = float(fps)
+        self.size = tuple(size)
+        self.is_color = is_color
+        self.render = render
+        self.stats = stats
+        self.paused = True
+        self.running = False
+        self.thread = None
+        self.writer = None
+        self.written = 0 # frames written once
+        self.duplicated = 0 # slots filled with the previous frame
+        self.dropped = 0 # frames captured faster than fps
+
+    def start(self, paused=False):
+        if self.running:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, mode=0o751, exist_ok=True)
+        # open errors are raised to the caller, not in the thread
+        self.open()
+        self.paused = paused
+        self.running = True
+        self.thread = threading.Thread(name='rec_video', target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def pause(self):
+        self.paused = True
+
+    def resume(self):
+        self.paused = False
+
+    def stop(self, timeout=3):
+        '''Stop recording and close the file, once the frames in hand are written'''
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def prepare(self, frame):
+        img = frame.img if self.render is None else self.render(frame)
+        if (img.shape[1], img.shape[0]) != self.size:
+            img = cv2.resize(img, self.size, interpolation=cv2.INTER_AREA)
+        if not self.is_color and img.ndim == 3:
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        return img
+
+    def open(self):
+        self.writer = cv2.VideoWriter(self.path, self.fourcc, self.fps, self.size, self.is_color)
+
+    def close(self):
+        self.writer.release()
+
+    def put(self, img, slot):
+        '''Write img into slot `slot` of the file'''
+        st = time.perf_counter()
+        self.writer.write(img)
+        if self.stats is not None:
+            self.stats.since('rec.write', st)
+
+    def hold(self, img, slot):
+        '''Fill slot `slot`, missed by the capture, with the previous frame'''
+        self.put(img, slot)
+        self.duplicated += 1
+
+    def started(self, timestamp):
+        '''Called when the timeline (re)starts, slot 0 is at `timestamp`'''
+        pass
+
+    def run(self):
+        # only frames captured from now on
+        last_seq = self.frame_buffer.seq
+        start = None # timestamp of slot 0
+        slot = 0 # next slot to write
+        img = None # last frame written
+        try:
+            while self.running:
+                frame = self.frame_buffer.get_next(last_seq, timeout=0.2)
+                if frame is None:
+                    continue
+                last_seq = frame.seq
+                if self.paused:
+                    start = None
+                    continue
+                if start is None:
+                    # first frame, or first after a pause: continue the timeline
+                    start = frame.timestamp - slot / self.fps
+                    self.started(start)
+                target = int(round((frame.timestamp - start) * self.fps))
+                if target < slot:
+                    self.dropped += 1
+                    continue
+                if img is not None:
+                    # hold the previous frame over the slots the capture missed
+                    while slot < target:
+                        self.hold(img, slot)
+                        slot += 1
+                img = self.prepare(frame)
+                self.put(img, target)
+                self.written += 1
+                slot = target + 1
+        finally:
+            self.close()
+
+
+class ArecordAudio(object):
+    '''
+    Live audio from an ALSA device, read from arecord as raw 16 bit PCM in
+    chunks of `chunk` samples: callback(samples, timestamp) gets an int16
+    array (channels, chunk) and the time.monotonic() the chunk ended
+    '''
+
+    def __init__(self, callback, device='default', rate=44100, channels=1, chunk=1024):
+        self.callback = callback
+        self.device = device
+        self.rate = rate
+        self.channels = channels
+        self.chunk = chunk
+        self.proc = None
+        self.thread = None
+
+    def start(self):
+        self.proc = subprocess.Popen(['arecord', '-q', '-D', self.device, '-f', 'S16_LE',
+                                      '-r', str(self.rate), '-c', str(self.channels), '-t', 'raw'],
+                                     stdout=subprocess.PIPE)
+        self.thread = threading.Thread(name='rec_audio', target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        if self.proc is not None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(1)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+        if self.thread is not None:
+            self.thread.join(1)
+            self.thread = None
+        self.proc = None
+
+    def run(self):
+        size = self.chunk * self.channels * 2
+        stdout = self.proc.stdout
+        while True:
+            data = stdout.read(size)
+            if not data:
+                break
+            timestamp = time.monotonic()
+            samples = np.frombuffer(data[:len(data) // (2 * self.channels) * 2 * self.channels], np.int16)
+            self.callback(samples.reshape(-1, self.channels).T, timestamp)
+
+
+class H264Recorder(FrameRecorder):
+    '''
+    Record H.264 into an MP4 or MKV file in-process, with live audio
+
+    Frames are encoded as they are captured (PyAV), no intermediate AVI and
+    no transcoding afterwards: stopping only flushes the encoders, the file
+    is ready in milliseconds. Frame timing is that of FrameRecorder, but the
+    slots the capture missed are a gap in the timestamps instead of repeated
+    frames, nothing is encoded twice.
+
+    MP4 files are fragmented, so a recording cut short by a crash or a power
+    loss is still playable up to the last fragment.
+
+    Audio (optional) is read from an ALSA device while recording, encoded to
+    AAC and muxed with the video, aligned by capture time. Needs PyAV:
+
+        pip3 install av
+    '''
+
+    def __init__(self, frame_buffer, path, fps=30, size=(640, 480), render=None, stats=None,
+                 codec='libx264', bitrate='4M', options=None, audio_device=None,
+                 audio_rate=44100, audio_channels=1, audio_gain=1.0):
+        '''
+        :param path: Output file, .mp4 or .mkv
+        :type path: str
+        :param codec: Video encoder, eg: 'libx264', or 'h264_v4l2m2m' for the
+                      hardware encoder of the Raspberry Pi
+        :type codec: str
+        :param bitrate: Target video bitrate, eg: '4M'
+        :type bitrate: str
+        :param options: Encoder options, default {'preset': 'ultrafast', 'tune':
+                        'zerolatency'} for libx264
+        :type options: dict
+        :param audio_device: ALSA device to record audio from, eg:
+                             'plughw:4,0', None for no audio
+        :type audio_device: str
+        :param audio_gain: Audio volume factor
+        :type audio_gain: float
+
+        The other parameters are those of FrameRecorder.
+        '''
+        FrameRecorder.__init__(self, frame_buffer, path, None, fps, size, True, render, stats)
+        self.codec = codec
+        self.bitrate = bitrate
+        if options is None and codec == 'libx264':
+            options = {'preset': 'ultrafast', 'tune': 'zerolatency'}
+        self.options = options or {}
+        self.audio_device = audio_device
+        self.audio_rate = audio_rate
+        self.audio_channels = audio_channels
+        self.audio_gain = audio_gain
+        self.container = None
+        self.video_stream = None
+        self.audio_stream = None
+        self.audio = None
+        self.audio_pts = None # pts of the next audio sample, None until anchored
+        self.audio_next = 0
+        self.start_time = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def bits(rate):
+        rate = str(rate)
+        units = {'k': 1000, 'K': 1000, 'm': 1000000, 'M': 1000000}
+        if rate[-1] in units:
+            return int(float(rate[:-1]) * units[rate[-1]])
+        return int(rate)
+
+    def open(self):
+        import av
+        self.av = av
+        self.open_container(self.path)
+        if self.audio_device is not None:
+            self.audio = ArecordAudio(self.on_audio, self.audio_device, self.audio_rate,
+                                      self.audio_channels)
+            self.audio.start()
+
+    def open_container(self, path, format=None):
+        from fractions import Fraction
+        self.container = self.open_output(path, format)
+        rate = Fraction(self.fps).limit_denominator(1000)
+        stream = self.container.add_stream(self.codec, rate=rate, options=self.options)
+        stream.width, stream.height = self.size
+        stream.pix_fmt = 'yuv420p'
+        stream.bit_rate = self.bits(self.bitrate)
+        # one tick per slot, exact for non integer rates (eg: 29.97, 12.5)
+        stream.codec_context.time_base = 1 / rate
+        self.video_stream = stream
+        if self.audio_device is not None:
+            layout = 'mono' if self.audio_channels == 1 else 'stereo'
+            self.audio_stream = self.container.add_stream('aac', rate=self.audio_rate, layout=layout)
+
+    def open_output(self, path, format=None):
+        options = {}
+        if path.endswith('.mp4') or format == 'mp4':
+            # fragmented: playable without the index written at close
+            options['movflags'] = 'frag_keyframe+empty_moov+default_base_moof'
+        return self.av.open(path, 'w', format=format, options=options)
+
+    def close_container(self):
+        # flush the encoders, the caller holds the lock
+        self.container.mux(self.video_stream.encode(None))
+        if self.audio_stream is not None:
+            self.container.mux(self.audio_stream.encode(None))
+        self.container.close()
+        self.container = None
+
+    def mux(self, packets):
+        with self.lock:
+            self.write(packets)
+
+    def write(self, packets):
+        # the caller holds the lock
+        self.container.mux(packets)
+
+    def put(self, img, slot):
+        st = time.perf_counter()
+        frame = self.av.VideoFrame.from_ndarray(img, format='bgr24')
+        frame.pts = slot
+        frame.time_base = self.video_stream.codec_context.time_base
+        self.mux(self.video_stream.encode(frame))
+        if self.stats is not None:
+            self.stats.since('rec.write', st)
+
+    def hold(self, img, slot):
+        # the timestamps keep the previous frame on screen until the next one
+        pass
+
+    def started(self, timestamp):
+        with self.lock:
+            self.start_time = timestamp
+            # anchor the audio again after a pause
+            self.audio_pts = None
+
+    def on_audio(self, samples, timestamp):
+        with self.lock:
+            if self.paused or self.start_time is None or self.container is None:
+                return
+            if self.audio_pts is None:
+                # first sample of the chunk, on the video timeline
+                pts = int(round((timestamp - samples.shape[1] / self.audio_rate - self.start_time)
+                                * self.audio_rate))
+                if pts < 0:
+                    # captured before the first frame
+                    return
+                self.audio_pts = max(pts, self.audio_next)
+        if self.audio_gain != 1.0:
+            samples = np.clip(samples * self.audio_gain, -32768, 32767).astype(np.int16)
+        frame = self.av.AudioFrame.from_ndarray(np.ascontiguousarray(samples), format='s16p',
+                                                layout=self.audio_stream.layout.name)
+        frame.sample_rate = self.audio_rate
+        with self.lock:
+            if self.container is None or self.audio_pts is None:
+                return
+            frame.pts = self.audio_pts
+            self.audio_pts += samples.shape[1]
+            self.audio_next = self.audio_pts
+            self.write(self.audio_stream.encode(frame))
+
+    def close(self):
+        if self.audio is not None:
+            self.audio.stop()
+            self.audio = None
+        with self.lock:
+            self.close_container()
+
+
+class PacketFile(object):
+    '''
+    An output file of packets from running encoders, it has no encoder of
+    its own: its streams are copies of the encoder streams, and the
+    timestamps are shifted so that `start` (seconds on the encoder
+    timeline, a video keyframe) is the start of the file.
+    '''
+
+    def __init__(self, container, path, streams, start):
+        self.container = container
+        self.path = path
+        self.streams = {stream: container.add_stream_from_template(stream) for stream in streams}
+        self.start = start
+        self.end = start # end of the last video packet
+        self.started = time.time() # wall clock, for the file index
+
+    @property
+    def duration(self):
+        return float(self.end - self.start)
+
+    def mux(self, packet, stream):
+        '''Mux a packet of encoder stream `stream`, leaving its timing unchanged'''
+        pts, dts, time_base = packet.pts, packet.dts, packet.time_base
+        offset = int(round(self.start / time_base))
+        if pts - offset < 0:
+            # audio from before the first video frame of the file
+            return
+        packet.pts = pts - offset
+        if dts is not None:
+            packet.dts = dts - offset
+        packet.stream = self.streams[stream]
+        self.container.mux(packet)
+        packet.pts, packet.dts, packet.time_base = pts, dts, time_base
+        packet.stream = stream
+        if stream.type == 'video':
+            self.end = max(self.end, (pts + (packet.duration or 1)) * time_base)
+
+    def close(self):
+        self.container.close()
+
+
+class SegmentedRecorder(H264Recorder):
+    '''
+    Continuous recording into files of about `segment_time` seconds
+
+    For loop recording: one encoder runs all along, and a new file is
+    started at the first keyframe after `segment_time` seconds, so each
+    segment plays on its own. Audio packets captured before the cut that
+    arrive after it still go into the previous file, which is closed once
+    the audio has passed the cut: every frame and audio sample lands in
+    exactly one segment. on_segment(path, started, duration) is called from
+    the recording thread for each finished segment, eg: to index it, with
+    its start time as time.time() and its duration in seconds.
+
+    The encoder is shared: with path_format None no segment is written,
+    and segments() turns them on or off while it runs. Listeners added with
+    add_listener() (eg: PreEventRecorder) get every encoded packet, so other
+    recordings of the same stream encode nothing themselves.
+    '''
+
+    CLOSE_DELAY = 1.0 # longest wait for the audio of a cut, seconds
+
+    def __init__(self, frame_buffer, path_format=None, segment_time=300, on_segment=None,
+                 keyframe_interval=1.0, **kwargs):
+        '''
+        :param path_format: time.strftime() format of the segment files,
+                            eg: '/home/pi/Videos/loop/%Y-%m-%d-%H.%M.%S.mp4',
+                            None for no segments
+        :type path_format: str
+        :param segment_time: Segment duration in seconds
+        :type segment_time: float
+        :param on_segment: Called for each finished segment
+        :type on_segment: callable
+        :param keyframe_interval: Seconds between two keyframes, the
+                                  segments are cut on keyframes
+        :type keyframe_interval: float
+
+        The other parameters are those of H264Recorder.
+        '''
+        # the encoders need an output, the segments get the packets
+        H264Recorder.__init__(self, frame_buffer, os.devnull, **kwargs)
+        self.path_format = path_format
+        self.segment_time = segment_time
+        self.on_segment = on_segment
+        self.keyframe_interval = keyframe_interval
+        self.segment = None # PacketFile being written
+        self.closing = None # previous PacketFile, waiting for the audio of the cut
+        self.finished = [] # (path, started, duration) of the closed segments to report
+        self.listeners = []
+
+    def open(self):
+        import av
+        self.av = av
+        self.open_container(self.path, format='mp4')
+        self.video_stream.codec_context.gop_size = max(1, int(round(self.keyframe_interval * self.fps)))
+        # opens the encoders and fills in the stream parameters the files copy
+        self.container.start_encoding()
+        if self.audio_device is not None:
+            self.audio = ArecordAudio(self.on_audio, self.audio_device, self.audio_rate,
+                                      self.audio_channels)
+            self.audio.start()
+
+    def encoder_streams(self):
+        return [s for s in (self.video_stream, self.audio_stream) if s is not None]
+
+    def add_listener(self, listener):
+        '''
+        Pass the encoded packets to `listener`, with the lock held:
+        listener.packet(packet, stream) for each packet of encoder stream
+        `stream` (leave its timing unchanged), listener.source_closed() when
+        the encoder stops, and listener.report() out of the lock, to run its
+        callbacks.
+        '''
+        with self.lock:
+            if listener not in self.listeners:
+                self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self.lock:
+            if listener in self.listeners:
+                self.listeners.remove(listener)
+
+    def segments(self, path_format, segment_time=None, on_segment=None):
+        '''
+        Start writing segments at the next keyframe, or stop with path_format
+        None (the current segment is finished)
+        '''
+        with self.lock:
+            if path_format is None:
+                for segment in (self.closing, self.segment):
+                    if segment is not None:
+                        self.finish(segment)
+                self.closing = self.segment = None
+            self.path_format = path_format
+            if segment_time is not None:
+                self.segment_time = segment_time
+            self.on_segment = on_segment
+        self.report()
+
+    def segment_path(self):
+        path = time.strftime(self.path_format, time.localtime())
+        if self.segment is not None and path == self.segment.path:
+            root, ext = os.path.splitext(path)
+            path = f'{root}-{int(time.time() * 1000) % 1000:03d}{ext}'
+        return path
+
+    def write(self, packets):
+        # the caller holds the lock
+        for packet in packets:
+            for listener in self.listeners:
+                listener.packet(packet, packet.stream)
+            self.write_segment(packet)
+
+    def write_segment(self, packet):
+        stream = packet.stream
+        packet_time = packet.pts * packet.time_base
+        if stream is self.video_stream:
+            if self.closing is not None and packet_time - self.segment.start >= self.CLOSE_DELAY:
+                self.finish(self.closing)
+                self.closing = None
+            if packet.is_keyframe and self.path_format is not None and (
+                    self.segment is None or packet_time - self.segment.start >= self.segment_time):
+                self.roll(packet_time)
+            if self.segment is not None:
+                self.segment.mux(packet, stream)
+        else:
+            if self.closing is not None:
+                if packet_time < self.segment.start:
+                    # captured before the cut
+                    self.closing.mux(packet, stream)
+                    return
+                self.finish(self.closing)
+                self.closing = None
+            if self.segment is not None:
+                self.segment.mux(packet, stream)
+
+    def roll(self, start):
+        if self.closing is not None:
+            self.finish(self.closing)
+            self.closing = None
+        if self.segment is not None:
+            if self.audio_stream is not None:
+                self.closing = self.segment
+            else:
+                self.finish(self.segment)
+        path = self.segment_path()
+        self.segment = PacketFile(self.open_output(path), path, self.encoder_streams(), start)
+
+    def finish(self, segment):
+        segment.close()
+        self.finished.append((segment.path, segment.started, segment.duration, self.on_segment))
+
+    def put(self, img, slot):
+        H264Recorder.put(self, img, slot)
+        self.report()
+
+    def report(self):
+        # callbacks out of the lock
+        with self.lock:
+            finished, self.finished = self.finished, []
+            listeners = list(self.listeners)
+        for path, started, duration, on_segment in finished:
+            self.segment_done(on_segment, path, started, duration)
+        for listener in listeners:
+            listener.report()
+
+    def close_container(self):
+        self.write(self.video_stream.encode(None))
+        if self.audio_stream is not None:
+            self.write(self.audio_stream.encode(None))
+        for segment in (self.closing, self.segment):
+            if segment is not None:
+                self.finish(segment)
+        self.closing = self.segment = None
+        for listener in self.listeners:
+            listener.source_closed()
+        self.container.close()
+        self.container = None
+
+    def close(self):
+        H264Recorder.close(self)
+        self.report()
+
+    @staticmethod
+    def segment_done(on_segment, path, started, duration):
+        if on_segment is None:
+            return
+        try:
+            on_segment(path, started, duration)
+        except Exception as e:
+            print(f"segment callback failed:\n  {e}")
+
+
+class PacketGop(object):
+    '''Encoded packets from one video keyframe to the next'''
+
+    def __init__(self, start):
+        self.start = start # time of the keyframe in seconds
+        self.size = 0
+        self.packets = [] # (packet, source stream)
+
+
+class PreEventRecorder(object):
+    '''
+    Event recording with the seconds before the trigger (pre-roll)
+
+    It has no encoder: it listens to the packets of a running
+    SegmentedRecorder and keeps them in memory for the last `pre_time`
+    seconds, at most `max_bytes`. trigger() opens an event file, writes the
+    buffered packets into it then the live ones, until release(). The event
+    file gets the same packets as the loop segments, its streams are copies
+    of the encoder parameters, so nothing is encoded twice.
+
+    The buffer holds whole GOPs and always starts at a keyframe, so the
+    pre-roll is between pre_time and pre_time + the keyframe interval of the
+    source. on_event(path, started, duration) is called when an event file
+    is closed, like on_segment of SegmentedRecorder.
+    '''
+
+    def __init__(self, source, path_format, pre_time=5, max_bytes=32 * 1024 * 1024,
+                 on_event=None):
+        '''
+        :param source: The running encoder
+        :type source: SegmentedRecorder
+        :param path_format: time.strftime() format of the event files,
+                            eg: '/home/pi/Videos/event-%Y-%m-%d-%H.%M.%S.mp4'
+        :type path_format: str
+        :param pre_time: Seconds of video kept before a trigger
+        :type pre_time: float
+        :param max_bytes: Memory bound of the buffered packets
+        :type max_bytes: int
+        :param on_event: Called for each finished event file
+        :type on_event: callable
+        '''
+        self.source = source
+        self.path_format = path_format
+        self.pre_time = pre_time
+        self.max_bytes = max_bytes
+        self.on_event = on_event
+        self.gops = deque()
+        self.buffered = 0 # bytes in self.gops
+        self.last_time = None # time of the newest video packet
+        self.event = None # PacketFile of the current event
+        self.pending = None # path of an event waiting for the next keyframe
+        self.finished = [] # (path, started, duration) of the closed events to report
+
+    def start(self):
+        self.source.add_listener(self)
+
+    def stop(self):
+        '''Close the event file if any and stop listening to the source'''
+        self.release()
+        self.source.remove_listener(self)
+        with self.source.lock:
+            self.gops.clear()
+            self.buffered = 0
+
+    def packet(self, packet, stream):
+        # the source holds its lock
+        if stream is self.source.video_stream:
+            self.last_time = packet.pts * packet.time_base
+            if packet.is_keyframe:
+                self.gops.append(PacketGop(self.last_time))
+                if self.pending is not None:
+                    self.open_event(self.pending, self.last_time)
+        if self.gops:
+            # packets before the first keyframe can not be decoded, skip them
+            gop = self.gops[-1]
+            gop.packets.append((packet, stream))
+            gop.size += packet.size
+            self.buffered += packet.size
+        if self.event is not None:
+            self.event.mux(packet, stream)
+        self.trim()
+
+    def trim(self):
+        # drop the oldest GOP while the rest is still pre_time long, or too big
+        while len(self.gops) > 1 and (self.buffered > self.max_bytes
+                                      or self.last_time - self.gops[1].start >= self.pre_time):
+            self.buffered -= self.gops.popleft().size
+        if self.buffered > self.max_bytes:
+            # one GOP over the bound, start again at the next keyframe
+            self.gops.clear()
+            self.buffered = 0
+
+    def open_event(self, path, start):
+        self.pending = None
+        self.event = PacketFile(self.source.open_output(path), path,
+                                self.source.encoder_streams(), start)
+        # started is the wall clock of the first buffered frame
+        self.event.started -= float(self.last_time - start)
+
+    def trigger(self, path=None):
+        '''
+        Start an event file with the buffered pre-roll, nothing happens if
+        an event is already recording
+
+        :param path: Event file, .mp4 or .mkv, default from path_format
+        :type path: str
+        :returns: Path of the event file
+        :rtype: str
+        '''
+        with self.source.lock:
+            if self.event is not None:
+                return self.event.path
+            if self.pending is not None:
+                return self.pending
+            if path is None:
+                path = time.strftime(self.path_format, time.localtime())
+            if self.gops:
+                self.open_event(path, self.gops[0].start)
+                for gop in self.gops:
+                    for packet, stream in gop.packets:
+                        self.event.mux(packet, stream)
+            else:
+                # no keyframe yet, starts with the next one
+                self.pending = path
+            return path
+
+    def release(self):
+        '''
+        Close the event file, the source and the buffer keep running
+
+        :returns: (path, duration in seconds) of the event, None if no
+                  event is recording
+        :rtype: tuple
+        '''
+        with self.source.lock:
+            event = self.finish()
+        if event is not None:
+            self.event_done(*event)
+            return event[0], event[2]
+
+    def finish(self):
+        # the caller holds the source lock
+        self.pending = None
+        if self.event is None:
+            return None
+        self.event.close()
+        event, self.event = self.event, None
+        return event.path, event.started, event.duration
+
+    def source_closed(self):
+        # the source holds its lock, the encoders are flushed
+        event = self.finish()
+        if event is not None:
+            self.finished.append(event)
+        self.gops.clear()
+        self.buffered = 0
+
+    def report(self):
+        # callbacks out of the lock
+        with self.source.lock:
+            finished, self.finished = self.finished, []
+        for event in finished:
+            self.event_done(*event)
+
+    def event_done(self, path, started, duration):
+        if self.on_event is None:
+            return
+        try:
+            self.on_event(path, started, duration)
+        except Exception as e:
+            print(f"event callback failed:\n  {e}")
@@ -0,0 +1,234 @@
+import struct
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .frame_buffer import Frame
+
+'''
+Layout of the shared memory block:
+
+    store header | slot 0 header | slot 0 data | slot 1 header | ...
+
+store header: magic, number of slots, slot data size, latest seq. The
+              writer sets the magic to RETIRED when it removes the block,
+              eg: to make a larger one of the same name
+slot header:  seq_begin, seq_end, timestamp, height, width, channels, dtype
+
+A slot is written seqlock style: seq_begin is set before the data and
+seq_end after it, so a reader knows a slot is consistent while
+seq_begin == seq_end == the seq it expects.
+'''
+STORE_HEADER = struct.Struct('<4sIQQ')
+SLOT_HEADER = struct.Struct('<QQdIII8s')
+MAGIC = b'VLFS'
+RETIRED = b'VLFX'
+ALIGN = 64
+
+
+def _aligned(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+class SharedFrameStore(object):
+    '''
+    Latest frames in multiprocessing.shared_memory, for other processes
+
+    The capture process creates the store and put()s every frame into it
+    (one copy into shared memory). Any other process (a recorder, an
+    analytics worker, a second web server) attaches by name and maps the
+    frames as numpy arrays, without pickling or copying:
+
+        store = SharedFrameStore.attach('vilib_frames')
+        frame = store.wait_latest(0, timeout=1)
+        img = frame.img # view into shared memory
+
+    A view stays valid until its slot is reused `slots` frames later, check
+    with is_valid() or read with copy=True when holding frames longer.
+
+    When the writer replaces the block (larger frames), retired is True in
+    the readers of the old one, they attach again to get the new frames.
+    '''
+
+    def __init__(self, name='vilib_frames', slots=3, slot_bytes=640*480*3, create=True, untrack=True):
+        '''
+        :param name: Shared memory name, other processes attach with it
+        :type name: str
+        :param slots: Number of frame slots
+        :type slots: int
+        :param slot_bytes: Largest frame size in bytes
+        :type slot_bytes: int
+        :param create: Create the block (writer) or attach to it (reader)
+        :type create: bool
+        :param untrack: When attaching, stop the resource tracker from
+                        removing the block at exit. False in processes forked
+                        from the writer, which share its tracker
+        :type untrack: bool
+        '''
+        self.name = name
+        self.owner = create
+        if create:
+            if slots < 2:
+                raise ValueError('shared frame store needs at least 2 slots')
+            self.slots = slots
+            self.slot_bytes = _aligned(slot_bytes)
+            size = _aligned(STORE_HEADER.size) + slots * self.slot_stride()
+            try:
+                self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            except FileExistsError:
+                # left over by a crashed writer
+                old = shared_memory.SharedMemory(name=name)
+                old.close()
+                old.unlink()
+                self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            self.buf = self.shm.buf
+            self.buf[:size] = bytes(size)
+            STORE_HEADER.pack_into(self.buf, 0, MAGIC, slots, self.slot_bytes, 0)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            # only the owner may unlink the block, see bpo-39959
+            if untrack:
+                try:
+                    from multiprocessing import resource_tracker
+                    resource_tracker.unregister(self.shm._name, 'shared_memory')
+                except Exception:
+                    pass
+            self.buf = self.shm.buf
+            magic, self.slots, self.slot_bytes, _ = STORE_HEADER.unpack_from(self.buf, 0)
+            if magic != MAGIC:
+                self.close()
+                raise ValueError(f'not a vilib frame store: {name}')
+
+    @classmethod
+    def attach(cls, name='vilib_frames'):
+        '''Attach to the store created by another process'''
+        return cls(name, create=False)
+
+    def slot_stride(self):
+        return _aligned(SLOT_HEADER.size) + self.slot_bytes
+
+    def slot_offset(self, seq):
+        return _aligned(STORE_HEADER.size) + (seq % self.slots) * self.slot_stride()
+
+    @property
+    def retired(self):
+        '''Whether the writer removed this block, no frames come anymore'''
+        return bytes(self.buf[:len(MAGIC)]) == RETIRED
+
+    @property
+    def seq(self):
+        '''Sequence number of the latest frame, 0 before the first one'''
+        return STORE_HEADER.unpack_from(self.buf, 0)[3]
+
+    def put(self, img, timestamp=None, seq=None):
+        '''
+        Copy a frame into the store
+
+        :param img: The frame, at most slot_bytes large
+        :type img: numpy.ndarray
+        :param timestamp: Capture time in time.monotonic() seconds, default now
+        :type timestamp: float
+        :param seq: Sequence number, default the latest plus one. Pass the
+                    FrameRingBuffer seq so that both agree
+        :type seq: int
+        :returns: The sequence number of the frame
+        :rtype: int
+        '''
+        if not self.owner:
+            raise ValueError('shared frame store is read only when attached')
+        if img.nbytes > self.slot_bytes:
+            raise ValueError(f'frame of {img.nbytes} bytes does not fit a {self.slot_bytes} bytes slot')
+        if timestamp is None:
+            timestamp = time.monotonic()
+        if seq is None:
+            seq = self.seq + 1
+        height, width = img.shape[:2]
+        channels = img.shape[2] if img.ndim == 3 else 0
+        dtype = img.dtype.str.encode()
+
+        offset = self.slot_offset(seq)
+        data_offset = offset + _aligned(SLOT_HEADER.size)
+        SLOT_HEADER.pack_into(self.buf, offset, seq, 0, timestamp, height, width, channels, dtype)
+        dst = np.ndarray(img.shape, dtype=img.dtype, buffer=self.buf, offset=data_offset)
+        np.copyto(dst, img)
+        SLOT_HEADER.pack_into(self.buf, offset, seq, seq, timestamp, height, width, channels, dtype)
+        STORE_HEADER.pack_into(self.buf, 0, MAGIC, self.slots, self.slot_bytes, seq)
+        return seq
+
+    def get(self, seq, copy=False):
+        '''
+        :param copy: Return a private copy instead of a view into the store
+        :type copy: bool
+        :returns: The frame with sequence number `seq`, or None if it was
+                  already overwritten or not yet published
+        :rtype: Frame
+        '''
+        if seq <= 0:
+            return None
+        offset = self.slot_offset(seq)
+        begin, end, timestamp, height, width, channels, dtype = SLOT_HEADER.unpack_from(self.buf, offset)
+        if begin != seq or end != seq:
+            return None
+        shape = (height, width, channels) if channels else (height, width)
+        img = np.ndarray(shape, dtype=np.dtype(dtype.rstrip(b'\0').decode()),
+                         buffer=self.buf, offset=offset + _aligned(SLOT_HEADER.size))
+        if copy:
+            img = img.copy()
+            # the writer may have reused the slot during the copy
+            if not self.is_valid(seq):
+                return None
+        else:
+            img.flags.writeable = False
+        return Frame(seq, timestamp, img)
+
+    def latest(self, copy=False):
+        '''
+        :returns: The newest frame, or None if nothing was published yet
+        :rtype: Frame
+        '''
+        return self.get(self.seq, copy)
+
+    def is_valid(self, seq):
+        '''Whether frame `seq` is still held in the store'''
+        if seq <= 0:
+            return False
+        begin, end = SLOT_HEADER.unpack_from(self.buf, self.slot_offset(seq))[:2]
+        return begin == seq and end == seq
+
+    def wait_latest(self, after_seq, timeout=None, poll=0.002, copy=False):
+        '''
+        Get the newest frame once it is newer than `after_seq`. There is no
+        cross-process notification, the header is polled every `poll` seconds.
+
+        :returns: The newest frame, or None on timeout
+        :rtype: Frame
+        '''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if self.seq > after_seq:
+                frame = self.latest(copy)
+                if frame is not None:
+                    return frame
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(poll)
+
+    def close(self):
+        '''Detach, and remove the block when this process created it'''
+        if self.shm is None:
+            return
+        if self.owner:
+            self.buf[:len(RETIRED)] = RETIRED
+        self.buf = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # views handed out are still alive, the mapping goes with them
+            pass
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+        self.shm = None
@@ -0,0 +1,84 @@
+import threading
+import time
+from collections import deque
+
+
+class PipelineStats(object):
+    '''
+    Rolling timing statistics of the pipeline stages
+
+    Each stage keeps its last `window` samples in a ring (O(1) per sample),
+    percentiles are only computed when a snapshot is requested. Stage names
+    are free-form, eg: 'capture', 'detect.face', 'encode.jpg'.
+    '''
+
+    def __init__(self, window=300):
+        '''
+        :param window: Number of samples kept per stage
+        :type window: int
+        '''
+        self.window = window
+        self.samples = {}
+        self.counts = {}
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+
+    def record(self, stage, seconds):
+        '''
+        Record a duration
+
+        :param stage: Stage name
+        :type stage: str
+        :param seconds: Duration in seconds
+        :type seconds: float
+        '''
+        # under the lock: reset() may clear the stages from another thread
+        with self.lock:
+            samples = self.samples.get(stage)
+            if samples is None:
+                samples = self.samples[stage] = deque(maxlen=self.window)
+            samples.append(seconds)
+            self.counts[stage] = self.counts.get(stage, 0) + 1
+
+    def since(self, stage, st):
+        '''Record the time elapsed since time.perf_counter() value `st`, returns now'''
+        now = time.perf_counter()
+        self.record(stage, now - st)
+        return now
+
+    def reset(self):
+        with self.lock:
+            self.samples.clear()
+            self.counts.clear()
+            self.started = time.monotonic()
+
+    @staticmethod
+    def percentile(ordered, p):
+        index = min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def snapshot(self):
+        '''
+        :returns: Per stage: total count, samples in the window, and mean,
+                  p50, p95, p99 and max in milliseconds over the window
+        :rtype: dict
+        '''
+        with self.lock:
+            # copies, the deques are appended to while sorting
+            stages = [(stage, list(samples)) for stage, samples in self.samples.items()]
+            counts = dict(self.counts)
+        result = {}
+        for stage, samples in stages:
+            ordered = sorted(samples)
+            if len(ordered) == 0:
+                continue
+            result[stage] = {
+                'count': counts.get(stage, 0),
+                'window': len(ordered),
+                'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3),
+                'p50_ms': round(self.percentile(ordered, 50) * 1000, 3),
+                'p95_ms': round(self.percentile(ordered, 95) * 1000, 3),
+                'p99_ms': round(self.percentile(ordered, 99) * 1000, 3),
+                'max_ms': round(ordered[-1] * 1000, 3),
+            }
+        return result
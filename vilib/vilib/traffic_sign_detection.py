@@ -63,7 +63,7 @@ def cnt_area(cnt):
     return w*h
 
 
-def traffic_sign_detect(img, model=None, labels=None, border_rgb=(255, 0, 0)):
+def traffic_sign_detect(img, model=None, labels=None, border_rgb=(255, 0, 0), draw=cv2):
     '''
     Traffic sign detection
 
@@ -75,6 +75,8 @@ def traffic_sign_detect(img, model=None, labels=None, border_rgb=(255, 0, 0)):
     :type labels: str
     :param border_rgb: The color (RGB, tuple) of border. Eg: (255, 0, 0).
     :type color_name: tuple
+    :param draw: Where marks go: cv2 draws on img, an Annotations records them
+    :type draw: module or Annotations
     :returns: The image returned after detection
     :rtype: Binary list
     '''
@@ -212,8 +214,8 @@ def traffic_sign_detect(img, model=None, labels=None, border_rgb=(255, 0, 0)):
                                     max_radius = circle[2]
                                     max_circle = circle
                             traffic_sign_coor = (int(x+max_circle[0]),int(y+max_circle[1]))
-                            cv2.circle(img, traffic_sign_coor, int(max_circle[2]), border_bgr, 2)
-                            cv2.putText(img,
+                            draw.circle(img, traffic_sign_coor, int(max_circle[2]), border_bgr, 2)
+                            draw.putText(img,
                                         f"{traffic_type}:{acc_val:.1f}",
                                         (int(x+max_circle[0]-max_circle[2]), int(y+max_circle[1]-max_circle[2]-5)),
                                         cv2.FONT_HERSHEY_SIMPLEX,
@@ -257,8 +259,8 @@ def traffic_sign_detect(img, model=None, labels=None, border_rgb=(255, 0, 0)):
                             corners = len(approx)
                             if corners >= 0:
                                 traffic_sign_coor = (int(x+w/2),int(y+h/2))
-                                cv2.rectangle(img, (x,y), (x+w,y+h), border_bgr, 2)
-                                cv2.putText(img,
+                                draw.rectangle(img, (x,y), (x+w,y+h), border_bgr, 2)
+                                draw.putText(img,
                                             f"{traffic_type}:{acc_val:.1f}",
                                             (x, y-5), 
                                             cv2.FONT_HERSHEY_SIMPLEX,
@@ -10,6 +10,24 @@ def run_command(cmd):
     status = p.poll()
     return status, result
 
+def get_user():
+    '''The user who ran the program, the sudo caller under sudo'''
+    user = os.environ.get('SUDO_USER')
+    if not user:
+        try:
+            user = os.getlogin()
+        except OSError:
+            import getpass
+            user = getpass.getuser()
+    return user
+
+def get_user_home(user):
+    import pwd
+    try:
+        return pwd.getpwnam(user).pw_dir
+    except KeyError:
+        return os.path.expanduser('~')
+
 def getIP():
     wlan0 = os.popen("ifconfig wlan0 |awk '/inet/'|awk 'NR==1 {print $2}'").readline().strip('\n')
     eth0 = os.popen("ifconfig eth0 |awk '/inet/'|awk 'NR==1 {print $2}'").readline().strip('\n')
@@ -1,40 +1,37 @@
 #!/usr/bin/env python3
-
-# whther print welcome message
 import os
-import logging
 
 from .version import __version__
-if 'VILIB_WELCOME' not in os.environ or os.environ['VILIB_WELCOME'] not in [
-        'False', '0'
-]:
-    from pkg_resources import require
-    picamera2_version = require('picamera2')[0].version
-    print(f'vilib {__version__} launching ...')
-    print(f'picamera2 {picamera2_version}')
 
 # set libcamera2 log level
 os.environ['LIBCAMERA_LOG_LEVELS'] = '*:ERROR'
-from picamera2 import Picamera2
-import libcamera
-
 import cv2
 import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 
-from flask import Flask, render_template, Response
-
 import time
 import datetime
 import threading
-from multiprocessing import Process, Manager
+from functools import partial
 
 from .utils import *
+from .frame_buffer import FrameRingBuffer
+from .detector_registry import DetectorRegistry
+from .detector_pool import DetectorPool
+from .detector_process import ProcessDetectorPool, ProcessSpec
+from .annotation import Annotations, composite
+from .stats import PipelineStats
+from .mjpeg import MjpegBroadcaster
+from .jpeg_encoder import OpenCVEncoder
+from .channels import ChannelMux
+from .frame_source import FrameSource, Picamera2Source
+from .shared_frame import SharedFrameStore
+from .recorder import FrameRecorder, H264Recorder, SegmentedRecorder, PreEventRecorder
 
 # user and user home directory
 # =================================================================
-user = os.popen("echo ${SUDO_USER:-$(who -m | awk '{ print $1 }')}").readline().strip()
-user_home = os.popen(f'getent passwd {user} | cut -d: -f 6').readline().strip()
+user = get_user()
+user_home = get_user_home(user)
 # print(f"user: {user}")
 # print(f"user_home: {user_home}")
 
@@ -42,6 +39,26 @@ user_home = os.popen(f'getent passwd {user} | cut -d: -f 6').readline().strip()
 DEFAULLT_PICTURES_PATH = '%s/Pictures/vilib/'%user_home
 DEFAULLT_VIDEOS_PATH = '%s/Videos/vilib/'%user_home
 
+# whther print welcome message
+# =================================================================
+welcome_printed = False
+
+def welcome():
+    '''Print the versions once, on the first camera_start()'''
+    global welcome_printed
+    if welcome_printed:
+        return
+    welcome_printed = True
+    if os.environ.get('VILIB_WELCOME') in ['False', '0']:
+        return
+    from importlib.metadata import version, PackageNotFoundError
+    try:
+        picamera2_version = version('picamera2')
+    except PackageNotFoundError:
+        picamera2_version = None
+    print(f'vilib {__version__} launching ...')
+    print(f'picamera2 {picamera2_version}')
+
 # utils
 # =================================================================
 def findContours(img):
@@ -53,135 +70,20 @@ def findContours(img):
         contours, hierarchy = _tuple
     return contours, hierarchy
 
-# flask
-# =================================================================
-os.environ['FLASK_DEBUG'] = 'development'
-app = Flask(__name__)
-
-log = logging.getLogger('werkzeug')
-log.setLevel(logging.ERROR)
-
-@app.route('/')
-def index():
-    """Video streaming home page."""
-    return render_template('index.html')
-
-def get_frame():
-    return cv2.imencode('.jpg', Vilib.flask_img)[1].tobytes()
-
-def get_qrcode_pictrue():
-    return cv2.imencode('.jpg', Vilib.flask_img)[1].tobytes()
-
-def get_png_frame():
-    return cv2.imencode('.png', Vilib.flask_img)[1].tobytes()
-
-def get_qrcode():
-    while Vilib.qrcode_img_encode is None:
-         time.sleep(0.2)
-
-    return Vilib.qrcode_img_encode
-
-def gen():
-    """Video streaming generator function."""
-    while True:  
-        # start_time = time.time()
-        frame = get_frame()
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-        time.sleep(0.03)
-        # end_time = time.time() - start_time
-        # print('flask fps:%s'%int(1/end_time))
-
-@app.route('/mjpg') ## video
-def video_feed():
-    # from camera import Camera
-    """Video streaming route. Put this in the src attribute of an img tag."""
-    if Vilib.web_display_flag:
-        response = Response(gen(),
-                        mimetype='multipart/x-mixed-replace; boundary=frame') 
-        response.headers.add("Access-Control-Allow-Origin", "*")
-        return response
-    else:
-        tip = '''
-    Please enable web display first:
-        Vilib.display(web=True)
-'''
-        html = f"<html><style>p{{white-space: pre-wrap;}}</style><body><p>{tip}</p></body></html>"
-        return Response(html, mimetype='text/html')
-
-@app.route('/mjpg.jpg')  # jpg
-def video_feed_jpg():
-    # from camera import Camera
-    """Video streaming route. Put this in the src attribute of an img tag."""
-    response = Response(get_frame(), mimetype="image/jpeg")
-    response.headers.add("Access-Control-Allow-Origin", "*")
-    return response
-
-@app.route('/mjpg.png')  # png
-def video_feed_png():
-    # from camera import Camera
-    """Video streaming route. Put this in the src attribute of an img tag."""
-    response = Response(get_png_frame(), mimetype="image/png")
-    response.headers.add("Access-Control-Allow-Origin", "*")
-    return response
-
-@app.route("/qrcode")
-def qrcode_feed():
-    qrcode_html = '''
-<!DOCTYPE html>
-<html>
-<head>
-    <title>QRcode</title>
-    <script>
-        function refreshQRCode() {
-            var imgElement = document.getElementById('qrcode-img');
-            imgElement.src = '/qrcode.png?' + new Date().getTime();  // Add timestamp to avoid caching
-        }
-        var refreshInterval = 500;  // 2s
-
-        window.onload = function() {
-            refreshQRCode(); 
-            setInterval(refreshQRCode, refreshInterval);
-        };
-    </script>
-</head>
-<body>
-    <img id="qrcode-img" src="/qrcode.png" alt="QR Code" />
-</body>
-</html>
-'''
-    return Response(qrcode_html, mimetype='text/html')
-
-
-@app.route("/qrcode.png")
-def qrcode_feed_png():
-    """Video streaming route. Put this in the src attribute of an img tag."""
-    if Vilib.web_qrcode_flag:
-        # response = Response(get_qrcode(),
-        #                 mimetype='multipart/x-mixed-replace; boundary=frame')
-        response = Response(get_qrcode(), mimetype="image/png")
-        response.headers.add("Access-Control-Allow-Origin", "*")
-        return response
-    else:
-        tip = '''
-    Please enable web display first:
-        Vilib.display_qrcode(web=True)
-'''
-        html = f"<html><style>p{{white-space: pre-wrap;}}</style><body><p>{tip}</p></body></html>"
-        return Response(html, mimetype='text/html')
-
 def web_camera_start():
-    try:
-        Vilib.flask_start = True
-        app.run(host='0.0.0.0', port=9000, threaded=True, debug=False)
-    except Exception as e:
-        print(e)
+    # the web server is only imported when the web display starts
+    if Vilib.web_server == 'aiohttp':
+        from . import async_server as server
+    else:
+        from . import web as server
+    server.web_camera_start()
 
 # Vilib
 # =================================================================
 class Vilib(object):
 
-    picam2 = Picamera2()
+    picam2 = None # created on first use, see get_instance()
+    frame_source = None # FrameSource, None for the picamera2 camera
 
     camera_size = (640, 480)
     camera_width = 640
@@ -190,18 +92,31 @@ class Vilib(object):
     camera_hflip = False
     camera_run = False
 
+    analysis_size = None # size of the low resolution analysis image, None to disable
+    analysis_lores = False # whether it comes from the picamera2 lores stream
+    lores_img = None
+
     flask_thread = None
+    web_server = 'flask' # or 'aiohttp' or 'mounted', see display()
     camera_thread = None
     flask_start = False
 
     qrcode_display_thread = None
     qrcode_making_completed = False
-    qrcode_img = Manager().list(range(1))
+    qrcode_img = None
     qrcode_img_encode = None
     qrcode_win_name = 'qrcode'
 
-    img = Manager().list(range(1))
-    flask_img = Manager().list(range(1))
+    img = None
+    flask_img = None
+    frame_buffer = FrameRingBuffer(4)
+    annotated_cache = (0, None)
+    stats = PipelineStats()
+    fps = 0
+    jpeg_encoder = OpenCVEncoder() # see set_jpeg_encoder()
+    mjpeg = MjpegBroadcaster(frame_buffer,
+                             lambda frame, annotate: Vilib.annotated(frame) if annotate else frame.img,
+                             stats, jpeg_encoder)
 
     Windows_Name = "picamera"
     imshow_flag = False
@@ -215,6 +130,8 @@ class Vilib(object):
     fps_color = (255, 255, 255)
 
     detect_obj_parameter = {}
+    detectors = DetectorRegistry(detect_obj_parameter)
+    detectors.stats = stats
     color_detect_color = None
     face_detect_sw = False
     hands_detect_sw = False
@@ -227,48 +144,58 @@ class Vilib(object):
     objects_detection_labels = None
     qrcode_detect_sw = False
     traffic_detect_sw = False
+
+    shared_frames = None # SharedFrameStore, see share_frames_switch()
+    hls = None # HlsStreamer, see hls_switch()
+
+    detect_async = False
+    detect_pool = None
+    detect_process_pool = None
+    process_specs = {} # ProcessSpec of the built-in detectors, see detect_process_switch()
+    detect_results = detectors.latched
+    channels = ChannelMux(mjpeg, detectors, detect_obj_parameter) # the /ws multiplexed WebSocket
         
     @staticmethod
     def get_instance():
+        if Vilib.picam2 is None:
+            from picamera2 import Picamera2
+            Vilib.picam2 = Picamera2()
         return Vilib.picam2
 
     @staticmethod
     def set_controls(controls):
-        Vilib.picam2.set_controls(controls)
+        Vilib.get_instance().set_controls(controls)
 
     @staticmethod
     def get_controls():
-        return Vilib.picam2.capture_metadata()
+        return Vilib.get_instance().capture_metadata()
 
     @staticmethod
     def camera():
         Vilib.camera_width = Vilib.camera_size[0]
         Vilib.camera_height = Vilib.camera_size[1]
 
-        picam2 = Vilib.picam2
-
-        preview_config = picam2.preview_configuration
-        # preview_config.size = (800, 600)
-        preview_config.size = Vilib.camera_size
-        preview_config.format = 'RGB888'  # 'XRGB8888', 'XBGR8888', 'RGB888', 'BGR888', 'YUV420'
-        preview_config.transform = libcamera.Transform(
-                                        hflip=Vilib.camera_hflip,
-                                        vflip=Vilib.camera_vflip
-                                    )
-        preview_config.colour_space = libcamera.ColorSpace.Sycc()
-        preview_config.buffer_count = 4
-        preview_config.queue = True
-        # preview_config.raw = {'size': (2304, 1296)}
-        preview_config.controls = {'FrameRate': 60} # change picam2.capture_array() takes time
+        source = Vilib.frame_source
+        if source is None:
+            source = Picamera2Source(Vilib.get_instance(),
+                                     size=Vilib.camera_size,
+                                     analysis_size=Vilib.analysis_size,
+                                     hflip=Vilib.camera_hflip,
+                                     vflip=Vilib.camera_vflip)
+            Vilib.frame_source = source
 
         try:
-            picam2.start()
+            source.start()
         except Exception as e:
             print(f"\033[38;5;1mError:\033[0m\n{e}")
-            print("\nPlease check whether the camera is connected well" +\
-                "You can use the \"libcamea-hello\" command to test the camera"
-                )
+            if isinstance(source, Picamera2Source):
+                print("\nPlease check whether the camera is connected well" +\
+                    "You can use the \"libcamea-hello\" command to test the camera"
+                    )
             exit(1)
+        if isinstance(source, Picamera2Source):
+            Vilib.picam2 = source.picam2
+        Vilib.analysis_lores = getattr(source, 'analysis_lores', False)
         Vilib.camera_run = True
         Vilib.fps_origin = (Vilib.camera_width-105, 20)
         fps = 0
@@ -278,23 +205,36 @@ class Vilib(object):
             start_time = time.time()
             while True:
                 # ----------- extract image data ----------------
-                # st = time.time()
-                Vilib.img = picam2.capture_array()
-                # print(f'picam2.capture_array(): {time.time() - st:.6f}')
-                # st = time.time()
+                loop_st = st = time.perf_counter()
+                img, lores = source.read()
+                capture_time = time.monotonic()
+                if img is None:
+                    # end of a file or directory source
+                    break
+                Vilib.img = img
+                if img.shape[1] != Vilib.camera_width or img.shape[0] != Vilib.camera_height:
+                    # sources without a fixed size keep their native size
+                    Vilib.camera_size = (img.shape[1], img.shape[0])
+                    Vilib.camera_width, Vilib.camera_height = Vilib.camera_size
+                    Vilib.fps_origin = (Vilib.camera_width-105, 20)
+                if lores is not None:
+                    Vilib.lores_img = lores
+                elif Vilib.analysis_size is not None:
+                    # one resize per frame, shared by all detectors
+                    Vilib.lores_img = cv2.resize(Vilib.img, Vilib.analysis_size,
+                                                 interpolation=cv2.INTER_AREA)
+                st = Vilib.stats.since('capture', st)
 
                 # ----------- image gains and effects ----------------
 
                 # ----------- image detection and recognition ----------------
-                Vilib.img = Vilib.color_detect_func(Vilib.img)
-                Vilib.img = Vilib.face_detect_func(Vilib.img)
-                Vilib.img = Vilib.traffic_detect_fuc(Vilib.img)
-                Vilib.img = Vilib.qrcode_detect_func(Vilib.img)
-
-                Vilib.img = Vilib.image_classify_fuc(Vilib.img)
-                Vilib.img = Vilib.object_detect_fuc(Vilib.img)
-                Vilib.img = Vilib.hands_detect_fuc(Vilib.img)
-                Vilib.img = Vilib.pose_detect_fuc(Vilib.img)
+                # in async mode the detectors run in Vilib.detect_pool instead
+                if not Vilib.detect_async:
+                    Vilib.img = Vilib.detectors.run_due(Vilib.img,
+                                                        Vilib.frame_buffer.seq + 1,
+                                                        capture_time,
+                                                        lores=Vilib.lores_img)
+                    st = Vilib.stats.since('detect', st)
 
                 # ----------- calculate fps and draw fps ----------------
                 # calculate fps
@@ -304,14 +244,15 @@ class Vilib(object):
                     fps = round(framecount/elapsed_time, 1)
                     framecount = 0
                     start_time = time.time()
+                    Vilib.fps = fps
 
-                # print(f"elapsed_time: {elapsed_time}, fps: {fps}")
-
-                # draw fps
+                # ----------- detection marks and fps ----------------
+                # kept as metadata of the frame, drawn only by the outputs that want them
+                meta = Vilib.detectors.annotations()
                 if Vilib.draw_fps:
-                    cv2.putText(
-                            # img, # image
-                            Vilib.img,
+                    fps_marks = Annotations()
+                    fps_marks.putText(
+                            None, # img, recorded only
                             f"FPS: {fps}", # text
                             Vilib.fps_origin, # origin
                             cv2.FONT_HERSHEY_SIMPLEX, # font
@@ -320,11 +261,28 @@ class Vilib(object):
                             1, # thickness
                             cv2.LINE_AA, # line_type: LINE_8 (default), LINE_4, LINE_AA
                         )
+                    meta['fps'] = fps_marks
+                st = Vilib.stats.since('fps', st)
 
                 # ---- copy img for flask --- 
-                # st = time.time()
                 Vilib.flask_img = Vilib.img
-                # print(f'vilib.flask_img: {time.time() - st:.6f}')
+                seq = Vilib.frame_buffer.put(Vilib.img, capture_time, Vilib.lores_img, meta)
+                st = Vilib.stats.since('publish', st)
+                shared_frames = Vilib.shared_frames
+                if shared_frames is not None:
+                    try:
+                        if Vilib.img.nbytes > shared_frames.slot_bytes:
+                            # sized before the camera started or the resolution changed
+                            print(f"share frames: resize the slots to {Vilib.img.shape}")
+                            Vilib.share_frames_switch(True, shared_frames.name, shared_frames.slots,
+                                                      slot_bytes=Vilib.img.nbytes)
+                            shared_frames = Vilib.shared_frames
+                        shared_frames.put(Vilib.img, capture_time, seq)
+                    except Exception as e:
+                        if shared_frames is Vilib.shared_frames:
+                            print(f"share frames failed, stop sharing:\n  {e}")
+                            Vilib.share_frames_switch(False)
+                    st = Vilib.stats.since('share', st)
 
                 # ----------- display on desktop ----------------
                 if Vilib.imshow_flag == True:
@@ -337,13 +295,14 @@ class Vilib(object):
                         except:
                             pass
 
-                        cv2.imshow(Vilib.Windows_Name, Vilib.img)
+                        cv2.imshow(Vilib.Windows_Name, Vilib.annotated(Vilib.frame_buffer.latest()))
 
                         if Vilib.imshow_qrcode_flag and Vilib.qrcode_making_completed:
                                 Vilib.qrcode_making_completed = False
                                 cv2.imshow(Vilib.qrcode_win_name, Vilib.qrcode_img)
 
                         cv2.waitKey(1)
+                        st = Vilib.stats.since('display', st)
 
                     except Exception as e:
                         Vilib.imshow_flag = False
@@ -354,24 +313,104 @@ class Vilib(object):
                 if Vilib.camera_run == False:
                     break
 
-                # print(f'loop end: {time.time() - st:.6f}')
+                Vilib.stats.since('frame', loop_st)
                 
         except KeyboardInterrupt as e:
             print(e)
         finally:
-            picam2.close()
+            Vilib.camera_run = False
+            source.close()
             cv2.destroyAllWindows()
 
     @staticmethod
-    def camera_start(vflip=False, hflip=False, size=None):
+    def latest_frame():
+        '''
+        :returns: The newest frame (seq, timestamp, img) without copying, or None
+        :rtype: Frame
+        '''
+        return Vilib.frame_buffer.latest()
+
+    @staticmethod
+    def annotated(frame):
+        '''
+        Composite the detection marks (and fps) of a frame onto a copy of its
+        image. The result is cached for the latest frame, so all outputs that
+        show marks share one composite, and frame.img stays unmarked.
+
+        :param frame: The frame
+        :type frame: Frame
+        :returns: The marked image, or frame.img when there are no marks
+        :rtype: numpy.ndarray
+        '''
+        seq, img = Vilib.annotated_cache
+        if seq == frame.seq and img is not None:
+            return img
+        st = time.perf_counter()
+        img = composite(frame.img, (frame.meta or {}).values())
+        Vilib.stats.since('annotate', st)
+        Vilib.annotated_cache = (frame.seq, img)
+        return img
+
+    @staticmethod
+    def output_img(annotate=True):
+        '''
+        :param annotate: Whether to draw detection marks and fps
+        :type annotate: bool
+        :returns: The latest image for an output
+        :rtype: numpy.ndarray
+        '''
+        frame = Vilib.frame_buffer.latest()
+        if frame is None:
+            # no frame yet
+            return np.zeros((Vilib.camera_height, Vilib.camera_width, 3), np.uint8)
+        if annotate:
+            return Vilib.annotated(frame)
+        return frame.img
+
+    @staticmethod
+    def next_frame(after_seq=0, timeout=None):
+        '''
+        Wait for the frame after sequence number `after_seq` (without copying)
+
+        :param after_seq: Sequence number of the last frame the caller consumed
+        :type after_seq: int
+        :param timeout: Seconds to wait, None waits forever
+        :type timeout: float
+        :returns: The next frame, or None on timeout
+        :rtype: Frame
+        '''
+        return Vilib.frame_buffer.get_next(after_seq, timeout)
+
+    @staticmethod
+    def camera_start(vflip=False, hflip=False, size=None, analysis_size=None, source=None):
+        '''
+        :param size: Main stream size, for display and recording, eg: (1920, 1080)
+        :type size: tuple
+        :param analysis_size: Size of the low resolution analysis image the
+                              detectors run on, eg: (320, 240). None runs the
+                              detectors on the main stream.
+        :type analysis_size: tuple
+        :param source: Frame source, eg: VideoFileSource('test.mp4') to run
+                       the pipeline without a camera. None for the picamera2
+                       camera, configured with vflip, hflip and size.
+        :type source: FrameSource
+        '''
+        welcome()
+        if source is not None:
+            if source.size is not None:
+                size = source.size
+            if analysis_size is None:
+                analysis_size = source.analysis_size
+        Vilib.frame_source = source
         if size is not None:
             Vilib.camera_size = size
+        Vilib.analysis_size = analysis_size
         Vilib.camera_hflip = hflip
         Vilib.camera_vflip = vflip
         Vilib.camera_thread = threading.Thread(target=Vilib.camera, name="vilib")
         Vilib.camera_thread.daemon = False
         Vilib.camera_thread.start()
-        while not Vilib.camera_run:
+        while not Vilib.camera_run and Vilib.camera_thread.is_alive():
             time.sleep(0.1)
 
     @staticmethod
@@ -381,7 +420,20 @@ class Vilib(object):
             time.sleep(0.1)
 
     @staticmethod
-    def display(local=True, web=True):
+    def display(local=True, web=True, server=None):
+        '''
+        :param local: Show the frames in a desktop window
+        :type local: bool
+        :param web: Stream the frames on port 9000
+        :type web: bool
+        :param server: Web server, 'flask' (default) or 'aiohttp' for the
+                       asyncio server, lighter with many viewers, or
+                       'mounted' when the application serves the routes
+                       itself (see vilib.web.blueprint), no server is started
+        :type server: str
+        '''
+        if server is not None:
+            Vilib.web_server = server
         # cheack camera thread is_alive
         if Vilib.camera_thread != None and Vilib.camera_thread.is_alive():
             # check gui
@@ -395,6 +447,8 @@ class Vilib(object):
             # web video
             if web == True:
                 Vilib.web_display_flag = True
+                if Vilib.web_server == 'mounted':
+                    return
                 print("\nWeb display on:")
                 wlan0, eth0 = getIP()
                 if wlan0 != None:
@@ -465,62 +519,484 @@ class Vilib(object):
     rec_video_set["fps"] = 30.0
     rec_video_set["framesize"] = (640, 480)
     rec_video_set["isColor"] = True
+    rec_video_set["annotate"] = False # whether to record detection marks and fps
 
     rec_video_set["name"] = "default"
     rec_video_set["path"] = DEFAULLT_VIDEOS_PATH
 
+    # 'avi': fourcc above with OpenCV, 'mp4' or 'mkv': H.264 encoded in-process
+    # with PyAV, audio from the ALSA device rec_video_set["audio"] if not None
+    rec_video_set["container"] = "avi"
+    rec_video_set["codec"] = "libx264"
+    rec_video_set["bitrate"] = "4M"
+    rec_video_set["audio"] = None
+    rec_video_set["audio_rate"] = 44100
+    rec_video_set["audio_channels"] = 1
+    rec_video_set["audio_gain"] = 1.0
+
     rec_video_set["start_flag"] = False
     rec_video_set["stop_flag"] =  False
 
     rec_thread = None
-
-    @staticmethod
-    def rec_video_work():
-        if not os.path.exists(Vilib.rec_video_set["path"]):
-            # print('Path does not exist. Creating path now ... ')
-            os.makedirs(name=Vilib.rec_video_set["path"],
-                        mode=0o751,
-                        exist_ok=True
-            )
-            time.sleep(0.01)
-        video_out = cv2.VideoWriter(Vilib.rec_video_set["path"]+'/'+Vilib.rec_video_set["name"]+'.avi',
-                                    Vilib.rec_video_set["fourcc"], Vilib.rec_video_set["fps"], 
-                                    Vilib.rec_video_set["framesize"], Vilib.rec_video_set["isColor"])
-    
-        while True:
-            if Vilib.rec_video_set["start_flag"] == True:
-                # video_out.write(Vilib.img_array[0])
-                video_out.write(Vilib.img)
-            if Vilib.rec_video_set["stop_flag"] == True:
-                video_out.release() # note need to release the video writer
-                Vilib.rec_video_set["start_flag"] == False
-                break
+    recorder = None # FrameRecorder, see rec_video_run()
 
     @staticmethod
     def rec_video_run():
-        if Vilib.rec_thread != None:
+        '''
+        Open the video file rec_video_set["path"]/rec_video_set["name"] with
+        the extension of rec_video_set["container"], paused, record with
+        rec_video_start(). Each captured frame is written once, timed by its
+        capture timestamp at rec_video_set["fps"], see FrameRecorder and
+        H264Recorder.
+        '''
+        if Vilib.recorder != None:
             Vilib.rec_video_stop()
         Vilib.rec_video_set["stop_flag"] = False
-        Vilib.rec_thread = threading.Thread(name='rec_video', target=Vilib.rec_video_work)
-        Vilib.rec_thread.daemon = True
-        Vilib.rec_thread.start()
+        rec = Vilib.rec_video_set
+        path = os.path.join(rec["path"], rec["name"] + '.' + rec["container"])
+        render = Vilib.annotated if rec["annotate"] else None
+        if rec["container"] == 'avi':
+            Vilib.recorder = FrameRecorder(Vilib.frame_buffer, path, rec["fourcc"],
+                                           fps=rec["fps"], size=rec["framesize"],
+                                           is_color=rec["isColor"], render=render,
+                                           stats=Vilib.stats)
+        else:
+            Vilib.recorder = H264Recorder(Vilib.frame_buffer, path, fps=rec["fps"],
+                                          size=rec["framesize"], render=render,
+                                          stats=Vilib.stats, codec=rec["codec"],
+                                          bitrate=rec["bitrate"], audio_device=rec["audio"],
+                                          audio_rate=rec["audio_rate"],
+                                          audio_channels=rec["audio_channels"],
+                                          audio_gain=rec["audio_gain"])
+        Vilib.recorder.start(paused=not rec["start_flag"])
+        Vilib.rec_thread = Vilib.recorder.thread
 
     @staticmethod
     def rec_video_start():
         Vilib.rec_video_set["start_flag"] = True 
         Vilib.rec_video_set["stop_flag"] = False
+        if Vilib.recorder != None:
+            Vilib.recorder.resume()
 
     @staticmethod
     def rec_video_pause():
         Vilib.rec_video_set["start_flag"] = False
+        if Vilib.recorder != None:
+            Vilib.recorder.pause()
 
     @staticmethod
     def rec_video_stop():
-        Vilib.rec_video_set["start_flag"] == False
+        Vilib.rec_video_set["start_flag"] = False
         Vilib.rec_video_set["stop_flag"] = True
-        if Vilib.rec_thread != None:
-            Vilib.rec_thread.join(3)
-            Vilib.rec_thread = None
+        if Vilib.recorder != None:
+            Vilib.recorder.stop()
+            Vilib.recorder = None
+        Vilib.rec_thread = None
+
+    # live encoder
+    # =================================================================
+    live_encoder = None # SegmentedRecorder, see live_encoder_switch()
+
+    @staticmethod
+    def live_encoder_switch(flag=False, fps=30, size=None, bitrate='4M', codec='libx264',
+                            audio=None, audio_rate=44100, audio_channels=1, audio_gain=1.0,
+                            keyframe_interval=1.0, annotate=False):
+        '''
+        One H.264 (and AAC) encode of the camera, next to (and independent
+        of) rec_video_run(), shared by loop_rec_switch() and
+        event_rec_switch(): they only write its packets to files. The audio
+        device is open while the encoder runs. Stopping it stops them.
+
+        :param flag: True to start, False to stop
+        :type flag: bool
+        :param fps: Recording frame rate
+        :type fps: float
+        :param size: Recording size, default the camera size
+        :type size: tuple
+        :param bitrate: Target bitrate, eg: '4M'
+        :type bitrate: str
+        :param audio: ALSA capture device, eg: 'plughw:1,0', None for no audio
+        :type audio: str
+        :param keyframe_interval: Seconds between two keyframes, where the
+                                  segments and the pre-roll start
+        :type keyframe_interval: float
+        :param annotate: Whether to draw detection marks and fps
+        :type annotate: bool
+        '''
+        if Vilib.live_encoder is not None:
+            Vilib.event_rec_switch(False)
+            Vilib.loop_rec_switch(False)
+            Vilib.live_encoder.stop()
+            Vilib.live_encoder = None
+        if flag:
+            if size is None:
+                size = (Vilib.camera_width, Vilib.camera_height)
+            encoder = SegmentedRecorder(
+                Vilib.frame_buffer, keyframe_interval=keyframe_interval, fps=fps, size=size,
+                render=Vilib.annotated if annotate else None, stats=Vilib.stats, codec=codec,
+                bitrate=bitrate, audio_device=audio, audio_rate=audio_rate,
+                audio_channels=audio_channels, audio_gain=audio_gain)
+            encoder.start()
+            Vilib.live_encoder = encoder
+
+    # loop recording
+    # =================================================================
+    loop_recorder = None # the live encoder while it writes segments, see loop_rec_switch()
+
+    @staticmethod
+    def loop_rec_switch(flag=False, path=None, segment_time=300, on_segment=None):
+        '''
+        Continuous recording of the live encoder into mp4 segments of
+        segment_time seconds. The archive retention is up to the caller, with
+        the on_segment callback, see SegmentedRecorder.
+
+        :param flag: True to start, False to stop
+        :type flag: bool
+        :param path: time.strftime() format of the segment files,
+                     default DEFAULLT_VIDEOS_PATH/loop/%Y-%m-%d-%H.%M.%S.mp4
+        :type path: str
+        :param segment_time: Segment duration in seconds
+        :type segment_time: float
+        :param on_segment: Called with (path, started, duration) of each finished segment
+        :type on_segment: callable
+        '''
+        if Vilib.loop_recorder is not None:
+            Vilib.loop_recorder.segments(None)
+            Vilib.loop_recorder = None
+        if flag:
+            if Vilib.live_encoder is None:
+                raise ValueError('loop recording needs the live encoder, see live_encoder_switch()')
+            if path is None:
+                path = os.path.join(DEFAULLT_VIDEOS_PATH, 'loop', '%Y-%m-%d-%H.%M.%S.mp4')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            Vilib.live_encoder.segments(path, segment_time, on_segment)
+            Vilib.loop_recorder = Vilib.live_encoder
+
+    # pre-event recording
+    # =================================================================
+    event_recorder = None # PreEventRecorder, see event_rec_switch()
+
+    @staticmethod
+    def event_rec_switch(flag=False, path=None, pre_time=5, max_mb=32, on_event=None):
+        '''
+        Keep the last pre_time seconds of the live encoder packets in memory,
+        so that event_rec_start() records from before the trigger, see
+        PreEventRecorder. Nothing is encoded for it.
+
+        :param flag: True to start, False to stop
+        :type flag: bool
+        :param path: time.strftime() format of the event files,
+                     default DEFAULLT_VIDEOS_PATH/event-%Y-%m-%d-%H.%M.%S.mp4
+        :type path: str
+        :param pre_time: Seconds kept before a trigger
+        :type pre_time: float
+        :param max_mb: Memory bound of the buffer, MB
+        :type max_mb: float
+        :param on_event: Called with (path, started, duration) of each finished event file
+        :type on_event: callable
+        '''
+        if Vilib.event_recorder is not None:
+            Vilib.event_recorder.stop()
+            Vilib.event_recorder = None
+        if flag:
+            if Vilib.live_encoder is None:
+                raise ValueError('event recording needs the live encoder, see live_encoder_switch()')
+            if path is None:
+                path = os.path.join(DEFAULLT_VIDEOS_PATH, 'event-%Y-%m-%d-%H.%M.%S.mp4')
+            recorder = PreEventRecorder(
+                Vilib.live_encoder, path, pre_time=pre_time, max_bytes=int(max_mb * 1024 * 1024),
+                on_event=on_event)
+            recorder.start()
+            Vilib.event_recorder = recorder
+
+    @staticmethod
+    def event_rec_start(path=None):
+        '''
+        Start an event file with the buffered seconds before now
+
+        :param path: Event file, default from the path format of event_rec_switch()
+        :type path: str
+        :returns: Path of the event file, None when event_rec_switch() is off
+        :rtype: str
+        '''
+        if Vilib.event_recorder is None:
+            return None
+        return Vilib.event_recorder.trigger(path)
+
+    @staticmethod
+    def event_rec_stop():
+        '''
+        :returns: (path, duration) of the finished event file, None if none
+        :rtype: tuple
+        '''
+        if Vilib.event_recorder is None:
+            return None
+        return Vilib.event_recorder.release()
+
+    # asynchronous detection
+    # =================================================================
+    @staticmethod
+    def detect_async_switch(flag=False, workers=2):
+        '''
+        Run the detectors in a pool of worker threads on the latest frame,
+        so that capture, streaming and recording keep the sensor frame rate.
+        The rate budgets of the detectors still apply. The results are latched
+        in Vilib.detect_obj_parameter as usual, and Vilib.detect_results[name]
+        records the seq and timestamp of the frame each result came from.
+        Outputs showing detection marks get the latest marks of each detector.
+
+        :param flag: True to enable, False to run detectors in the capture loop
+        :type flag: bool
+        :param workers: Number of worker threads
+        :type workers: int
+        '''
+        if Vilib.detect_pool is not None:
+            Vilib.detect_pool.stop()
+            Vilib.detect_pool = None
+        Vilib.detect_async = flag
+        if flag:
+            Vilib.detect_pool = DetectorPool(Vilib.frame_buffer,
+                                             Vilib.detectors,
+                                             workers=workers)
+            Vilib.detect_pool.start()
+
+    @staticmethod
+    def detect_process_switch(flag=False, detectors=None):
+        '''
+        Run heavy detectors in dedicated worker processes, one per detector,
+        so that their Python level work does not compete with the capture
+        loop for the GIL. The workers read the frames from shared memory
+        (share_frames_switch() is turned on) and send back the marks and
+        results. Set the models (eg: image_classify_set_model()) before.
+
+        :param flag: True to enable, False to run them in this process again
+        :type flag: bool
+        :param detectors: Names of built-in detectors, or a dict of
+                          {name: ProcessSpec} for registered detectors,
+                          default the enabled built-in detectors that can
+                          run in a worker (image_classify, objects, hands,
+                          pose), so turn them on before
+        :type detectors: list or dict
+        '''
+        if Vilib.detect_process_pool is not None:
+            Vilib.detect_process_pool.stop()
+            Vilib.detect_process_pool = None
+        if flag:
+            if detectors is None:
+                # only import the models of the detectors in use
+                detectors = [name for name in Vilib.process_specs
+                             if Vilib.detectors.get(name).enabled]
+                if not detectors:
+                    print("detect process: no enabled detector to run in a worker")
+                    return
+            if isinstance(detectors, dict):
+                specs = dict(detectors)
+            else:
+                specs = {name: Vilib.process_specs[name]() for name in detectors}
+            if Vilib.shared_frames is None:
+                Vilib.share_frames_switch(True)
+            pool = ProcessDetectorPool(Vilib.frame_buffer, Vilib.shared_frames, Vilib.detectors,
+                                       specs, analysis_size=Vilib.analysis_size)
+            # start() stops the workers it started when one fails
+            pool.start()
+            Vilib.detect_process_pool = pool
+
+    @staticmethod
+    def process_detector_setup(name, switch, attrs):
+        '''Set up a built-in detector in its worker process'''
+        Vilib.detectors.configure(name, process=False)
+        for attr, value in attrs.items():
+            setattr(Vilib, attr, value)
+        getattr(Vilib, switch)(True)
+
+    # jpeg encoder
+    # =================================================================
+    @staticmethod
+    def set_jpeg_encoder(backend='auto'):
+        '''
+        Select the JPEG encoder of the web streams, snapshots and QR code
+        images, see vilib.jpeg_encoder
+
+        :param backend: 'opencv', 'simplejpeg', 'turbojpeg', or 'auto' to
+                        benchmark the installed backends at the camera
+                        resolution and keep the fastest
+        :type backend: str
+        :returns: The name of the selected backend
+        :rtype: str
+        '''
+        from . import jpeg_encoder
+        if backend == 'auto':
+            # a real frame when the camera runs, compression speed depends on content
+            frame = Vilib.latest_frame()
+            encoder = jpeg_encoder.fastest((Vilib.camera_width, Vilib.camera_height),
+                                           img=frame.img if frame is not None else None)
+        else:
+            encoder = jpeg_encoder.create(backend)
+        Vilib.jpeg_encoder = encoder
+        Vilib.mjpeg.encoder = encoder
+        return encoder.name
+
+    # hls live stream
+    # =================================================================
+    @staticmethod
+    def hls_switch(flag=False, fps=15, size=None, path=None, bitrate='2M', annotate=False):
+        '''
+        Live H.264 HLS stream of the camera, from one libx264 encode (ffmpeg).
+        The playlist is Vilib.hls.playlist, segments are kept in tmpfs.
+
+        :param flag: True to start, False to stop
+        :type flag: bool
+        :param fps: Stream frame rate
+        :type fps: int
+        :param size: Stream size, default the camera size
+        :type size: tuple
+        :param path: Directory of the playlist and segments, default /dev/shm/vilib_hls
+        :type path: str
+        :param bitrate: Target bitrate, eg: '2M'
+        :type bitrate: str
+        :param annotate: Whether to draw detection marks and fps
+        :type annotate: bool
+        '''
+        if Vilib.hls is not None:
+            Vilib.hls.stop()
+            Vilib.hls = None
+        if flag:
+            from .hls import HlsStreamer
+            if size is None:
+                size = (Vilib.camera_width, Vilib.camera_height)
+            Vilib.hls = HlsStreamer(Vilib.frame_buffer, size, fps=fps, path=path,
+                                    bitrate=bitrate,
+                                    render=Vilib.annotated if annotate else None,
+                                    stats=Vilib.stats)
+            Vilib.hls.start()
+
+    # shared memory frames
+    # =================================================================
+    @staticmethod
+    def share_frames_switch(flag=False, name='vilib_frames', slots=3, slot_bytes=None):
+        '''
+        Publish the camera frames in shared memory, so that other processes
+        can map them without pickling or copying:
+
+            from vilib.shared_frame import SharedFrameStore
+            store = SharedFrameStore.attach('vilib_frames')
+            frame = store.wait_latest(0)
+
+        :param flag: True to enable, False to disable
+        :type flag: bool
+        :param name: Shared memory name
+        :type name: str
+        :param slots: Number of frames held
+        :type slots: int
+        :param slot_bytes: Slot size, default a frame of the camera size. The
+                           capture loop makes the slots larger (a new block
+                           of the same name, the readers attach again) when
+                           a frame does not fit
+        :type slot_bytes: int
+        '''
+        store = Vilib.shared_frames
+        Vilib.shared_frames = None
+        if store is not None:
+            store.close()
+        if flag:
+            if slot_bytes is None:
+                slot_bytes = Vilib.camera_width * Vilib.camera_height * 3
+            Vilib.shared_frames = SharedFrameStore(name, slots=slots, slot_bytes=slot_bytes)
+            # remove the shared memory block at exit
+            import atexit
+            atexit.unregister(Vilib.share_frames_switch)
+            atexit.register(Vilib.share_frames_switch, False)
+
+    # detector registry
+    # =================================================================
+    @staticmethod
+    def register_detector(name, func, rate=None, skip=1, size=None, priority=0,
+                          params=None, prefix='', keys=None, annotate=False):
+        '''
+        Register a detector run on every camera frame within its budget
+
+        :param name: Detector name
+        :type name: str
+        :param func: func(img) runs the detection on img and may draw on it.
+                     It returns the image (or None). With annotate=True it is
+                     called as func(img, draw) and records its marks in draw
+                     (an Annotations, see annotation.py) instead
+        :type func: callable
+        :param rate: Target runs per second, eg: 2. None for every frame
+        :type rate: float
+        :param skip: Run on every `skip`-th frame
+        :type skip: int
+        :param size: Input resolution (width, height), None for the analysis
+                     image or the full frame. Without annotate, drawings on a
+                     reduced input are lost, see DetectorRegistry
+        :type size: tuple
+        :param priority: Higher priority detectors run first
+        :type priority: int
+        :param params: Result dict of the detector, published into
+                       Vilib.detect_obj_parameter as prefix + key for `keys`
+        :type params: dict
+        '''
+        Vilib.detectors.register(name, func, rate=rate, skip=skip, size=size,
+                                 priority=priority, params=params,
+                                 prefix=prefix, keys=keys, annotate=annotate)
+
+    @staticmethod
+    def unregister_detector(name):
+        Vilib.detectors.unregister(name)
+
+    @staticmethod
+    def enable_detector(name, flag=True):
+        '''
+        Enable or disable a registered detector. Built-in detectors
+        (color, face, traffic_sign, qrcode, image_classify, objects, hands,
+        pose) are switched through their *_switch functions.
+        '''
+        switches = {
+            'color': lambda flag: Vilib.color_detect(Vilib.color_detect_color or 'red') \
+                if flag else Vilib.close_color_detection(),
+            'face': Vilib.face_detect_switch,
+            'traffic_sign': Vilib.traffic_detect_switch,
+            'qrcode': Vilib.qrcode_detect_switch,
+            'image_classify': Vilib.image_classify_switch,
+            'objects': Vilib.object_detect_switch,
+            'hands': Vilib.hands_detect_switch,
+            'pose': Vilib.pose_detect_switch,
+        }
+        if name in switches:
+            switches[name](flag)
+        else:
+            Vilib.detectors.enable(name, flag)
+
+    @staticmethod
+    def set_detector_budget(name, rate=None, skip=None, size=None, priority=None):
+        '''
+        Change the budget of a registered detector, eg:
+            Vilib.set_detector_budget('traffic_sign', rate=2)
+
+        :param rate: Target runs per second, 0 for every frame
+        :type rate: float
+        :param skip: Run on every `skip`-th frame
+        :type skip: int
+        :param size: Input resolution (width, height), () for the full frame
+        :type size: tuple
+        :param priority: Higher priority detectors run first
+        :type priority: int
+        '''
+        kwargs = {}
+        if rate is not None:
+            kwargs['rate'] = rate or None
+        if skip is not None:
+            kwargs['skip'] = skip
+        if size is not None:
+            kwargs['size'] = size or None
+        if priority is not None:
+            kwargs['priority'] = priority
+        Vilib.detectors.configure(name, **kwargs)
+
+    @staticmethod
+    def is_analysis_img(img):
+        '''Whether img is no larger than the analysis image, so needs no further reduction'''
+        return Vilib.analysis_size is not None and img.shape[1] <= Vilib.analysis_size[0]
 
    # color detection
     # =================================================================
@@ -533,28 +1009,23 @@ class Vilib(object):
         from .color_detection import color_detect_work, color_obj_parameter
         Vilib.color_detect_work = color_detect_work
         Vilib.color_obj_parameter = color_obj_parameter
-        Vilib.detect_obj_parameter['color_x'] = Vilib.color_obj_parameter['x']
-        Vilib.detect_obj_parameter['color_y'] = Vilib.color_obj_parameter['y']
-        Vilib.detect_obj_parameter['color_w'] = Vilib.color_obj_parameter['w']
-        Vilib.detect_obj_parameter['color_h'] = Vilib.color_obj_parameter['h']
-        Vilib.detect_obj_parameter['color_n'] = Vilib.color_obj_parameter['n']
+        Vilib.detectors.configure('color', params=color_obj_parameter, enabled=(color != 'close'))
+        Vilib.detectors.publish(Vilib.detectors.get('color'))
 
     @staticmethod
-    def color_detect_func(img):
+    def color_detect_func(img, draw=cv2):
         if Vilib.color_detect_color is not None \
             and Vilib.color_detect_color != 'close' \
             and hasattr(Vilib, "color_detect_work"):
-            img = Vilib.color_detect_work(img, Vilib.camera_width, Vilib.camera_height, Vilib.color_detect_color)
-            Vilib.detect_obj_parameter['color_x'] = Vilib.color_obj_parameter['x']
-            Vilib.detect_obj_parameter['color_y'] = Vilib.color_obj_parameter['y']
-            Vilib.detect_obj_parameter['color_w'] = Vilib.color_obj_parameter['w']
-            Vilib.detect_obj_parameter['color_h'] = Vilib.color_obj_parameter['h']
-            Vilib.detect_obj_parameter['color_n'] = Vilib.color_obj_parameter['n']
+            height, width = img.shape[:2]
+            zoom = 1 if Vilib.is_analysis_img(img) else 4
+            img = Vilib.color_detect_work(img, width, height, Vilib.color_detect_color, zoom=zoom, draw=draw)
         return img
 
     @staticmethod
     def close_color_detection():
         Vilib.color_detect_color = None
+        Vilib.detectors.enable('color', False)
 
   # face detection
     # =================================================================
@@ -566,21 +1037,16 @@ class Vilib(object):
             Vilib.face_detect_work = face_detect
             Vilib.set_face_detection_model = set_face_detection_model
             Vilib.face_obj_parameter = face_obj_parameter
-            Vilib.detect_obj_parameter['human_x'] = Vilib.face_obj_parameter['x']
-            Vilib.detect_obj_parameter['human_y'] = Vilib.face_obj_parameter['y']
-            Vilib.detect_obj_parameter['human_w'] = Vilib.face_obj_parameter['w']
-            Vilib.detect_obj_parameter['human_h'] = Vilib.face_obj_parameter['h']
-            Vilib.detect_obj_parameter['human_n'] = Vilib.face_obj_parameter['n']
+            Vilib.detectors.configure('face', params=face_obj_parameter)
+            Vilib.detectors.publish(Vilib.detectors.get('face'))
+        Vilib.detectors.enable('face', flag)
 
     @staticmethod
-    def face_detect_func(img):
+    def face_detect_func(img, draw=cv2):
         if Vilib.face_detect_sw and hasattr(Vilib, "face_detect_work"):
-            img = Vilib.face_detect_work(img, Vilib.camera_width, Vilib.camera_height)
-            Vilib.detect_obj_parameter['human_x'] = Vilib.face_obj_parameter['x']
-            Vilib.detect_obj_parameter['human_y'] = Vilib.face_obj_parameter['y']
-            Vilib.detect_obj_parameter['human_w'] = Vilib.face_obj_parameter['w']
-            Vilib.detect_obj_parameter['human_h'] = Vilib.face_obj_parameter['h']
-            Vilib.detect_obj_parameter['human_n'] = Vilib.face_obj_parameter['n']
+            height, width = img.shape[:2]
+            zoom = 1 if Vilib.is_analysis_img(img) else 2
+            img = Vilib.face_detect_work(img, width, height, zoom=zoom, draw=draw)
         return img
 
    # traffic sign detection
@@ -592,23 +1058,14 @@ class Vilib(object):
             from .traffic_sign_detection import traffic_sign_detect, traffic_sign_obj_parameter
             Vilib.traffic_detect_work = traffic_sign_detect
             Vilib.traffic_sign_obj_parameter = traffic_sign_obj_parameter
-            Vilib.detect_obj_parameter['traffic_sign_x'] = Vilib.traffic_sign_obj_parameter['x']
-            Vilib.detect_obj_parameter['traffic_sign_y'] = Vilib.traffic_sign_obj_parameter['y']
-            Vilib.detect_obj_parameter['traffic_sign_w'] = Vilib.traffic_sign_obj_parameter['w']
-            Vilib.detect_obj_parameter['traffic_sign_h'] = Vilib.traffic_sign_obj_parameter['h']
-            Vilib.detect_obj_parameter['traffic_sign_t'] = Vilib.traffic_sign_obj_parameter['t']
-            Vilib.detect_obj_parameter['traffic_sign_acc'] = Vilib.traffic_sign_obj_parameter['acc']
+            Vilib.detectors.configure('traffic_sign', params=traffic_sign_obj_parameter)
+            Vilib.detectors.publish(Vilib.detectors.get('traffic_sign'))
+        Vilib.detectors.enable('traffic_sign', flag)
 
     @staticmethod
-    def traffic_detect_fuc(img):
+    def traffic_detect_fuc(img, draw=cv2):
         if Vilib.traffic_detect_sw and hasattr(Vilib, "traffic_detect_work"):
-            img = Vilib.traffic_detect_work(img, border_rgb=(255, 0, 0))
-            Vilib.detect_obj_parameter['traffic_sign_x'] = Vilib.traffic_sign_obj_parameter['x']
-            Vilib.detect_obj_parameter['traffic_sign_y'] = Vilib.traffic_sign_obj_parameter['y']
-            Vilib.detect_obj_parameter['traffic_sign_w'] = Vilib.traffic_sign_obj_parameter['w']
-            Vilib.detect_obj_parameter['traffic_sign_h'] = Vilib.traffic_sign_obj_parameter['h']
-            Vilib.detect_obj_parameter['traffic_sign_t'] = Vilib.traffic_sign_obj_parameter['t']
-            Vilib.detect_obj_parameter['traffic_sign_acc'] = Vilib.traffic_sign_obj_parameter['acc']
+            img = Vilib.traffic_detect_work(img, border_rgb=(255, 0, 0), draw=draw)
         return img
 
     # qrcode recognition
@@ -620,22 +1077,14 @@ class Vilib(object):
             from .qrcode_recognition import qrcode_recognize, qrcode_obj_parameter
             Vilib.qrcode_recognize = qrcode_recognize
             Vilib.qrcode_obj_parameter = qrcode_obj_parameter
-            Vilib.detect_obj_parameter['qr_x'] = Vilib.qrcode_obj_parameter['x']
-            Vilib.detect_obj_parameter['qr_y'] = Vilib.qrcode_obj_parameter['y']
-            Vilib.detect_obj_parameter['qr_w'] = Vilib.qrcode_obj_parameter['w']
-            Vilib.detect_obj_parameter['qr_h'] = Vilib.qrcode_obj_parameter['h']
-            Vilib.detect_obj_parameter['qr_data'] = Vilib.qrcode_obj_parameter['data']
-            Vilib.detect_obj_parameter['qr_list'] = Vilib.qrcode_obj_parameter['list']
+            Vilib.detectors.configure('qrcode', params=qrcode_obj_parameter)
+            Vilib.detectors.publish(Vilib.detectors.get('qrcode'))
+        Vilib.detectors.enable('qrcode', flag)
 
     @staticmethod
-    def qrcode_detect_func(img):
+    def qrcode_detect_func(img, draw=cv2):
         if Vilib.qrcode_detect_sw and hasattr(Vilib, "qrcode_recognize"):
-            img = Vilib.qrcode_recognize(img, border_rgb=(255, 0, 0))
-            Vilib.detect_obj_parameter['qr_x'] = Vilib.qrcode_obj_parameter['x']
-            Vilib.detect_obj_parameter['qr_y'] = Vilib.qrcode_obj_parameter['y']
-            Vilib.detect_obj_parameter['qr_w'] = Vilib.qrcode_obj_parameter['w']
-            Vilib.detect_obj_parameter['qr_h'] = Vilib.qrcode_obj_parameter['h']
-            Vilib.detect_obj_parameter['qr_data'] = Vilib.qrcode_obj_parameter['data']
+            img = Vilib.qrcode_recognize(img, border_rgb=(255, 0, 0), draw=draw)
         return img
 
     # qrcode making
@@ -668,7 +1117,7 @@ class Vilib(object):
         Vilib.qrcode_making_completed = True
 
         if Vilib.web_qrcode_flag:
-            Vilib.qrcode_img_encode = cv2.imencode('.jpg', Vilib.qrcode_img)[1].tobytes()
+            Vilib.qrcode_img_encode = Vilib.jpeg_encoder.encode(Vilib.qrcode_img)
 
 
 
@@ -683,7 +1132,7 @@ class Vilib(object):
             if Vilib.imshow_qrcode_flag and Vilib.qrcode_making_completed :
                     Vilib.qrcode_making_completed = False
                     try:
-                        if len(Vilib.qrcode_img) > 10:
+                        if Vilib.qrcode_img is not None and len(Vilib.qrcode_img) > 10:
                             cv2.imshow(Vilib.qrcode_win_name, Vilib.qrcode_img)
                             cv2.waitKey(1)
                             if cv2.getWindowProperty(Vilib.qrcode_win_name, cv2.WND_PROP_VISIBLE) == 0:
@@ -707,6 +1156,7 @@ class Vilib(object):
         # web video
         if web == True:
             Vilib.web_qrcode_flag = True
+        if web == True and Vilib.web_server != 'mounted':
             print(f'QRcode display on:')
             wlan0, eth0 = getIP()
             if wlan0 != None:
@@ -735,6 +1185,7 @@ class Vilib(object):
         from .image_classification import image_classification_obj_parameter
         Vilib.image_classify_sw = flag
         Vilib.image_classification_obj_parameter = image_classification_obj_parameter
+        Vilib.detectors.enable('image_classify', flag)
 
     @staticmethod
     def image_classify_set_model(path):
@@ -749,13 +1200,14 @@ class Vilib(object):
         Vilib.image_classification_labels = path
 
     @staticmethod
-    def image_classify_fuc(img):
+    def image_classify_fuc(img, draw=cv2):
         if Vilib.image_classify_sw == True:
             # print('classify_image starting')
             from .image_classification import classify_image
             img = classify_image(image=img,
                                 model=Vilib.image_classification_model,
-                                labels=Vilib.image_classification_labels)   
+                                labels=Vilib.image_classification_labels,
+                                draw=draw)
         return img
 
     # objects detection
@@ -766,6 +1218,7 @@ class Vilib(object):
         if Vilib.objects_detect_sw == True:
             from .objects_detection import object_detection_list_parameter
             Vilib.object_detection_list_parameter = object_detection_list_parameter
+        Vilib.detectors.enable('objects', flag)
 
     @staticmethod
     def object_detect_set_model(path):
@@ -780,39 +1233,87 @@ class Vilib(object):
         Vilib.objects_detection_labels = path
 
     @staticmethod
-    def object_detect_fuc(img):
+    def object_detect_fuc(img, draw=cv2):
         if Vilib.objects_detect_sw == True:
             # print('detect_objects starting')
             from .objects_detection import detect_objects
+            height, width = img.shape[:2]
             img = detect_objects(image=img,
                                 model=Vilib.objects_detection_model,
-                                labels=Vilib.objects_detection_labels)   
+                                labels=Vilib.objects_detection_labels,
+                                width=width,
+                                height=height,
+                                draw=draw)
         return img
 
     # hands detection
     # =================================================================
     @staticmethod
     def hands_detect_switch(flag=False):
-        from .hands_detection import DetectHands
-        Vilib.detect_hands = DetectHands()
+        if not Vilib.detectors.get('hands').process:
+            from .hands_detection import DetectHands
+            Vilib.detect_hands = DetectHands()
         Vilib.hands_detect_sw = flag
+        Vilib.detectors.enable('hands', flag)
 
     @staticmethod
-    def hands_detect_fuc(img):
+    def hands_detect_fuc(img, draw=cv2):
         if Vilib.hands_detect_sw == True:
-            img, Vilib.detect_obj_parameter['hands_joints'] = Vilib.detect_hands.work(image=img)   
+            annotations = None if draw is cv2 else draw
+            img, Vilib.detect_obj_parameter['hands_joints'] = Vilib.detect_hands.work(image=img, annotations=annotations)
         return img
 
     # pose detection
     # =================================================================
     @staticmethod
     def pose_detect_switch(flag=False):
-        from .pose_detection import DetectPose
-        Vilib.pose_detect = DetectPose()
+        if not Vilib.detectors.get('pose').process:
+            from .pose_detection import DetectPose
+            Vilib.pose_detect = DetectPose()
         Vilib.pose_detect_sw = flag
+        Vilib.detectors.enable('pose', flag)
 
     @staticmethod
-    def pose_detect_fuc(img):
+    def pose_detect_fuc(img, draw=cv2):
         if Vilib.pose_detect_sw == True and hasattr(Vilib, "pose_detect"):
-            img, Vilib.detect_obj_parameter['body_joints'] = Vilib.pose_detect.work(image=img)   
+            annotations = None if draw is cv2 else draw
+            img, Vilib.detect_obj_parameter['body_joints'] = Vilib.pose_detect.work(image=img, annotations=annotations)
         return img
+
+
+# built-in detectors, disabled until switched on, marks kept as annotations
+# =================================================================
+Vilib.detectors.register('color', Vilib.color_detect_func, enabled=False, annotate=True,
+                         prefix='color_', keys=['x', 'y', 'w', 'h', 'n'])
+Vilib.detectors.register('face', Vilib.face_detect_func, enabled=False, annotate=True,
+                         prefix='human_', keys=['x', 'y', 'w', 'h', 'n'])
+Vilib.detectors.register('traffic_sign', Vilib.traffic_detect_fuc, enabled=False, annotate=True,
+                         prefix='traffic_sign_', keys=['x', 'y', 'w', 'h', 't', 'acc'])
+Vilib.detectors.register('qrcode', Vilib.qrcode_detect_func, enabled=False, annotate=True,
+                         prefix='qr_', keys=['x', 'y', 'w', 'h', 'data', 'list'])
+Vilib.detectors.register('image_classify', Vilib.image_classify_fuc, enabled=False, annotate=True)
+Vilib.detectors.register('objects', Vilib.object_detect_fuc, enabled=False, annotate=True)
+Vilib.detectors.register('hands', Vilib.hands_detect_fuc, enabled=False, annotate=True)
+Vilib.detectors.register('pose', Vilib.pose_detect_fuc, enabled=False, annotate=True)
+
+# built-in detectors run in worker processes by detect_process_switch(),
+# built when the workers start so that the model paths are current
+# =================================================================
+def _process_spec(name, switch, func, attrs=(), shared=()):
+    return lambda: ProcessSpec(func,
+                               partial(Vilib.process_detector_setup, name, switch,
+                                       {attr: getattr(Vilib, attr) for attr in attrs}),
+                               shared)
+
+Vilib.process_specs = {
+    'image_classify': _process_spec('image_classify', 'image_classify_switch', Vilib.image_classify_fuc,
+                                    attrs=('image_classification_model', 'image_classification_labels'),
+                                    shared=[(__package__ + '.image_classification', 'image_classification_obj_parameter')]),
+    'objects': _process_spec('objects', 'object_detect_switch', Vilib.object_detect_fuc,
+                             attrs=('objects_detection_model', 'objects_detection_labels'),
+                             shared=[(__package__ + '.objects_detection', 'object_detection_list_parameter')]),
+    'hands': _process_spec('hands', 'hands_detect_switch', Vilib.hands_detect_fuc,
+                           shared=[(__name__, 'Vilib.detect_obj_parameter')]),
+    'pose': _process_spec('pose', 'pose_detect_switch', Vilib.pose_detect_fuc,
+                          shared=[(__name__, 'Vilib.detect_obj_parameter')]),
+}
@@ -0,0 +1,249 @@
+import os
+import time
+import logging
+
+import cv2
+from flask import Flask, Blueprint, render_template, Response, request, jsonify
+
+from .vilib import Vilib
+from .mjpeg import Variant
+from .adaptive import AdaptiveStream, socket_queued
+
+# flask
+# =================================================================
+'''
+The streaming routes are a blueprint, so that a Flask application can serve
+them next to its own pages instead of a second server on port 9000:
+
+    from vilib import Vilib, web
+    app.register_blueprint(web.blueprint, url_prefix='/vilib')
+    Vilib.display(local=False, web=True, server='mounted')
+
+The live stream is then /vilib/mjpg on the port of the application.
+'''
+blueprint = Blueprint('vilib', __name__)
+
+app = Flask(__name__)
+
+log = logging.getLogger('werkzeug')
+log.setLevel(logging.ERROR)
+
+@blueprint.route('/')
+def index():
+    """Video streaming home page."""
+    return render_template('index.html')
+
+def get_frame(variant=Variant()):
+    # encoded once per frame and variant, shared by all viewers
+    encoded = Vilib.mjpeg.get(variant)
+    if encoded is None:
+        # no frame yet
+        img = Vilib.output_img(variant.annotate)
+        if variant.fmt == 'jpg':
+            return Vilib.jpeg_encoder.encode(img, variant.quality)
+        return cv2.imencode('.' + variant.fmt, img)[1].tobytes()
+    return encoded.data
+
+def get_qrcode_pictrue():
+    return Vilib.jpeg_encoder.encode(Vilib.flask_img)
+
+def get_png_frame(variant=Variant('png')):
+    return get_frame(variant)
+
+def variant_arg(fmt='jpg'):
+    '''
+    The stream variant a request asks for, eg: ?w=640&q=60 for 640 pixels
+    wide at JPEG quality 60, plus ?annotate=0
+    '''
+    return Vilib.mjpeg.variant_args(request.args, fmt, Vilib.camera_width)[0]
+
+def fps_arg():
+    '''Frame rate cap a stream request asks for, eg: ?fps=10. None for no cap'''
+    return Vilib.mjpeg.variant_args(request.args)[1]
+
+def get_qrcode():
+    while Vilib.qrcode_img_encode is None:
+         time.sleep(0.2)
+
+    return Vilib.qrcode_img_encode
+
+def adaptive_arg(variant, fps):
+    '''Rate control a stream request asks for with ?adapt=1, or None'''
+    return AdaptiveStream.from_args(request.args, variant, fps, Vilib.camera_width)
+
+def gen(variant=Variant(), fps=None, adaptive=None, sock=None):
+    """Video streaming generator function."""
+    if adaptive is not None:
+        variant, fps = adaptive.variant, adaptive.fps
+    Vilib.mjpeg.subscribe(variant)
+    last_seq = 0
+    try:
+        while True:  
+            # block until a new frame is encoded, never send a frame twice.
+            # a slow client gets the newest frame, skipping what it missed
+            encoded = Vilib.mjpeg.wait(variant, last_seq, timeout=1)
+            if encoded is None:
+                continue
+            last_seq = encoded.seq
+            send_time = time.monotonic()
+            yield (b'--frame\r\n'
+                   b'Content-Type: image/jpeg\r\n\r\n' + encoded.data + b'\r\n')
+            # resumed once the frame was written to the socket
+            if adaptive is not None and adaptive.sent(len(encoded.data), time.monotonic() - send_time,
+                                                      socket_queued(sock)):
+                Vilib.mjpeg.unsubscribe(variant)
+                variant, fps = adaptive.variant, adaptive.fps
+                Vilib.mjpeg.subscribe(variant)
+            if fps is not None:
+                # frame rate cap of the client, frames in between are skipped
+                time.sleep(max(0, send_time + 1.0 / fps - time.monotonic()))
+    finally:
+        # client disconnected
+        Vilib.mjpeg.unsubscribe(variant)
+
+@blueprint.route('/mjpg') ## video
+def video_feed():
+    # from camera import Camera
+    """Video streaming route. Put this in the src attribute of an img tag."""
+    if Vilib.web_display_flag:
+        variant, fps = variant_arg(), fps_arg()
+        response = Response(gen(variant, fps, adaptive_arg(variant, fps),
+                                request.environ.get('werkzeug.socket')),
+                        mimetype='multipart/x-mixed-replace; boundary=frame') 
+        response.headers.add("Access-Control-Allow-Origin", "*")
+        return response
+    else:
+        tip = '''
+    Please enable web display first:
+        Vilib.display(web=True)
+'''
+        html = f"<html><style>p{{white-space: pre-wrap;}}</style><body><p>{tip}</p></body></html>"
+        return Response(html, mimetype='text/html')
+
+def snapshot_response(variant, mimetype):
+    '''
+    Snapshot of the latest frame, cached per frame and variant. Clients
+    polling with If-None-Match get a 304 until a new frame is captured.
+    '''
+    etag, data = Vilib.mjpeg.snapshot(variant, request.headers.get('If-None-Match'))
+    if etag is None:
+        # no frame yet
+        response = Response(get_frame(variant), mimetype=mimetype)
+    elif data is None:
+        response = Response(status=304)
+    else:
+        response = Response(data, mimetype=mimetype)
+    if etag is not None:
+        response.set_etag(etag)
+    # may be stored, but must be revalidated: the next frame is a few ms away
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers.add("Access-Control-Allow-Origin", "*")
+    return response
+
+@blueprint.route('/mjpg.jpg')  # jpg
+def video_feed_jpg():
+    # from camera import Camera
+    """Video streaming route. Put this in the src attribute of an img tag."""
+    return snapshot_response(variant_arg(), "image/jpeg")
+
+@blueprint.route('/mjpg.png')  # png
+def video_feed_png():
+    # from camera import Camera
+    """Video streaming route. Put this in the src attribute of an img tag."""
+    return snapshot_response(variant_arg('png'), "image/png")
+
+@blueprint.route("/qrcode")
+def qrcode_feed():
+    qrcode_html = '''
+<!DOCTYPE html>
+<html>
+<head>
+    <title>QRcode</title>
+    <script>
+        function refreshQRCode() {
+            var imgElement = document.getElementById('qrcode-img');
+            imgElement.src = 'qrcode.png?' + new Date().getTime();  // Add timestamp to avoid caching
+        }
+        var refreshInterval = 500;  // 2s
+
+        window.onload = function() {
+            refreshQRCode(); 
+            setInterval(refreshQRCode, refreshInterval);
+        };
+    </script>
+</head>
+<body>
+    <img id="qrcode-img" src="qrcode.png" alt="QR Code" />
+</body>
+</html>
+'''
+    return Response(qrcode_html, mimetype='text/html')
+
+
+@blueprint.route("/qrcode.png")
+def qrcode_feed_png():
+    """Video streaming route. Put this in the src attribute of an img tag."""
+    if Vilib.web_qrcode_flag:
+        # response = Response(get_qrcode(),
+        #                 mimetype='multipart/x-mixed-replace; boundary=frame')
+        response = Response(get_qrcode(), mimetype="image/png")
+        response.headers.add("Access-Control-Allow-Origin", "*")
+        return response
+    else:
+        tip = '''
+    Please enable web display first:
+        Vilib.display_qrcode(web=True)
+'''
+        html = f"<html><style>p{{white-space: pre-wrap;}}</style><body><p>{tip}</p></body></html>"
+        return Response(html, mimetype='text/html')
+
+@blueprint.route('/stats')
+def stats_feed():
+    """Rolling p50/p95/p99 timings of the pipeline stages, in milliseconds"""
+    detect_results = {}
+    for name, result in list(Vilib.detect_results.items()):
+        detect_results[name] = {
+            'seq': result['seq'],
+            'elapsed_ms': round(result['elapsed'] * 1000, 3),
+        }
+    response = jsonify(
+        fps=Vilib.fps,
+        seq=Vilib.frame_buffer.seq,
+        uptime=round(time.monotonic() - Vilib.stats.started, 1),
+        stages=Vilib.stats.snapshot(),
+        detectors=detect_results,
+    )
+    response.headers.add("Access-Control-Allow-Origin", "*")
+    return response
+
+@blueprint.route('/ws', websocket=True)
+def channels_feed():
+    """
+    Frames, detection results and telemetry over one binary WebSocket,
+    see vilib.channels. Needs simple-websocket:
+
+        pip3 install simple-websocket
+    """
+    import simple_websocket
+    ws = simple_websocket.Server.accept(request.environ)
+    try:
+        Vilib.channels.serve(ws, frame_width=Vilib.camera_width)
+    except simple_websocket.ConnectionClosed:
+        pass
+    try:
+        ws.close()
+    except simple_websocket.ConnectionClosed:
+        pass
+    return ''
+
+app.register_blueprint(blueprint)
+
+def web_camera_start():
+    try:
+        Vilib.flask_start = True
+        # only for the standalone server, not an application mounting the blueprint
+        os.environ['FLASK_DEBUG'] = 'development'
+        app.run(host='0.0.0.0', port=9000, threaded=True, debug=False)
+    except Exception as e:
+        print(e)
+